@@ -0,0 +1,119 @@
+from django.conf import settings
+
+from .caching import get_cache, versioned_key
+from .models import SimpleTrialBalance
+
+try:
+    import numpy as np
+except ImportError: # numpy jest opcjonalne - bez niego endpoint analityki zwraca 501, reszta aplikacji działa
+    np = None
+
+
+# Statystyki trial balance liczone wektorowo: kolumny liczbowe trafiają z values_list prosto do tablic NumPy
+# (bez tworzenia instancji modelu), a tablice są trzymane w cache pod wersją danych, więc wczytujemy je ponownie
+# dopiero po kolejnym zapisie kont.
+
+COLUMNS = ['account_number', 'opening_balance', 'activity', 'closing_balance']
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+class AnalyticsUnavailable(Exception):
+    pass
+
+
+def load_arrays():
+    '''
+    Zwraca słownik {kolumna: tablica int64} plus 'account_name' (tablica obiektów), z cache dla bieżącej wersji danych.
+    '''
+    if np is None:
+        raise AnalyticsUnavailable("NumPy is not installed.")
+    cache = get_cache()
+    key = versioned_key('analytics_arrays')
+    arrays = cache.get(key)
+    if arrays is None:
+        rows = SimpleTrialBalance.objects.order_by('account_number').values_list(*COLUMNS, 'account_name')
+        names = []
+
+        def numeric_rows():
+            # jedno przejście po kursorze: liczby idą prosto do tablicy, nazwy (potrzebne tylko w wynikach) do listy
+            for *numbers, name in rows.iterator(chunk_size=settings.TRIAL_BALANCE_EXPORT_CHUNK_SIZE):
+                names.append(name)
+                yield numbers
+
+        numeric = np.fromiter(numeric_rows(), dtype=np.dtype((np.int64, len(COLUMNS)))).reshape(-1, len(COLUMNS))
+        arrays = {column: numeric[:, index].copy() for index, column in enumerate(COLUMNS)}
+        arrays['account_name'] = np.array(names, dtype=object)
+        cache.set(key, arrays, timeout=settings.TRIAL_BALANCE_CACHE_TIMEOUT)
+    return arrays
+
+
+def distribution(values):
+    if not len(values):
+        return {'count': 0}
+    return {
+        'count': int(values.size),
+        'sum': int(values.sum()),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': int(values.min()),
+        'max': int(values.max()),
+        'percentiles': {str(p): float(value) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+        'negative': int((values < 0).sum()),
+        'zero': int((values == 0).sum()),
+    }
+
+
+def top_movers(arrays, top=10):
+    # konta z największą (co do wartości bezwzględnej) activity; argpartition zamiast sortowania całej tablicy
+    activity = arrays['activity']
+    top = min(top, activity.size)
+    if not top:
+        return []
+    magnitude = np.abs(activity)
+    indexes = np.argpartition(-magnitude, top - 1)[:top]
+    indexes = indexes[np.lexsort((arrays['account_number'][indexes], -magnitude[indexes]))]
+    return [
+        {'account_number': int(arrays['account_number'][i]), 'account_name': arrays['account_name'][i], 'activity': int(activity[i])}
+        for i in indexes
+    ]
+
+
+def concentration(values, top=10):
+    # udział największych kont w sumie wartości bezwzględnych sald i indeks Herfindahla-Hirschmana (0-1)
+    magnitude = np.abs(values)
+    total = magnitude.sum()
+    if not total:
+        return {'top_share': 0.0, 'herfindahl': 0.0}
+    shares = magnitude / total
+    top = min(top, shares.size)
+    return {
+        'top_share': float(np.sort(shares)[::-1][:top].sum()),
+        'herfindahl': float(np.square(shares).sum()),
+    }
+
+
+def sign_anomalies(arrays, prefixes=None):
+    # konta aktywów (numer zaczyna się od prefiksu z settings.ANALYTICS_ASSET_PREFIXES) z ujemnym saldem końcowym
+    prefixes = tuple(prefixes if prefixes is not None else settings.ANALYTICS_ASSET_PREFIXES)
+    closing = arrays['closing_balance']
+    if not prefixes or not closing.size:
+        return []
+    numbers = arrays['account_number'].astype(str)
+    mask = np.char.startswith(numbers, prefixes[0])
+    for prefix in prefixes[1:]:
+        mask |= np.char.startswith(numbers, prefix)
+    mask &= closing < 0
+    return [
+        {'account_number': int(arrays['account_number'][i]), 'account_name': arrays['account_name'][i], 'closing_balance': int(closing[i])}
+        for i in np.flatnonzero(mask)
+    ]
+
+
+def trial_balance_analytics(top=10):
+    arrays = load_arrays()
+    return {
+        'distribution': {column: distribution(arrays[column]) for column in COLUMNS[1:]},
+        'top_movers': top_movers(arrays, top),
+        'concentration': concentration(arrays['closing_balance'], top),
+        'sign_anomalies': sign_anomalies(arrays),
+    }
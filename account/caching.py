@@ -0,0 +1,138 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .tenancy import scope_cache_key
+
+
+# Wersja danych trial balance - licznik w cache podbijany przy każdym zapisie kont (account/signals.py).
+# Wersja jest częścią klucza wszystkich zapamiętanych fragmentów, więc po zmianie danych stare wpisy po prostu
+# przestają być używane i wygasają same, bez szukania i kasowania ich po kolei.
+# Wersja i data ostatniej zmiany są wspólne dla procesów tylko wtedy, gdy wspólny jest cache settings.TRIAL_BALANCE_CACHE.
+# Przy LocMemCache (osobny dla każdego procesu) zapis w jednym workerze nie zmienia wersji w pozostałych - te dalej oddają
+# stare fragmenty i odpowiadają 304. LocMemCache nadaje się więc tylko do pracy w jednym procesie (runserver, testy),
+# przy kilku workerach trzeba wskazać cache wspólny (plikowy, memcached, redis) - ostrzega o tym `manage.py check --deploy`.
+
+VERSION_KEY = 'trial_balance:version'
+MODIFIED_KEY = 'trial_balance:modified'
+
+
+def get_cache():
+    return caches[settings.TRIAL_BALANCE_CACHE]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES[settings.TRIAL_BALANCE_CACHE]['BACKEND']
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        f"Cache '{settings.TRIAL_BALANCE_CACHE}' (TRIAL_BALANCE_CACHE) uses LocMemCache, which is separate for every process.",
+        hint='With more than one worker a write in one process does not invalidate cached pages, ETags and Last-Modified '
+             'in the others. Use a cache shared by all processes (file-based, memcached or redis).',
+        id='account.W001',
+    )]
+
+
+def get_data_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # pusty cache (restart, wyczyszczenie) - zaczynamy od znacznika czasu, żeby nie trafić w wersję sprzed restartu
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_last_modified():
+    cache = get_cache()
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        # nie wiemy kiedy była ostatnia zmiana (pusty cache) - bezpiecznie przyjmujemy "teraz"
+        cache.add(MODIFIED_KEY, datetime.now(timezone.utc), timeout=None)
+        modified = cache.get(MODIFIED_KEY)
+    return modified
+
+
+def _incr_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY, datetime.now(timezone.utc), timeout=None)
+
+
+def bump_data_version():
+    # podbijamy od razu i jeszcze raz po commicie - strona wyrenderowana przez inny request pomiędzy zapisem
+    # a commitem (ze starymi danymi) trafi pod wersję, która po commicie przestaje obowiązywać
+    _incr_version()
+    transaction.on_commit(_incr_version)
+
+
+def read_database():
+    # baza, z której czyta bieżący request - replika może być starsza niż wersja danych, więc strony wyrenderowane z repliki
+    # nie mogą trafić pod ten sam klucz i ETag co strony z bazy głównej (import tutaj - routing importuje ten moduł)
+    from .routing import read_alias
+    return read_alias.get() or DEFAULT_DB_ALIAS
+
+
+def versioned_key(name, params=None):
+    # fragmenty są zapamiętywane osobno dla każdej jednostki (zakresu z account/tenancy.py) i bazy, z której były czytane
+    digest = ''
+    if params is not None:
+        digest = hashlib.md5(repr(sorted(params.lists())).encode()).hexdigest()
+    return f'trial_balance:{name}:{scope_cache_key()}:{read_database()}:{get_data_version()}:{digest}'
+
+
+def cached_fragment(name, params, render):
+    # render() jest wywoływane tylko gdy fragmentu dla tej wersji danych i parametrów nie ma jeszcze w cache
+    cache = get_cache()
+    key = versioned_key(name, params)
+    value = cache.get(key)
+    if value is None:
+        value = render()
+        cache.set(key, value, timeout=settings.TRIAL_BALANCE_CACHE_TIMEOUT)
+    return value
+
+
+async def acached_fragment(name, params, render):
+    # wersja dla widoków async - render to funkcja async (zapytania przez async ORM)
+    cache = get_cache()
+    key = await sync_to_async(versioned_key)(name, params)
+    value = await cache.aget(key)
+    if value is None:
+        value = await render()
+        await cache.aset(key, value, timeout=settings.TRIAL_BALANCE_CACHE_TIMEOUT)
+    return value
+
+
+# Warunkowy GET (ETag / Last-Modified) - liczone tylko z wersji danych w cache i z samego requestu, bez zapytań do bazy.
+# Strona zależy też od zalogowanego użytkownika i tokenu CSRF, więc do ETag dokładamy ciasteczka sesji i CSRF
+# (same ciasteczka, bez odczytu sesji z bazy) oraz bazę, z której strona była czytana (replika albo baza główna).
+
+def data_etag(request, *args, **kwargs):
+    if 'action' in request.GET: # przekierowanie z dropdownu - bez warunkowego GET
+        return None
+    parts = [
+        get_data_version(),
+        read_database(),
+        request.get_full_path(),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def data_last_modified(request, *args, **kwargs):
+    if 'action' in request.GET:
+        return None
+    if read_database() != DEFAULT_DB_ALIAS: # data ostatniego zapisu w bazie głównej nie mówi, jak stara jest replika
+        return None
+    return get_last_modified()
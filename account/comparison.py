@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+from django.db import connection, connections, router
+
+from .models import AccountingPeriod, PeriodBalance, SimpleTrialBalance, SnapshotBalance, TrialBalanceSnapshot
+from .tenancy import entity_sql
+
+
+# Porównanie dwóch zestawień bieżącej jednostki (okres, migawka albo bieżąca tabela) po account_number - jedno zapytanie SQL:
+# UNION ALL obu stron + GROUP BY account_number działa jak FULL OUTER JOIN i korzysta z indeksów (okres/migawka, jednostka, account_number).
+# Wynik jest czytany kursorem porcjami, więc duże zestawienia nie są ładowane do pamięci.
+
+ComparisonSource = namedtuple('ComparisonSource', ['key', 'label', 'model', 'owner_field', 'owner_pk'])
+ComparisonRow = namedtuple(
+    'ComparisonRow', ['account_number', 'account_name', 'base_balance', 'compared_balance', 'variance', 'percent_change', 'status']
+)
+
+CURRENT_KEY = 'current'
+
+# sortowanie -> ORDER BY; account_number na końcu, żeby kolejność była jednoznaczna
+ORDERINGS = {
+    'account_number': 'account_number',
+    '-abs_variance': 'ABS(variance) DESC, account_number',
+    'abs_variance': 'ABS(variance), account_number',
+    '-variance': 'variance DESC, account_number',
+    'variance': 'variance, account_number',
+}
+
+
+def comparison_sources():
+    # dostępne strony porównania: bieżąca tabela, zamknięte okresy (od najnowszego) i migawki (od najnowszej)
+    sources = [ComparisonSource(CURRENT_KEY, 'Current trial balance', SimpleTrialBalance, None, None)]
+    for period in AccountingPeriod.objects.filter(closed_at__isnull=False).order_by('-start_date'):
+        sources.append(ComparisonSource(f'period:{period.pk}', f'Period {period.name}', PeriodBalance, 'period', period.pk))
+    for snapshot in TrialBalanceSnapshot.objects.order_by('-taken_at', '-id'):
+        sources.append(ComparisonSource(f'snapshot:{snapshot.pk}', f'Snapshot {snapshot}', SnapshotBalance, 'snapshot', snapshot.pk))
+    return sources
+
+
+def _side_sql(side, source):
+    quote = connection.ops.quote_name
+    entity, entity_params = entity_sql() # podzapytanie o jednostkę użytkownika - bez osobnego zapytania przed porównaniem
+    sql = f"SELECT {side} AS side, account_number, account_name, closing_balance FROM {quote(source.model._meta.db_table)}"
+    if source.owner_field is None:
+        return f"{sql} WHERE entity_id = {entity}", entity_params
+    owner_column = source.model._meta.get_field(source.owner_field).column
+    return f"{sql} WHERE {quote(owner_column)} = %s AND entity_id = {entity}", [source.owner_pk, *entity_params]
+
+
+def comparison_sql(base, compared, sort='account_number', changed_only=False):
+    base_sql, base_params = _side_sql(0, base)
+    compared_sql, compared_params = _side_sql(1, compared)
+    sql = f"""
+        SELECT account_number, account_name, base_balance, compared_balance, variance,
+            CASE WHEN base_balance <> 0 THEN ROUND(variance * 100.0 / ABS(base_balance), 2) END AS percent_change,
+            CASE
+                WHEN base_balance IS NULL THEN 'added'
+                WHEN compared_balance IS NULL THEN 'removed'
+                WHEN variance <> 0 THEN 'changed'
+                ELSE 'unchanged'
+            END AS status
+        FROM (
+            SELECT account_number, account_name, base_balance, compared_balance,
+                COALESCE(compared_balance, 0) - COALESCE(base_balance, 0) AS variance
+            FROM (
+                SELECT account_number,
+                    COALESCE(MAX(CASE WHEN side = 1 THEN account_name END), MAX(account_name)) AS account_name,
+                    MAX(CASE WHEN side = 0 THEN closing_balance END) AS base_balance,
+                    MAX(CASE WHEN side = 1 THEN closing_balance END) AS compared_balance
+                FROM ({base_sql} UNION ALL {compared_sql}) AS sides
+                GROUP BY account_number
+            ) AS joined
+        ) AS compared
+        {'WHERE base_balance IS NULL OR compared_balance IS NULL OR variance <> 0' if changed_only else ''}
+        ORDER BY {ORDERINGS.get(sort, ORDERINGS['account_number'])}
+    """
+    return sql, base_params + compared_params
+
+
+def iter_comparison(base, compared, sort='account_number', changed_only=False, limit=None, chunk_size=2000):
+    '''
+    Generator wierszy ComparisonRow; limit - tylko pierwsze wiersze (np. strona HTML), None - całość (eksport).
+    '''
+    sql, params = comparison_sql(base, compared, sort=sort, changed_only=changed_only)
+    if limit is not None:
+        sql, params = f"{sql} LIMIT %s", params + [limit]
+    # surowe SQL omija router - baza odczytu (replika dla widoków z ReadReplicaMixin) jak dla zapytań ORM
+    with connections[router.db_for_read(SimpleTrialBalance)].cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield ComparisonRow(*row)
@@ -1,15 +1,42 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
 
-from .models import SimpleTrialBalance
+from .ledger import post_journal_entry
+from .models import AccountingPeriod, SimpleTrialBalance
+from .permissions import user_in_group
+from .tenancy import entity_expression
 
 # wokorzystać potem jako bazę do tworzenia nowego użytkownika
 class NameForm(forms.Form): 
     your_name = forms.CharField(label='Your Name', max_length=100)
 
 
-class TrialBalanceForm(forms.ModelForm):
+class EntityScopedFormMixin:
+    # pola wyboru kont mają queryset zbudowany przy imporcie modułu, bez zakresu jednostki - odtwarzamy go przy tworzeniu
+    # formularza, więc wybrać (i zwalidować) można tylko konta jednostki użytkownika
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field, forms.ModelChoiceField) and field.queryset.model is SimpleTrialBalance:
+                field.queryset = SimpleTrialBalance.objects.all()
+
+
+class TrialBalanceForm(EntityScopedFormMixin, forms.ModelForm):
+    # konto nadrzędne podajemy numerem konta - bez listy rozwijanej ze wszystkimi kontami
+    parent = forms.ModelChoiceField(
+        queryset=SimpleTrialBalance.objects.all(),
+        to_field_name='account_number',
+        widget=forms.NumberInput,
+        required=False,
+        label='Parent account number',
+    )
+
     class Meta:
         model = SimpleTrialBalance
         exclude = ['closing_balance'] # wykluczenie closing_balance w formularzu, użytkownik nie będzie miał do niego dostępu i przypadkiem go nie nadpisze
@@ -17,12 +44,137 @@ class TrialBalanceForm(forms.ModelForm):
     def __init__(self, *args, **kwargs): # init jest wywoływana za każdym razem gdy jest tworzony obiekt klasy
         user = kwargs.pop('user', None) # Funkcja pop wyciąga z argumentów kwargs wartość dla klucza 'user' i przypisuje ją do zmiennej user, jeśli klucz 'user' nie istnieje w kwargs, to domyślną wartością będzie None.
         super().__init__(*args, **kwargs) #nadpisanie __init__
+        self.user = user if user is not None and user.is_authenticated else None # autor wpisu dziennika przy zmianie activity
+
+        if 'parent' in self.fields and self.instance.parent_id:
+            self.initial['parent'] = self.instance.parent.account_number # model_to_dict daje id, a pole oczekuje numeru konta
 
-        if user and user.groups.filter(name='new_hire_permissions').exists():
+        if user_in_group(user, 'new_hire_permissions'): # nazwy grup są zapamiętane na obiekcie user, więc w tym samym requeście baza nie jest odpytywana ponownie
             # self.fields['account_name', 'account_number', 'opening_balance'].widget = forms.HiddenInput() # ukrycie określonych pól jeśli użytkownik jest w grupie 'new_hire_permissions"
-            self.fields['account_name'].disabled = True # w ten sposób możemy zablokować pole do edycji ale jest odczyt
-            self.fields['account_number'].disabled = True # nie możemy przekazać wszytkiego naraz bo django nie obłuży dostępu do wielu pól jednocześnie w liście
-            self.fields['opening_balance'].disabled = True
+            for name in ['account_name', 'account_number', 'opening_balance', 'parent']: # w ten sposób możemy zablokować pole do edycji ale jest odczyt
+                if name in self.fields:
+                    self.fields[name].disabled = True
+
+    def save(self, commit=True):
+        # activity zmienia się tylko przez dziennik (post_journal_entry) - konto zapisujemy z dotychczasowym activity,
+        # a różnicę księgujemy wpisem dziennika, więc activity zgadza się z sumą linii dziennika (find_ledger_drift)
+        if not commit or 'activity' not in self.fields:
+            return super().save(commit)
+        previous = self.initial.get('activity') or 0 # nowe konto zaczyna od zera
+        delta = self.instance.activity - previous
+        with transaction.atomic():
+            self.instance.activity = previous
+            account = super().save()
+            if delta:
+                post_journal_entry([(account.account_number, delta)], description='Account form', user=self.user)
+                account.refresh_from_db(fields=['activity', 'closing_balance'])
+        return account
+
+    def clean_parent(self):
+        parent = self.cleaned_data.get('parent')
+        # konto nie może być swoim własnym kontem nadrzędnym ani podpiąć się pod własną analitykę
+        if parent is not None and self.instance.pk and (
+            parent.pk == self.instance.pk or parent.path.startswith(self.instance.path)
+        ):
+            raise forms.ValidationError('An account cannot be placed under itself or its own sub-account.')
+        return parent
+
+    def validate_unique(self):
+        super().validate_unique()
+        # numer jest unikalny w obrębie jednostki (account_entity_number_unique), a jednostki nie ma w formularzu,
+        # więc Django tego ograniczenia nie sprawdza - jedno zapytanie po indeksie (entity, account_number)
+        number = self.cleaned_data.get('account_number')
+        if number is None or 'account_number' in self._errors:
+            return
+        entity_id = self.instance.entity_id or entity_expression()
+        duplicates = SimpleTrialBalance.all_entities.filter(entity_id=entity_id, account_number=number)
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            self.add_error('account_number', self.instance.unique_error_message(SimpleTrialBalance, ['account_number']))
+
+
+class AccountGridForm(TrialBalanceForm):
+    # wiersz siatki edycji - te same pola i blokady dla new_hire_permissions co TrialBalanceForm, bez konta nadrzędnego i activity
+    parent = None
+
+    class Meta:
+        model = SimpleTrialBalance
+        fields = ['account_name', 'account_number', 'opening_balance'] # activity tylko przez dziennik (TrialBalanceForm.save, post_journal_entry)
+
+    def validate_unique(self):
+        # unikalność numeru sprawdzamy w bazie tylko w wierszach, w których numer się zmienił (a nie jednym zapytaniem na wiersz);
+        # powtórzenia w obrębie siatki wyłapuje formset
+        if 'account_number' in self.changed_data:
+            super().validate_unique()
+
+
+class BaseAccountGridFormSet(forms.BaseModelFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # wiersz jest już rozpoznany po id z pobranej strony (edit_only - bez tworzenia nowych kont),
+        # pole id nie musi odpytywać bazy osobno dla każdego wiersza
+        form.fields['id'] = forms.IntegerField(widget=forms.HiddenInput, required=False, initial=form.instance.pk)
+
+    def changed_forms(self):
+        return [form for form in self.forms if form.instance.pk and form.has_changed()]
+
+
+AccountGridFormSet = forms.modelformset_factory(
+    SimpleTrialBalance,
+    form=AccountGridForm,
+    formset=BaseAccountGridFormSet,
+    extra=0,
+    edit_only=True,
+    max_num=settings.TRIAL_BALANCE_MAX_PAGE_SIZE, # siatka pokazuje najwyżej jedną stronę kont
+    absolute_max=settings.TRIAL_BALANCE_MAX_PAGE_SIZE,
+    validate_max=True,
+)
+
+
+class TrialBalanceSearchForm(forms.Form):
+    SORT_CHOICES = [
+        ('account_number', 'Account number'),
+        ('-account_number', 'Account number (descending)'),
+        ('account_name', 'Account name'),
+        ('-account_name', 'Account name (descending)'),
+        ('closing_balance', 'Closing balance'),
+        ('-closing_balance', 'Closing balance (descending)'),
+    ]
+
+    number_from = forms.IntegerField(required=False, label='Account number from')
+    number_to = forms.IntegerField(required=False, label='to')
+    name = forms.CharField(required=False, max_length=30, label='Name starts with')
+    nonzero = forms.BooleanField(required=False, label='Non-zero closing balance only')
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+    subtotals = forms.IntegerField(required=False, min_value=1, max_value=9, label='Subtotals by first digits')
+
+    def filters(self):
+        # parametry dla SimpleTrialBalance.objects.search(), pusty słownik dla niepoprawnego formularza
+        if not self.is_valid():
+            return {}
+        return {key: self.cleaned_data[key] for key in ['number_from', 'number_to', 'name', 'nonzero']}
+
+    def subtotal_length(self):
+        if not self.is_valid():
+            return None
+        return self.cleaned_data['subtotals']
+
+    def sort_key(self):
+        if not self.is_valid():
+            return 'account_number'
+        return self.cleaned_data['sort'] or 'account_number'
+
+
+class AccountImportRowForm(TrialBalanceForm):
+    # walidacja pojedynczego wiersza importu - te same reguły co TrialBalanceForm, ale bez sprawdzania unikalności,
+    # bo istniejące konto o tym samym numerze zostanie nadpisane (upsert)
+    def validate_unique(self):
+        pass
+
+
+class AccountImportForm(forms.Form):
+    file = forms.FileField(label='CSV file')
 
 
 class NewUserForm(UserCreationForm):
@@ -33,17 +185,98 @@ class NewUserForm(UserCreationForm):
         fields = ['username', 'email', 'password1', 'password2']
 
 
-class AccountDeleteForm(forms.Form):
+# Konta wybiera się przez wyszukiwarkę (account_lookup) - formularz dostaje tylko id wybranych kont w ukrytych polach,
+# więc lista wyboru nie jest budowana z całej tabeli. Walidacja sprawdza w bazie tylko przekazane id.
+class AccountDeleteForm(EntityScopedFormMixin, forms.Form):
     accounts_to_delete = forms.ModelMultipleChoiceField(
         queryset=SimpleTrialBalance.objects.all(),
-        widget=forms.CheckboxSelectMultiple, # do wyboru wielu opcji
+        widget=forms.MultipleHiddenInput, # id wybranych kont dodaje wyszukiwarka
         required=False # nie trzeba nic zaznaczać, wtedy wrócimy do listy kont bez usuwania czegokolwiek
     )
 
 
-class AccountUpdateSelect(forms.Form):
+class AccountBulkDeleteForm(forms.Form):
+    number_from = forms.IntegerField(required=False, label='Account number from')
+    number_to = forms.IntegerField(required=False, label='to')
+    name = forms.CharField(required=False, max_length=30, label='Name starts with')
+    zero = forms.BooleanField(required=False, label='Zero closing balance only')
+    confirm = forms.BooleanField(required=False, widget=forms.HiddenInput) # ustawiane dopiero na stronie z podglądem liczby kont
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # bez żadnego kryterium usunęlibyśmy całą tabelę
+        if not any(cleaned_data.get(key) not in (None, '', False) for key in ['number_from', 'number_to', 'name', 'zero']):
+            raise forms.ValidationError('Choose at least one criterion.')
+        return cleaned_data
+
+    def filters(self):
+        return {key: self.cleaned_data[key] for key in ['number_from', 'number_to', 'name', 'zero']}
+
+
+class AccountUpdateSelect(EntityScopedFormMixin, forms.Form):
     account_update_select = forms.ModelChoiceField(
         queryset=SimpleTrialBalance.objects.all(),
-        widget=forms.RadioSelect, # do wyboru jednej opcji w liście, bez tego pojawi się lista rozwijana
+        widget=forms.HiddenInput, # id wybranego konta ustawia wyszukiwarka
         required=True
-    )
\ No newline at end of file
+    )
+
+class AccountingPeriodForm(forms.ModelForm):
+    class Meta:
+        model = AccountingPeriod
+        fields = ['name', 'start_date', 'end_date']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+            'end_date': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            raise forms.ValidationError('The period cannot end before it starts.')
+        return cleaned_data
+
+
+class PeriodCloseForm(forms.Form):
+    period = forms.ModelChoiceField(queryset=AccountingPeriod.objects.filter(closed_at__isnull=True)) # tylko otwarte okresy
+    next_name = forms.CharField(max_length=30, required=False, label='Name of the next period (if it has to be created)')
+
+
+class TrialBalanceAsOfForm(forms.Form):
+    as_of = forms.DateField(label='As of', widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def moment(self):
+        # stan na koniec wskazanego dnia (w strefie czasowej projektu)
+        next_day = self.cleaned_data['as_of'] + timedelta(days=1)
+        return timezone.make_aware(datetime.combine(next_day, time.min)) - timedelta(microseconds=1)
+
+
+class ComparisonForm(forms.Form):
+    SORT_CHOICES = [
+        ('account_number', 'Account number'),
+        ('-abs_variance', 'Largest variance first'),
+        ('abs_variance', 'Smallest variance first'),
+        ('-variance', 'Variance (descending)'),
+        ('variance', 'Variance'),
+    ]
+
+    base = forms.ChoiceField(label='Compare')
+    compared = forms.ChoiceField(label='with')
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+    changed_only = forms.BooleanField(required=False, label='Changed, added and removed accounts only')
+
+    def __init__(self, *args, sources=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sources = {source.key: source for source in sources}
+        choices = [(source.key, source.label) for source in sources]
+        self.fields['base'].choices = choices
+        self.fields['compared'].choices = choices
+
+    def comparison(self):
+        # parametry dla iter_comparison()
+        return {
+            'base': self.sources[self.cleaned_data['base']],
+            'compared': self.sources[self.cleaned_data['compared']],
+            'sort': self.cleaned_data['sort'] or 'account_number',
+            'changed_only': self.cleaned_data['changed_only'],
+        }
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import AccountChange, SnapshotBalance, TrialBalanceSnapshot
+from .periods import copy_balances
+from .tenancy import entity_expression
+
+
+# Historia tabeli kont: okresowe migawki sald + dziennik zmian (AccountChange, wypełniany triggerami).
+# Stan na dowolną chwilę = najbliższa wcześniejsza migawka + zmiany zapisane po niej, więc nie trzeba trzymać kopii na każdy dzień.
+
+HistoricalBalance = namedtuple('HistoricalBalance', ['account_number', 'account_name', 'opening_balance', 'activity', 'closing_balance'])
+
+
+class HistoryUnavailable(Exception):
+    pass
+
+
+def take_snapshot(min_changes=0):
+    '''
+    Zapisuje migawkę bieżących sald wszystkich jednostek (INSERT ... SELECT). Przy min_changes > 0 migawka powstaje tylko,
+    jeśli od poprzedniej przybyło co najmniej tyle zmian - wtedy zwraca None.
+    '''
+    with transaction.atomic():
+        last_change_id = AccountChange.objects.aggregate(last=Max('id'))['last'] or 0
+        previous = TrialBalanceSnapshot.objects.order_by('-last_change_id').values_list('last_change_id', flat=True).first()
+        if previous is not None and last_change_id - previous < max(min_changes, 1):
+            return None # od poprzedniej migawki nic się nie zmieniło (albo za mało zmian)
+
+        snapshot = TrialBalanceSnapshot.objects.create(taken_at=timezone.now(), last_change_id=last_change_id)
+        copy_balances(SnapshotBalance, 'snapshot', snapshot.pk)
+    return snapshot
+
+
+def balances_as_of(moment):
+    '''
+    Salda kont bieżącej jednostki na chwilę moment (aware datetime), posortowane po numerze konta.
+    Dwa odczyty: migawka sprzed moment i zmiany między migawką a moment; z każdej zmiany liczy się tylko ostatnia dla danego konta.
+    '''
+    snapshot = TrialBalanceSnapshot.objects.filter(taken_at__lte=moment).order_by('-taken_at', '-id').first()
+    if snapshot is None:
+        raise HistoryUnavailable(f"No trial balance history before {moment:%Y-%m-%d %H:%M}.")
+
+    entity_id = entity_expression()
+    rows = {
+        number: (name, opening, activity)
+        for number, name, opening, activity in snapshot.balances.filter(entity_id=entity_id).values_list(
+            'account_number', 'account_name', 'opening_balance', 'activity'
+        ).order_by().iterator(chunk_size=2000)
+    }
+    changes = AccountChange.objects.filter(entity_id=entity_id, id__gt=snapshot.last_change_id, changed_at__lte=moment).values_list(
+        'account_number', 'account_name', 'opening_balance', 'activity', 'deleted'
+    ).order_by('id')
+    for number, name, opening, activity, deleted in changes.iterator(chunk_size=2000):
+        if deleted:
+            rows.pop(number, None)
+        else:
+            rows[number] = (name, opening, activity)
+
+    return [
+        HistoricalBalance(number, name, opening, activity, opening + activity)
+        for number, (name, opening, activity) in sorted(rows.items())
+    ]
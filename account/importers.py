@@ -0,0 +1,97 @@
+import csv
+
+from django.conf import settings
+from django.db import transaction
+
+from .forms import AccountImportRowForm
+from .ledger import post_journal_entry
+from .models import SimpleTrialBalance
+from .tenancy import current_entity_id
+
+
+IMPORT_FIELDS = ['account_name', 'account_number', 'opening_balance', 'activity']
+OPTIONAL_IMPORT_FIELDS = ['parent'] # numer konta nadrzędnego, puste - konto najwyższego poziomu
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = [] # lista (numer linii, komunikat)
+
+    @property
+    def has_errors(self):
+        return bool(self.errors)
+
+
+def import_accounts(text_stream, batch_size=None, user=None):
+    '''
+    Import kont z pliku CSV (nagłówek: account_name, account_number, opening_balance, activity).
+    Plik jest czytany strumieniowo, błędne wiersze trafiają do result.errors, a poprawne są zapisywane porcjami.
+    Konta trafiają do jednostki bieżącego zakresu. Activity z pliku jest księgowane w dzienniku (różnica do bieżącego activity konta).
+    Opcjonalna kolumna parent (numer konta nadrzędnego) pozwala wczytać całe drzewo - konto nadrzędne musi być wcześniej
+    w pliku albo już w bazie. Parent z pliku ustawia miejsce w drzewie tylko nowym kontom, istniejące przenosi się formularzem konta.
+    '''
+    batch_size = batch_size or settings.ACCOUNT_IMPORT_BATCH_SIZE
+    result = ImportResult()
+    reader = csv.DictReader(text_stream)
+
+    missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        result.errors.append((1, f"Missing columns: {', '.join(missing)}"))
+        return result
+
+    fields = IMPORT_FIELDS + [field for field in OPTIONAL_IMPORT_FIELDS if field in reader.fieldnames]
+    entity_id = current_entity_id()
+    batch = {}
+    for row in reader:
+        line = reader.line_num
+        parent = (row.get('parent') or '').strip()
+        if parent.isdigit() and int(parent) in batch:
+            # konto nadrzędne czeka jeszcze w porcji - zapisujemy ją, żeby formularz znalazł je w bazie
+            _write_batch(entity_id, batch, result, user)
+            batch = {}
+        form = AccountImportRowForm(data={field: row[field] for field in fields}, user=user)
+        if not form.is_valid():
+            messages = '; '.join(f"{field}: {' '.join(errors)}" for field, errors in form.errors.items())
+            result.errors.append((line, messages))
+            continue
+
+        account = form.instance # closing_balance wylicza baza (GeneratedField), także przy bulk_create/bulk_update
+        account.entity_id = entity_id
+        account.path = account.build_path() # bulk_create pomija save(); dla istniejących kont path nie jest nadpisywane
+        batch[account.account_number] = account # ten sam numer w jednej porcji - wygrywa ostatni wiersz
+
+        if len(batch) >= batch_size:
+            _write_batch(entity_id, batch, result, user)
+            batch = {}
+
+    if batch:
+        _write_batch(entity_id, batch, result, user)
+    return result
+
+
+def _write_batch(entity_id, batch, result, user=None):
+    # upsert po unikalnym (entity, account_number): INSERT ... ON CONFLICT (entity_id, account_number) DO UPDATE dla całej porcji;
+    # activity nie jest nadpisywane - nowe konta zaczynają od zera, a różnice względem pliku trafiają do dziennika jednym wpisem
+    with transaction.atomic():
+        existing = dict(
+            SimpleTrialBalance.all_entities.filter(entity_id=entity_id, account_number__in=batch.keys()).values_list('account_number', 'activity')
+        )
+        deltas = []
+        for number, account in batch.items():
+            delta = account.activity - existing.get(number, 0)
+            if delta:
+                deltas.append((number, delta))
+            account.activity = 0
+        SimpleTrialBalance.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=['entity', 'account_number'],
+            update_fields=['account_name', 'opening_balance'],
+        )
+        if deltas:
+            post_journal_entry(deltas, description='CSV import', user=user)
+
+    result.updated += len(existing)
+    result.created += len(batch) - len(existing)
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import JournalEntry, JournalLine, SimpleTrialBalance
+
+
+def integer(value):
+    # kwoty to pieniądze - 1.9 ani true z JSON nie mogą po cichu stać się 1 (int() przyjąłby jedno i drugie)
+    if type(value) is int:
+        return value
+    if isinstance(value, str) and value.isascii() and value.removeprefix('-').isdecimal():
+        return int(value)
+    raise ValueError(f"{value!r} is not an integer.")
+
+
+def post_journal_entry(lines, description='', user=None):
+    '''
+    Księguje wpis z liniami [(account_number, amount), ...]. Kwoty są dodawane przyrostowo do activity kont
+    (SimpleTrialBalance.objects.post_activity), dziennik nigdy nie jest sumowany od nowa.
+    Numery i kwoty muszą być liczbami całkowitymi (albo napisami z liczbą całkowitą, np. klucze JSON) - inaczej ValueError.
+    Zwraca (wpis, {account_number: closing_balance}).
+    '''
+    lines = [(integer(number), integer(amount)) for number, amount in lines]
+    deltas = {}
+    for number, amount in lines:
+        deltas[number] = deltas.get(number, 0) + amount
+
+    with transaction.atomic():
+        closing_balances = SimpleTrialBalance.objects.post_activity(deltas) # nieznane konto - DoesNotExist i wycofanie całości
+        account_ids = dict(SimpleTrialBalance.objects.filter(account_number__in=deltas.keys()).values_list('account_number', 'id'))
+        entry = JournalEntry.objects.create(description=description, posted_by=user)
+        JournalLine.objects.bulk_create(
+            [JournalLine(entry=entry, account_id=account_ids[number], amount=amount) for number, amount in lines],
+            batch_size=500,
+        )
+    return entry, closing_balances
+
+
+def find_ledger_drift(chunk_size=1000):
+    '''
+    Porównuje activity kont z sumą linii dziennika otwartego okresu, porcjami po chunk_size kont.
+    Zwraca listę (konto, activity, suma z dziennika) dla kont, które się nie zgadzają.
+    '''
+    drift = []
+    last_pk = 0
+    while True:
+        accounts = list(SimpleTrialBalance.objects.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not accounts:
+            break
+        ledger_totals = dict(
+            JournalLine.objects.filter(account__in=accounts, entry__period__isnull=True)
+            .values('account_id')
+            .annotate(total=Sum('amount'))
+            .values_list('account_id', 'total')
+            .order_by()
+        )
+        for account in accounts:
+            total = ledger_totals.get(account.pk, 0)
+            if account.activity != total:
+                drift.append((account, account.activity, total))
+        last_pk = accounts[-1].pk
+    return drift
+
+
+def rebuild_activity(drift):
+    # nadpisuje activity sumą z dziennika dla kont zwróconych przez find_ledger_drift
+    accounts = []
+    for account, activity, total in drift:
+        account.activity = total
+        accounts.append(account)
+    SimpleTrialBalance.objects.bulk_update(accounts, ['activity'], batch_size=500)
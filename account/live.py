@@ -0,0 +1,198 @@
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.utils.module_loading import import_string
+
+from .models import AccountChange, SimpleTrialBalance, fold_name
+from .tenancy import current_entity_id
+
+
+# Aktualizacje trial balance na żywo (Server-Sent Events, widok AsyncTrialBalanceStreamView).
+# Każdą zmianę kont - także update(), bulk_update() i bulk_create() - zapisuje już dziennik AccountChange (triggery),
+# więc hub rozsyła tylko powiadomienie "zmieniły się konta jednostki", a każdy strumień czyta z dziennika zmiany
+# po swoim kursorze. Kursor to id ostatniej wysłanej zmiany i zarazem id zdarzenia SSE: po zerwaniu połączenia przeglądarka
+# wysyła Last-Event-ID i strumień kontynuuje od tego miejsca. Zgubione albo połączone powiadomienia niczego nie gubią.
+
+RETRY_MS = 3000 # po ilu milisekundach przeglądarka łączy się ponownie
+
+
+class Subscription:
+    '''
+    Kolejka powiadomień jednego strumienia. deliver() można wołać z dowolnego wątku (sygnały zapisów działają w wątkach
+    widoków synchronicznych), kolejka należy do pętli zdarzeń strumienia.
+    '''
+    def __init__(self, loop, size):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=size)
+
+    def deliver(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError: # pętla strumienia jest już zamknięta
+            pass
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass # strumień i tak przeczyta z dziennika wszystko po swoim kursorze
+
+    async def get(self, timeout):
+        # następne powiadomienie albo None po timeout sekundach
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessHub:
+    '''
+    Rozsyłanie powiadomień w obrębie jednego procesu - bez zewnętrznych usług. Przy kilku workerach ASGI zapis w jednym procesie
+    nie obudzi strumieni w innych; te i tak sprawdzają dziennik co settings.LIVE_UPDATES_KEEPALIVE sekund.
+    Hub z tym samym interfejsem (publish(message), async with subscribe() as subscription -> await subscription.get(timeout))
+    może przesyłać powiadomienia np. przez Redis pub/sub - wystarczy wskazać go w settings.LIVE_UPDATES_HUB.
+    '''
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    @asynccontextmanager
+    async def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+
+
+_hubs = {}
+
+
+def get_hub():
+    path = settings.LIVE_UPDATES_HUB
+    if path not in _hubs:
+        _hubs[path] = import_string(path)()
+    return _hubs[path]
+
+
+def notify_change(entity_id=None):
+    # entity_id None - nie wiadomo której jednostki dotyczy zmiana (operacje zbiorcze), budzimy wszystkie strumienie
+    get_hub().publish({'entity_id': entity_id})
+
+
+def last_change_id(entity_id):
+    return AccountChange.objects.filter(entity_id=entity_id).aggregate(last=Max('id'))['last'] or 0
+
+
+def _matches(filters, number, name, closing_balance):
+    # te same kryteria co TrialBalanceSearchForm / SimpleTrialBalance.objects.search() - nazwa przez fold_name,
+    # tę samą funkcję co kolumna name_key (name_prefix)
+    if filters.get('number_from') is not None and number < filters['number_from']:
+        return False
+    if filters.get('number_to') is not None and number > filters['number_to']:
+        return False
+    if filters.get('name') and not fold_name(name).startswith(fold_name(filters['name'])):
+        return False
+    if filters.get('nonzero') and closing_balance == 0:
+        return False
+    return True
+
+
+def read_delta(entity_id, after, filters=None, limit=None):
+    '''
+    Zmiany kont jednostki po kursorze after, zwraca (nowy kursor, dane zdarzenia albo None, czy są kolejne zmiany).
+    Kilka zmian tego samego konta daje jeden wiersz ze stanem po ostatniej; konto, które przestało pasować do filtrów
+    tabeli, jest wysyłane jako usunięte. Sumy są liczone dla tych samych filtrów co stopka tabeli.
+    '''
+    filters = filters or {}
+    limit = limit or settings.LIVE_UPDATES_BATCH_SIZE
+    rows = list(
+        AccountChange.objects.filter(entity_id=entity_id, id__gt=after).order_by('id').values_list(
+            'id', 'account_number', 'account_name', 'opening_balance', 'activity', 'created', 'deleted'
+        )[:limit]
+    )
+    if not rows:
+        return after, None, False
+
+    accounts = {}
+    for change_id, number, name, opening, activity, created, deleted in rows:
+        previous = accounts.pop(number, None) # pop - konto trafia na koniec, kolejność jak w dzienniku
+        created = created or (previous is not None and previous['action'] == 'created' and not deleted)
+        accounts[number] = {
+            'action': 'deleted' if deleted else 'created' if created else 'updated',
+            'account_number': number,
+            'account_name': name,
+            'opening_balance': opening,
+            'activity': activity,
+            'closing_balance': opening + activity,
+        }
+
+    changes = []
+    for change in accounts.values():
+        if change['action'] != 'deleted' and not _matches(filters, change['account_number'], change['account_name'], change['closing_balance']):
+            if change['action'] == 'created':
+                continue # nowe konto spoza filtrów tabeli - nie ma go na stronie
+            change['action'] = 'deleted'
+        changes.append(change)
+
+    totals = SimpleTrialBalance.all_entities.filter(entity_id=entity_id).search(**filters).totals()
+    return rows[-1][0], {'changes': changes, 'totals': totals}, len(rows) == limit
+
+
+def sse_event(name, data, event_id):
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def _wait_for_change(subscription, entity_id, timeout):
+    # True - powiadomienie o zmianie w tej jednostce, False - minął czas bez takiego powiadomienia
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while (remaining := deadline - loop.time()) > 0:
+        message = await subscription.get(remaining)
+        if message is None:
+            return False
+        if message.get('entity_id') in (None, entity_id):
+            return True
+    return False
+
+
+async def live_updates(after=None, filters=None):
+    '''
+    Generator zdarzeń SSE dla jednostki bieżącego zakresu: "delta" ze zmienionymi kontami i nowymi sumami.
+    after - kursor z Last-Event-ID, None - od bieżącego stanu (strona ma już aktualną tabelę).
+    Strumień kończy się po settings.LIVE_UPDATES_MAX_SECONDS, przeglądarka łączy się ponownie od swojego kursora.
+    '''
+    entity_id = await sync_to_async(current_entity_id)()
+    if after is None:
+        after = await sync_to_async(last_change_id)(entity_id)
+    yield f"retry: {RETRY_MS}\nid: {after}\n\n" # id bez danych ustawia kursor przeglądarki jeszcze przed pierwszą zmianą
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LIVE_UPDATES_MAX_SECONDS
+    async with get_hub().subscribe() as subscription:
+        while True:
+            after, delta, more = await sync_to_async(read_delta)(entity_id, after, filters)
+            if delta is not None:
+                yield sse_event('delta', delta, after)
+            if more:
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            if not await _wait_for_change(subscription, entity_id, min(settings.LIVE_UPDATES_KEEPALIVE, remaining)):
+                yield ': keepalive\n\n' # komentarz SSE - połączenie nie jest zamykane przez proxy; potem sprawdzamy dziennik
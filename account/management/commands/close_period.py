@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import AccountingPeriod
+from account.periods import PeriodClosedError, close_period
+
+
+class Command(BaseCommand):
+    help = 'Closes an accounting period and rolls closing balances forward to the next period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', help='name of the period to close')
+        parser.add_argument('--next-name', default=None, help='name of the next period if it has to be created')
+
+    def handle(self, *args, **options):
+        try:
+            period = AccountingPeriod.objects.get(name=options['period'])
+            next_period = close_period(period, next_name=options['next_name'])
+        except (AccountingPeriod.DoesNotExist, PeriodClosedError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(f"Closed {period.name}, open period: {next_period.name}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.importers import import_accounts
+from account.models import Entity
+from account.tenancy import get_entity, using_entity
+
+
+class Command(BaseCommand):
+    help = 'Imports accounts of one entity from a CSV file, updating accounts with an existing account_number.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--entity', default=None, help='name of the entity owning the accounts (default entity if omitted)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as text_stream, using_entity(get_entity(options['entity'])):
+                result = import_accounts(text_stream, batch_size=options['batch_size'])
+        except (OSError, UnicodeDecodeError, Entity.DoesNotExist) as error:
+            raise CommandError(error)
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(f"Created: {result.created}, updated: {result.updated}, rejected: {len(result.errors)}")
@@ -0,0 +1,30 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.ledger import post_journal_entry
+from account.models import Entity, SimpleTrialBalance
+from account.tenancy import get_entity, using_entity
+
+
+class Command(BaseCommand):
+    help = 'Posts activity deltas from a JSON file ({"account_number": delta, ...}) as one journal entry in a single transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSON file with deltas, '-' reads from stdin")
+        parser.add_argument('--entity', default=None, help='name of the entity owning the accounts (default entity if omitted)')
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                deltas = json.load(sys.stdin)
+            else:
+                with open(options['path'], encoding='utf-8') as json_file:
+                    deltas = json.load(json_file)
+            with using_entity(get_entity(options['entity'])):
+                entry, closing_balances = post_journal_entry(deltas.items(), description='Batch activity posting')
+        except (OSError, ValueError, TypeError, AttributeError, SimpleTrialBalance.DoesNotExist, Entity.DoesNotExist) as error:
+            raise CommandError(error)
+
+        self.stdout.write(f"Posted activity to {len(closing_balances)} accounts")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account.routing import refresh_replica
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary database to the read replica file with the SQLite backup API (run periodically).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024, help='pages copied per backup step')
+
+    def handle(self, *args, **options):
+        refresh_replica(pages=options['pages'])
+        self.stdout.write("Replica refreshed")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from account.history import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Stores a snapshot of all account balances; point-in-time queries replay the change log from the nearest snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-changes', type=int, default=0, help='skip the snapshot if fewer account changes were logged since the previous one')
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot(min_changes=options['min_changes'])
+        if snapshot is None:
+            self.stdout.write("Not enough changes since the previous snapshot, skipped")
+        else:
+            self.stdout.write(f"Snapshot {snapshot.pk} taken at {snapshot.taken_at:%Y-%m-%d %H:%M:%S}, {snapshot.balances.count()} accounts")
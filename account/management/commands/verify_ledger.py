@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from account.ledger import find_ledger_drift, rebuild_activity
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds account activity from the journal in chunks and reports accounts that drifted from it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--fix', action='store_true', help='overwrite activity of drifted accounts with the journal total')
+
+    def handle(self, *args, **options):
+        drift = find_ledger_drift(chunk_size=options['chunk_size'])
+        for account, activity, total in drift:
+            self.stdout.write(f"{account.account_number} {account.account_name}: activity {activity}, journal {total}, drift {activity - total}")
+
+        if not drift:
+            self.stdout.write("Activity of all accounts matches the journal")
+        elif options['fix']:
+            rebuild_activity(drift)
+            self.stdout.write(f"Fixed {len(drift)} accounts")
+        else:
+            self.stdout.write(f"{len(drift)} accounts drifted, run with --fix to rebuild them from the journal")
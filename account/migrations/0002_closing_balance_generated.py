@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 15:57
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    # zwykłej kolumny nie da się zmienić na GeneratedField przez AlterField - usuwamy ją i dodajemy ponownie,
+    # baza wyliczy closing_balance dla wszystkich istniejących wierszy
+    operations = [
+        migrations.RemoveField(
+            model_name='simpletrialbalance',
+            name='closing_balance',
+        ),
+        migrations.AddField(
+            model_name='simpletrialbalance',
+            name='closing_balance',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('opening_balance'), '+', models.F('activity')), output_field=models.IntegerField()),
+        ),
+    ]
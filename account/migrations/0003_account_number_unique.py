@@ -0,0 +1,50 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:00
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_account_numbers(apps, schema_editor):
+    # przed założeniem unikalnego indeksu szukamy powtórzonych numerów kont - jeśli są, migracja zatrzymuje się
+    # z listą duplikatów, żeby można było je poprawić ręcznie (zamiast niejasnego IntegrityError z bazy)
+    SimpleTrialBalance = apps.get_model('account', 'SimpleTrialBalance')
+    duplicates = (
+        SimpleTrialBalance.objects.values('account_number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('account_number')
+    )
+    if duplicates:
+        report = []
+        for duplicate in duplicates:
+            accounts = SimpleTrialBalance.objects.filter(account_number=duplicate['account_number']).order_by('id')
+            names = ', '.join(f"id={account.id} {account.account_name!r}" for account in accounts)
+            report.append(f"  {duplicate['account_number']}: {names}")
+        raise RuntimeError(
+            "Cannot add a unique constraint on account_number, duplicated account numbers found:\n" + "\n".join(report)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_closing_balance_generated'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_account_numbers, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='simpletrialbalance',
+            options={'ordering': ['account_number']},
+        ),
+        migrations.AlterField(
+            model_name='simpletrialbalance',
+            name='account_number',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(django.db.models.functions.text.Lower('account_name'), name='account_name_lower_idx'),
+        ),
+    ]
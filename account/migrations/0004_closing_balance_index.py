@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_account_number_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(fields=['closing_balance'], name='closing_balance_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Cast, Concat, LPad
+
+
+def fill_paths(apps, schema_editor):
+    # istniejące konta nie mają kont nadrzędnych - ścieżka to sam numer konta, ustawiona jednym UPDATE
+    SimpleTrialBalance = apps.get_model('account', 'SimpleTrialBalance')
+    SimpleTrialBalance.objects.update(
+        path=Concat(LPad(Cast('account_number', output_field=models.CharField()), 10, Value('0')), Value('/'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_closing_balance_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simpletrialbalance',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='account.simpletrialbalance'),
+        ),
+        migrations.AddField(
+            model_name='simpletrialbalance',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:14
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_account_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountingPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('closed_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+            options={
+                'ordering': ['start_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_number', models.IntegerField()),
+                ('account_name', models.CharField(max_length=30)),
+                ('opening_balance', models.IntegerField()),
+                ('activity', models.IntegerField()),
+                ('closing_balance', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('opening_balance'), '+', models.F('activity')), output_field=models.IntegerField())),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='account.accountingperiod')),
+            ],
+            options={
+                'ordering': ['period', 'account_number'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'account_number'), name='period_balance_account_unique')],
+            },
+        ),
+    ]
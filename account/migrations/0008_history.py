@@ -0,0 +1,117 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:19
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# triggery SQLite zapisujące stan konta po każdej zmianie; czas w UTC z milisekundami, w formacie w jakim Django zapisuje DateTimeField
+CHANGED_AT = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+COLUMNS = 'account_number, account_name, opening_balance, activity, deleted, changed_at'
+
+CREATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER account_change_insert AFTER INSERT ON account_simpletrialbalance
+    BEGIN
+        INSERT INTO account_accountchange ({COLUMNS})
+        VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT});
+    END
+    """,
+    # zmiana samej ścieżki albo konta nadrzędnego nie zmienia sald - nie trafia do dziennika
+    f"""
+    CREATE TRIGGER account_change_update AFTER UPDATE ON account_simpletrialbalance
+    WHEN OLD.account_number IS NOT NEW.account_number OR OLD.account_name IS NOT NEW.account_name
+        OR OLD.opening_balance IS NOT NEW.opening_balance OR OLD.activity IS NOT NEW.activity
+    BEGIN
+        INSERT INTO account_accountchange ({COLUMNS})
+        SELECT OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT}
+        WHERE OLD.account_number IS NOT NEW.account_number;
+        INSERT INTO account_accountchange ({COLUMNS})
+        VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT});
+    END
+    """,
+    f"""
+    CREATE TRIGGER account_change_delete AFTER DELETE ON account_simpletrialbalance
+    BEGIN
+        INSERT INTO account_accountchange ({COLUMNS})
+        VALUES (OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT});
+    END
+    """,
+]
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS account_change_insert',
+    'DROP TRIGGER IF EXISTS account_change_update',
+    'DROP TRIGGER IF EXISTS account_change_delete',
+]
+
+
+def baseline_snapshot(apps, schema_editor):
+    # wcześniejsze zmiany nie są w dzienniku - historia zaczyna się od migawki bieżącego stanu
+    TrialBalanceSnapshot = apps.get_model('account', 'TrialBalanceSnapshot')
+    SimpleTrialBalance = apps.get_model('account', 'SimpleTrialBalance')
+    SnapshotBalance = apps.get_model('account', 'SnapshotBalance')
+    snapshot = TrialBalanceSnapshot.objects.create(taken_at=timezone.now(), last_change_id=0)
+    SnapshotBalance.objects.bulk_create(
+        (
+            SnapshotBalance(snapshot=snapshot, account_number=number, account_name=name, opening_balance=opening, activity=activity)
+            for number, name, opening, activity in SimpleTrialBalance.objects.values_list(
+                'account_number', 'account_name', 'opening_balance', 'activity'
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_number', models.IntegerField()),
+                ('account_name', models.CharField(max_length=30)),
+                ('opening_balance', models.IntegerField()),
+                ('activity', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrialBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True)),
+                ('last_change_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['taken_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_number', models.IntegerField()),
+                ('account_name', models.CharField(max_length=30)),
+                ('opening_balance', models.IntegerField()),
+                ('activity', models.IntegerField()),
+                ('closing_balance', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('opening_balance'), '+', models.F('activity')), output_field=models.IntegerField())),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='account.trialbalancesnapshot')),
+            ],
+            options={
+                'ordering': ['snapshot', 'account_number'],
+                'constraints': [models.UniqueConstraint(fields=('snapshot', 'account_number'), name='snapshot_balance_account_unique')],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunPython(baseline_snapshot, migrations.RunPython.noop),
+    ]
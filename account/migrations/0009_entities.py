@@ -0,0 +1,189 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:46
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+# triggery dziennika zmian (0008) z kolumną entity_id; przebudowa tabeli kont przez SQLite (AddField, AlterField) usuwa triggery,
+# więc są usuwane na początku i tworzone na nowo na końcu migracji
+CHANGED_AT = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+OLD_COLUMNS = 'account_number, account_name, opening_balance, activity, deleted, changed_at'
+COLUMNS = f'{OLD_COLUMNS}, entity_id'
+
+
+def trigger_sql(columns, old_entity='', new_entity=''):
+    return [
+        f"""
+        CREATE TRIGGER account_change_insert AFTER INSERT ON account_simpletrialbalance
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT}{new_entity});
+        END
+        """,
+        f"""
+        CREATE TRIGGER account_change_update AFTER UPDATE ON account_simpletrialbalance
+        WHEN OLD.account_number IS NOT NEW.account_number OR OLD.account_name IS NOT NEW.account_name
+            OR OLD.opening_balance IS NOT NEW.opening_balance OR OLD.activity IS NOT NEW.activity
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            SELECT OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT}{old_entity}
+            WHERE OLD.account_number IS NOT NEW.account_number;
+            INSERT INTO account_accountchange ({columns})
+            VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT}{new_entity});
+        END
+        """,
+        f"""
+        CREATE TRIGGER account_change_delete AFTER DELETE ON account_simpletrialbalance
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            VALUES (OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT}{old_entity});
+        END
+        """,
+    ]
+
+
+OLD_TRIGGERS = trigger_sql(OLD_COLUMNS)
+CREATE_TRIGGERS = trigger_sql(COLUMNS, old_entity=', OLD.entity_id', new_entity=', NEW.entity_id')
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS account_change_insert',
+    'DROP TRIGGER IF EXISTS account_change_update',
+    'DROP TRIGGER IF EXISTS account_change_delete',
+]
+ENTITY_MODELS = ['simpletrialbalance', 'periodbalance', 'snapshotbalance', 'accountchange']
+
+
+def default_entity(apps, schema_editor):
+    # dotychczasowe konta, salda okresów, migawki i dziennik zmian należą do jednostki domyślnej
+    Entity = apps.get_model('account', 'Entity')
+    entity, _ = Entity.objects.get_or_create(name=settings.DEFAULT_ENTITY_NAME)
+    for model_name in ENTITY_MODELS:
+        apps.get_model('account', model_name).objects.filter(entity__isnull=True).update(entity=entity)
+
+
+def entity_field(**kwargs):
+    return models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='account.entity', **kwargs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0008_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_TRIGGERS, OLD_TRIGGERS),
+        migrations.CreateModel(
+            name='Entity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntityMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='members', to='account.entity')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='entity_member', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='periodbalance',
+            name='period_balance_account_unique',
+        ),
+        migrations.RemoveConstraint(
+            model_name='snapshotbalance',
+            name='snapshot_balance_account_unique',
+        ),
+        migrations.RemoveIndex(
+            model_name='simpletrialbalance',
+            name='account_name_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='simpletrialbalance',
+            name='closing_balance_idx',
+        ),
+        migrations.AlterField(
+            model_name='simpletrialbalance',
+            name='account_number',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='simpletrialbalance',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        # najpierw kolumny NULL, wypełnienie jednostką domyślną, potem NOT NULL
+        migrations.AddField(
+            model_name='simpletrialbalance',
+            name='entity',
+            field=entity_field(null=True, editable=False, related_name='accounts'),
+        ),
+        migrations.AddField(
+            model_name='periodbalance',
+            name='entity',
+            field=entity_field(null=True, related_name='+'),
+        ),
+        migrations.AddField(
+            model_name='snapshotbalance',
+            name='entity',
+            field=entity_field(null=True, related_name='+'),
+        ),
+        migrations.AddField(
+            model_name='accountchange',
+            name='entity',
+            field=models.ForeignKey(null=True, db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='account.entity'),
+        ),
+        migrations.RunPython(default_entity, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='simpletrialbalance',
+            name='entity',
+            field=entity_field(editable=False, related_name='accounts'),
+        ),
+        migrations.AlterField(
+            model_name='periodbalance',
+            name='entity',
+            field=entity_field(related_name='+'),
+        ),
+        migrations.AlterField(
+            model_name='snapshotbalance',
+            name='entity',
+            field=entity_field(related_name='+'),
+        ),
+        migrations.AlterField(
+            model_name='accountchange',
+            name='entity',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='account.entity'),
+        ),
+        migrations.AddConstraint(
+            model_name='simpletrialbalance',
+            constraint=models.UniqueConstraint(fields=('entity', 'account_number'), name='account_entity_number_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(models.F('entity'), django.db.models.functions.text.Lower('account_name'), name='account_entity_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(fields=['entity', 'closing_balance'], name='account_entity_closing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(fields=['entity', 'path'], name='account_entity_path_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodbalance',
+            constraint=models.UniqueConstraint(fields=('period', 'entity', 'account_number'), name='period_balance_account_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='snapshotbalance',
+            constraint=models.UniqueConstraint(fields=('snapshot', 'entity', 'account_number'), name='snapshot_balance_account_unique'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+# triggery dziennika zmian (0009) oznaczają też nowe konta (created) - strumień SSE rozróżnia dodane i zmienione konta;
+# zmiana numeru to usunięcie starego numeru i nowe konto pod nowym numerem
+CHANGED_AT = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+OLD_COLUMNS = 'account_number, account_name, opening_balance, activity, deleted, changed_at, entity_id'
+COLUMNS = f'{OLD_COLUMNS}, created'
+
+
+def trigger_sql(columns, created_on_insert='', created_on_update='', not_created=''):
+    return [
+        f"""
+        CREATE TRIGGER account_change_insert AFTER INSERT ON account_simpletrialbalance
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT}, NEW.entity_id{created_on_insert});
+        END
+        """,
+        f"""
+        CREATE TRIGGER account_change_update AFTER UPDATE ON account_simpletrialbalance
+        WHEN OLD.account_number IS NOT NEW.account_number OR OLD.account_name IS NOT NEW.account_name
+            OR OLD.opening_balance IS NOT NEW.opening_balance OR OLD.activity IS NOT NEW.activity
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            SELECT OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT}, OLD.entity_id{not_created}
+            WHERE OLD.account_number IS NOT NEW.account_number;
+            INSERT INTO account_accountchange ({columns})
+            VALUES (NEW.account_number, NEW.account_name, NEW.opening_balance, NEW.activity, 0, {CHANGED_AT}, NEW.entity_id{created_on_update});
+        END
+        """,
+        f"""
+        CREATE TRIGGER account_change_delete AFTER DELETE ON account_simpletrialbalance
+        BEGIN
+            INSERT INTO account_accountchange ({columns})
+            VALUES (OLD.account_number, OLD.account_name, OLD.opening_balance, OLD.activity, 1, {CHANGED_AT}, OLD.entity_id{not_created});
+        END
+        """,
+    ]
+
+
+OLD_TRIGGERS = trigger_sql(OLD_COLUMNS)
+CREATE_TRIGGERS = trigger_sql(
+    COLUMNS,
+    created_on_insert=', 1',
+    created_on_update=', OLD.account_number IS NOT NEW.account_number',
+    not_created=', 0',
+)
+DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS account_change_insert',
+    'DROP TRIGGER IF EXISTS account_change_update',
+    'DROP TRIGGER IF EXISTS account_change_delete',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_entities'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_TRIGGERS, OLD_TRIGGERS),
+        migrations.AddField(
+            model_name='accountchange',
+            name='created',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='accountchange',
+            index=models.Index(fields=['entity', 'id'], name='account_change_entity_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
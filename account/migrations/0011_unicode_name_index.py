@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:03
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+# indeks nazw po UNICODE_LOWER zamiast LOWER - wbudowane LOWER w SQLite nie zamienia polskich liter (Ś, Ż, ...);
+# indeks z funkcją dostępną tylko w Pythonie blokował zapisy spoza Django (sqlite3, dbshell), więc 0013 zastępuje go
+# kolumną name_key - funkcja jest rejestrowana tylko na czas tej migracji
+
+
+class UnicodeLower(Lower):
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='UNICODE_LOWER', **extra_context)
+
+
+def register_unicode_lower(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.connection.connection.create_function(
+            'UNICODE_LOWER', 1, lambda value: value.lower() if value is not None else None, deterministic=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_change_log_created'),
+    ]
+
+    operations = [
+        migrations.RunPython(register_unicode_lower, register_unicode_lower),
+        migrations.RemoveIndex(
+            model_name='simpletrialbalance',
+            name='account_entity_name_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(models.F('entity'), UnicodeLower('account_name'), name='account_entity_name_lower_idx'),
+        ),
+    ]
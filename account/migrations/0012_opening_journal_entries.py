@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 17:20
+
+from django.db import migrations
+from django.db.models import Sum
+
+
+# activity zmienia się już tylko przez dziennik - activity zapisane wcześniej z pominięciem dziennika (formularze, import,
+# siatka edycji) trafia do wpisu otwarcia, po jednym dla każdej jednostki, tak żeby find_ledger_drift nie zgłaszał rozjazdu
+# i `verify_ledger --fix` nie zerował kont
+OPENING_DESCRIPTION = 'Opening activity'
+
+
+def opening_entries(apps, schema_editor):
+    SimpleTrialBalance = apps.get_model('account', 'SimpleTrialBalance')
+    JournalEntry = apps.get_model('account', 'JournalEntry')
+    JournalLine = apps.get_model('account', 'JournalLine')
+
+    ledger_totals = dict(
+        JournalLine.objects.filter(entry__period__isnull=True)
+        .values('account_id')
+        .annotate(total=Sum('amount'))
+        .values_list('account_id', 'total')
+        .order_by()
+    )
+    lines = {}
+    accounts = SimpleTrialBalance.objects.values_list('pk', 'entity_id', 'activity').order_by('pk')
+    for pk, entity_id, activity in accounts.iterator(chunk_size=2000):
+        amount = activity - ledger_totals.get(pk, 0)
+        if amount:
+            lines.setdefault(entity_id, []).append(JournalLine(account_id=pk, amount=amount))
+
+    for entity_lines in lines.values():
+        entry = JournalEntry.objects.create(description=OPENING_DESCRIPTION)
+        for line in entity_lines:
+            line.entry = entry
+        JournalLine.objects.bulk_create(entity_lines, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0011_unicode_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(opening_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:05
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+# indeks account_entity_name_lower_idx (0011) używał funkcji UNICODE_LOWER dostępnej tylko w połączeniach Django -
+# zapis kont przez sqlite3, dbshell czy narzędzia do kopii kończył się błędem "unknown function", podobnie PRAGMA integrity_check.
+# Zamiast niego kolumna name_key (nazwa po casefold, liczona w Pythonie) i zwykły indeks (entity, name_key).
+# AddField przebudowuje tabelę kont, co usuwa triggery dziennika zmian (0010) - tworzymy je na nowo na końcu.
+change_log = import_module('account.migrations.0010_change_log_created')
+unicode_name_index = import_module('account.migrations.0011_unicode_name_index')
+
+
+def fill_name_key(apps, schema_editor):
+    SimpleTrialBalance = apps.get_model('account', 'SimpleTrialBalance')
+    accounts = []
+    for account in SimpleTrialBalance.objects.only('pk', 'account_name').iterator(chunk_size=2000):
+        account.name_key = account.account_name.casefold() # to samo co account.models.fold_name
+        accounts.append(account)
+        if len(accounts) >= 2000:
+            SimpleTrialBalance.objects.bulk_update(accounts, ['name_key'])
+            accounts = []
+    SimpleTrialBalance.objects.bulk_update(accounts, ['name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0012_opening_journal_entries'),
+    ]
+
+    operations = [
+        migrations.RunSQL(change_log.DROP_TRIGGERS, change_log.CREATE_TRIGGERS),
+        migrations.RemoveIndex(
+            model_name='simpletrialbalance',
+            name='account_entity_name_lower_idx',
+        ),
+        # przy cofaniu migracji stary indeks potrzebuje funkcji UNICODE_LOWER
+        migrations.RunPython(migrations.RunPython.noop, unicode_name_index.register_unicode_lower),
+        migrations.AddField(
+            model_name='simpletrialbalance',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=90),
+        ),
+        migrations.RunPython(fill_name_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='simpletrialbalance',
+            index=models.Index(fields=['entity', 'name_key'], name='account_entity_name_key_idx'),
+        ),
+        migrations.RunSQL(change_log.CREATE_TRIGGERS, change_log.DROP_TRIGGERS),
+    ]
@@ -1,19 +1,448 @@
 # Create your models here.
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Cast, Coalesce, Concat, Substr
+
+from .tenancy import current_entity_id, scoped
+
+
+# Hierarchia kont (syntetyczne / analityczne) jako ścieżka materializowana: path to numery kont od korzenia do konta,
+# każdy zapisany na stałej szerokości, np. "0000000100/0000000101/". Potomkowie konta to zakres path na indeksie,
+# a sumy dla całego poziomu liczy jedno zapytanie z GROUP BY po początku ścieżki.
+PATH_SEGMENT_LENGTH = 11
+PATH_END = '~' # znak większy od cyfr i '/' - górna granica zakresu potomków
+
+
+def path_segment(account_number):
+    return f"{int(account_number):010d}/"
+
+
+def fold_name(value):
+    # klucz nazwy do wyszukiwania bez względu na wielkość liter, dla całego Unicode (Ś -> ś, ß -> ss) - liczony w Pythonie,
+    # bo LOWER() w SQLite zamienia tylko litery ASCII; zapisany w kolumnie name_key, więc baza nie potrzebuje własnej funkcji
+    # (zapis nazwy spoza Django, np. przez sqlite3, musi ustawić też name_key, inaczej konto nie zostanie znalezione po nazwie)
+    return value.casefold() if value is not None else None
+
+
+class Entity(models.Model):
+    # jednostka (spółka) z własnym planem kont - konta, salda okresów i migawek są przypisane do jednostki
+    name = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class EntityMember(models.Model):
+    # jednostka, na której pracuje użytkownik; użytkownik bez wpisu pracuje na jednostce domyślnej (settings.DEFAULT_ENTITY_NAME)
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='entity_member')
+    entity = models.ForeignKey(Entity, on_delete=models.PROTECT, related_name='members')
+
+    def __str__(self):
+        return f"{self.user} | {self.entity}"
+
+
+class SimpleTrialBalanceQuerySet(models.QuerySet):
+    # operacje zbiorcze nie wysyłają post_save - zgłaszamy zmianę sami, żeby cache trial balance był unieważniony
+    def update(self, **kwargs):
+        if 'account_name' in kwargs and 'name_key' not in kwargs: # bulk_update podaje oba pola jako wyrażenia CASE
+            # name_key liczy Python - nazwa musi być wartością, a nie wyrażeniem SQL
+            if not isinstance(kwargs['account_name'], str):
+                raise TypeError('account_name can only be updated with a string value.')
+            kwargs['name_key'] = fold_name(kwargs['account_name'])
+        rows = super().update(**kwargs)
+        self._accounts_changed()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create pomija save() - konta bez jednostki trafiają do jednostki bieżącego zakresu, name_key liczymy tutaj
+        objs = list(objs)
+        entity_id = None
+        for obj in objs:
+            obj.name_key = fold_name(obj.account_name)
+            if obj.entity_id is None:
+                entity_id = entity_id or current_entity_id()
+                obj.entity_id = entity_id
+        if 'account_name' in (kwargs.get('update_fields') or ()):
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'name_key']
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._accounts_changed()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if 'account_name' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.name_key = fold_name(obj.account_name)
+            fields.append('name_key')
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        self._accounts_changed()
+        return rows
+
+    def _accounts_changed(self):
+        from .signals import accounts_changed
+        accounts_changed.send(sender=self.model)
+
+    def name_prefix(self, prefix):
+        # wyszukiwanie po początku nazwy bez względu na wielkość liter (także polskich liter) - zakres na name_key
+        # korzysta z indeksu account_entity_name_key_idx (LIKE 'abc%' na SQLite nie użyłby indeksu)
+        prefix = fold_name(prefix)
+        return self.filter(name_key__gte=prefix, name_key__lt=prefix + '\U0010ffff')
+
+    def number_prefix(self, prefix, max_digits=10):
+        # numer konta to liczba, więc "zaczyna się od 12" to suma zakresów 12, 120-129, 1200-1299, ... - każdy z nich
+        # to przedział na unikalnym indeksie (entity, account_number)
+        value = int(prefix)
+        if value <= 0:
+            return self.filter(account_number=value)
+        if len(str(value)) > max_digits: # dłuższy numer nie mieści się w polu, pusty Q() zwróciłby wszystkie konta
+            return self.none()
+        condition = models.Q()
+        for extra_digits in range(max_digits - len(str(value)) + 1):
+            scale = 10 ** extra_digits
+            condition |= models.Q(account_number__gte=value * scale, account_number__lt=(value + 1) * scale)
+        return self.filter(condition)
+
+    def search(self, number_from=None, number_to=None, name=None, nonzero=False, zero=False):
+        # wszystkie filtry da się obsłużyć indeksem: zakres numerów (unikalny indeks jednostka + numer), początek nazwy (jednostka + LOWER(account_name))
+        queryset = self
+        if number_from is not None:
+            queryset = queryset.filter(account_number__gte=number_from)
+        if number_to is not None:
+            queryset = queryset.filter(account_number__lte=number_to)
+        if name:
+            queryset = queryset.name_prefix(name)
+        if nonzero:
+            queryset = queryset.exclude(closing_balance=0)
+        if zero:
+            queryset = queryset.filter(closing_balance=0)
+        return queryset
+
+    def totals(self):
+        # sumy kolumn jednym zapytaniem SELECT SUM(...) - Coalesce, żeby pusta tabela dała 0 a nie None
+        return self.aggregate(**self._totals())
+
+    async def atotals(self):
+        return await self.aaggregate(**self._totals())
+
+    @staticmethod
+    def _totals():
+        return {field: Coalesce(models.Sum(field), 0) for field in ['opening_balance', 'activity', 'closing_balance']}
+
+    def subtotals(self, prefix_length=1):
+        # sumy pośrednie według pierwszych cyfr numeru konta (np. 0 - aktywa trwałe, 1-3 - aktywa obrotowe),
+        # jedno zapytanie z GROUP BY po prefiksie
+        prefix = Substr(Cast('account_number', output_field=models.CharField()), 1, prefix_length)
+        return (
+            self.order_by()
+            .annotate(prefix=prefix)
+            .values('prefix')
+            .annotate(
+                accounts=models.Count('id'),
+                opening_balance=models.Sum('opening_balance'),
+                activity=models.Sum('activity'),
+                closing_balance=models.Sum('closing_balance'),
+            )
+            .order_by('prefix')
+        )
+
+    def descendants_of(self, path):
+        return self.filter(path__gt=path, path__lt=path + PATH_END)
+
+    def rollup(self, parent=None):
+        '''
+        Sumy dla dzieci konta parent (albo kont najwyższego poziomu) razem z całymi poddrzewami, jednym zapytaniem:
+        {path dziecka: {'accounts': ..., 'opening_balance': ..., 'activity': ..., 'closing_balance': ...}}.
+        '''
+        queryset = self.descendants_of(parent.path) if parent is not None else self
+        branch_length = (len(parent.path) if parent is not None else 0) + PATH_SEGMENT_LENGTH
+        rows = (
+            queryset.order_by()
+            .annotate(branch=Substr('path', 1, branch_length))
+            .values('branch')
+            .annotate(
+                accounts=models.Count('id'),
+                opening_balance=models.Sum('opening_balance'),
+                activity=models.Sum('activity'),
+                closing_balance=models.Sum('closing_balance'),
+            )
+        )
+        return {row.pop('branch'): row for row in rows}
+
+    def save_changed(self, accounts, fields):
+        '''
+        Zapis zmienionych kont jednym bulk_update (siatka edycji). Zmiana numeru konta zmienia ścieżkę konta i jego poddrzewa,
+        tak jak save() - konta muszą mieć wczytane konto nadrzędne (select_related('parent')).
+        '''
+        fields = list(fields)
+        moved = []
+        if 'account_number' in fields:
+            for account in accounts:
+                old_path, account.path = account.path, account.build_path()
+                if old_path != account.path:
+                    moved.append((account.entity_id, old_path, account.path))
+            fields.append('path')
+
+        with transaction.atomic():
+            self.bulk_update(accounts, fields, batch_size=500)
+            # najpierw najgłębsze poddrzewa - przesunięcie konta nadrzędnego poprawi potem także ich nowe ścieżki
+            for entity_id, old_path, new_path in sorted(moved, key=lambda paths: len(paths[1]), reverse=True):
+                self.model.all_entities.filter(entity_id=entity_id).descendants_of(old_path).update(
+                    path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1))
+                )
+
+    def delete_in_batches(self, batch_size=500):
+        '''
+        Usuwa konta z querysetu porcjami po batch_size kont, każda porcja w osobnej krótkiej transakcji -
+        blokada zapisu w SQLite jest zwalniana po każdej porcji, więc odczyty trial balance nie czekają na całe usuwanie.
+        '''
+        deleted = 0
+        last = None
+        while True:
+            with transaction.atomic():
+                # od końca ścieżek - analityki są usuwane przed swoimi kontami syntetycznymi (parent ma PROTECT);
+                # ta sama ścieżka może wystąpić w kilku jednostkach, więc kursor to (path, pk)
+                batch = self.order_by('-path', '-pk')
+                if last is not None:
+                    batch = batch.filter(models.Q(path__lt=last[1]) | models.Q(path=last[1], pk__lt=last[0]))
+                rows = list(batch.values_list('pk', 'path')[:batch_size])
+                if not rows:
+                    break
+                count = self._delete_deepest_first(rows)
+            deleted += count
+            last = rows[-1]
+        return deleted
+
+    def _delete_deepest_first(self, rows):
+        # PROTECT zgłasza ProtectedError także wtedy, gdy analityka jest usuwana tym samym delete() co jej konto syntetyczne -
+        # osobne delete() dla każdego poziomu, od najgłębszego; konta jednego poziomu nie są swoimi analitykami
+        by_depth = {}
+        for pk, path in rows:
+            by_depth.setdefault(len(path) // PATH_SEGMENT_LENGTH, []).append(pk)
+        count = 0
+        for depth in sorted(by_depth, reverse=True):
+            count += self.model.all_entities.filter(pk__in=by_depth[depth]).delete()[0]
+        return count
+
+    def post_activity(self, deltas, chunk_size=400):
+        '''
+        Dodaje zmiany {account_number: delta} do activity w jednej transakcji i zwraca {account_number: closing_balance}.
+        Zamiast read-modify-write na każdym koncie robimy UPDATE ... SET activity = activity + CASE ... - baza liczy
+        nową wartość sama, więc równoległe księgowania się nie nadpisują.
+        '''
+        deltas = {int(number): int(delta) for number, delta in deltas.items()}
+        numbers = list(deltas)
+        closing_balances = {}
+
+        with transaction.atomic():
+            for start in range(0, len(numbers), chunk_size):
+                chunk = numbers[start:start + chunk_size]
+                # konta z tą samą zmianą trafiają do jednego WHEN ... IN (...), więc zapytanie rośnie z liczbą różnych kwot, a nie kont
+                by_delta = {}
+                for number in chunk:
+                    by_delta.setdefault(deltas[number], []).append(number)
+                self.filter(account_number__in=chunk).update(activity=models.F('activity') + models.Case(
+                    *[models.When(account_number__in=group, then=models.Value(delta)) for delta, group in by_delta.items()],
+                    default=models.Value(0),
+                    output_field=models.IntegerField(),
+                ))
+                closing_balances.update(
+                    self.filter(account_number__in=chunk).values_list('account_number', 'closing_balance')
+                )
+
+            missing = sorted(set(numbers) - set(closing_balances))
+            if missing:
+                # wyjątek wycofuje całą transakcję - albo księgujemy wszystko, albo nic
+                raise self.model.DoesNotExist(f"Unknown account numbers: {', '.join(map(str, missing))}")
+
+        return closing_balances
+
+
+class EntityScopedManager(models.Manager.from_queryset(SimpleTrialBalanceQuerySet)):
+    # konta tylko bieżącej jednostki (account/tenancy.py); bez ustawionego zakresu - wszystkie
+    def get_queryset(self):
+        return scoped(super().get_queryset())
+
 
 class SimpleTrialBalance(models.Model):
+    entity = models.ForeignKey(Entity, on_delete=models.PROTECT, related_name='accounts', editable=False) # ustawiana w save() z bieżącego zakresu
     account_name = models.CharField(max_length=30)
-    account_number = models.IntegerField()
+    account_number = models.IntegerField() # unikalny w obrębie jednostki - account_entity_number_unique
     opening_balance = models.IntegerField()
     activity = models.IntegerField()
-    closing_balance = models.IntegerField(editable=False) # (1) editable=False - uniemożliwa ręczne wprowadzanie pola, (2) to pole zostanie excludowane na poziomie formularza
+    closing_balance = models.GeneratedField( # kolumna liczona przez bazę danych - zawsze zgodna z opening_balance + activity, także po update()/bulk_update()/bulk_create()
+        expression=models.F('opening_balance') + models.F('activity'),
+        output_field=models.IntegerField(),
+        db_persist=True, # wartość zapisana w tabeli (STORED), więc można ją indeksować i sortować bez liczenia przy każdym odczycie
+    )
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.PROTECT, related_name='children') # konto syntetyczne, PROTECT - nie usuniemy konta, które ma analityki
+    path = models.CharField(max_length=255, editable=False, default='') # ścieżka materializowana, ustawiana w save()
+    name_key = models.CharField(max_length=90, editable=False, default='') # fold_name(account_name), ustawiany w save() i operacjach zbiorczych; casefold może wydłużyć nazwę
+
+    objects = EntityScopedManager() # domyślny manager - widoki, formularze i get_object_or_404 widzą tylko konta jednostki użytkownika
+    all_entities = SimpleTrialBalanceQuerySet.as_manager() # operacje na całej tabeli (zamknięcie okresu)
+
+    class Meta:
+        ordering = ['account_number'] # kolejność zgodna z unikalnym indeksem (entity, account_number) - bez sortowania w pamięci
+        # każdy indeks zaczyna się od entity: zapytanie jednej jednostki czyta tylko jej fragment indeksu,
+        # więc jest tak samo szybkie jak przy jednej jednostce w tabeli, niezależnie od liczby jednostek
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'account_number'], name='account_entity_number_unique'), # wyszukiwanie, sortowanie i upsert po numerze konta
+        ]
+        indexes = [
+            models.Index(fields=['entity', 'name_key'], name='account_entity_name_key_idx'), # początek nazwy i sortowanie po nazwie
+            models.Index(fields=['entity', 'closing_balance'], name='account_entity_closing_idx'),
+            models.Index(fields=['entity', 'path'], name='account_entity_path_idx'),
+        ]
+
+    def build_path(self):
+        return (self.parent.path if self.parent_id else '') + path_segment(self.account_number)
+
+    def save(self, *args, **kwargs):
+        # zmiana numeru albo konta nadrzędnego przesuwa całe poddrzewo - ścieżki potomków poprawia jeden UPDATE
+        old_path = self.path
+        self.path = self.build_path()
+        self.name_key = fold_name(self.account_name)
+        if 'account_name' in (kwargs.get('update_fields') or ()):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'name_key'}
+        if self.entity_id is None:
+            self.entity_id = current_entity_id()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.path:
+                SimpleTrialBalance.all_entities.filter(entity_id=self.entity_id).descendants_of(old_path).update(
+                    path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1))
+                )
 
-    def save(self, *args, **kwargs): # nadpisanie metody save, spowoduje zapisanie closing_blanace w bazie danych
-        self.closing_balance = self.opening_balance + self.activity
-        super().save(*args, **kwargs)
-    
     def __str__(self):
         return f"{self.account_name} | {self.account_number}"
     
     def __repr__(self):
         return f"{self.account_name} | {self.account_number} | {self.opening_balance} | {self.activity} | {self.closing_balance}"
+
+
+class AccountingPeriod(models.Model):
+    name = models.CharField(max_length=30, unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False) # None - okres otwarty, jego salda to bieżąca tabela SimpleTrialBalance
+
+    class Meta:
+        ordering = ['start_date']
+
+    def __str__(self):
+        return f"{self.name} | {self.start_date} - {self.end_date}"
+
+    @property
+    def is_closed(self):
+        return self.closed_at is not None
+
+
+class PeriodBalance(models.Model):
+    # salda kont zamrożone przy zamknięciu okresu; numer i nazwa konta są skopiowane, a nie powiązane kluczem obcym,
+    # żeby historia przetrwała usunięcie albo zmianę konta
+    period = models.ForeignKey(AccountingPeriod, on_delete=models.CASCADE, related_name='balances')
+    entity = models.ForeignKey(Entity, on_delete=models.PROTECT, related_name='+')
+    account_number = models.IntegerField()
+    account_name = models.CharField(max_length=30)
+    opening_balance = models.IntegerField()
+    activity = models.IntegerField()
+    closing_balance = models.GeneratedField(
+        expression=models.F('opening_balance') + models.F('activity'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        ordering = ['period', 'account_number']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'entity', 'account_number'], name='period_balance_account_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.period.name} | {self.account_name} | {self.account_number}"
+
+
+class JournalEntry(models.Model):
+    description = models.CharField(max_length=100, blank=True)
+    posted_at = models.DateTimeField(auto_now_add=True)
+    posted_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    period = models.ForeignKey( # None - wpis należy do otwartego okresu; przy zamknięciu okresu wpisy są do niego przypisywane
+        AccountingPeriod, null=True, blank=True, on_delete=models.PROTECT, related_name='journal_entries'
+    )
+
+    class Meta:
+        ordering = ['posted_at', 'id']
+
+    def __str__(self):
+        return f"{self.posted_at:%Y-%m-%d %H:%M} | {self.description}"
+
+
+class JournalLine(models.Model):
+    entry = models.ForeignKey(JournalEntry, on_delete=models.CASCADE, related_name='lines')
+    account = models.ForeignKey(SimpleTrialBalance, on_delete=models.PROTECT, related_name='journal_lines') # konta z zapisami nie usuniemy
+    amount = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.account_id} | {self.amount}"
+
+
+class AccountChange(models.Model):
+    # dziennik zmian SimpleTrialBalance, tylko dopisywany - wiersze wstawiają triggery bazy (migracja 0008),
+    # więc obejmuje też update(), bulk_update() i bulk_create(), które omijają save() i sygnały;
+    # przechowuje stan konta po zmianie, deleted=True oznacza usunięcie konta (albo zmianę jego numeru)
+    entity = models.ForeignKey(Entity, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False) # dziennik bez klucza obcego w bazie, jak numery kont
+    account_number = models.IntegerField()
+    account_name = models.CharField(max_length=30)
+    opening_balance = models.IntegerField()
+    activity = models.IntegerField()
+    created = models.BooleanField(default=False) # nowe konto (albo konto pod nowym numerem) - od migracji 0010
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['entity', 'id'], name='account_change_entity_idx'), # zmiany jednej jednostki po kursorze (historia, strumień SSE)
+        ]
+
+    def __str__(self):
+        return f"{self.changed_at} | {self.account_number} | {'deleted' if self.deleted else self.account_name}"
+
+
+class TrialBalanceSnapshot(models.Model):
+    taken_at = models.DateTimeField(db_index=True)
+    last_change_id = models.BigIntegerField(default=0) # ostatni AccountChange zawarty w migawce - odtwarzanie zaczyna się od następnego
+
+    class Meta:
+        ordering = ['taken_at', 'id']
+
+    def __str__(self):
+        return f"{self.taken_at:%Y-%m-%d %H:%M}"
+
+
+class SnapshotBalance(models.Model):
+    # zwarta kopia sald (bez hierarchii i identyfikatorów kont), tak jak PeriodBalance
+    snapshot = models.ForeignKey(TrialBalanceSnapshot, on_delete=models.CASCADE, related_name='balances')
+    entity = models.ForeignKey(Entity, on_delete=models.PROTECT, related_name='+')
+    account_number = models.IntegerField()
+    account_name = models.CharField(max_length=30)
+    opening_balance = models.IntegerField()
+    activity = models.IntegerField()
+    closing_balance = models.GeneratedField(
+        expression=models.F('opening_balance') + models.F('activity'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        ordering = ['snapshot', 'account_number']
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'entity', 'account_number'], name='snapshot_balance_account_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.snapshot} | {self.account_name} | {self.account_number}"
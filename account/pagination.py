@@ -0,0 +1,130 @@
+import base64
+import json
+
+from django.db import models
+from django.db.models import Q
+
+
+# Paginacja keyset (kursorowa) - zamiast OFFSET filtrujemy po kluczu ostatniego wiersza z poprzedniej strony,
+# dzięki temu koszt pobrania strony jest taki sam niezależnie od tego jak daleko jesteśmy w tabeli
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, types):
+    # types - oczekiwany typ każdej wartości klucza (int, str); zwraca None dla uszkodzonego albo podmienionego kursora -
+    # widok pokaże wtedy pierwszą stronę zamiast błędu przy porównaniu w zapytaniu
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+    # bool jest podklasą int w Pythonie, ale w kursorze zawsze oznacza podmienioną wartość
+    if not all(isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(values, types)):
+        return None
+    return values
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    '''
+    ordering - krotka pól, ostatnie pole musi być unikalne (np. id), '-pole' oznacza sortowanie malejące.
+    '''
+    def __init__(self, queryset, ordering=('account_number', 'id'), page_size=50):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+
+    def page(self, after=None, before=None):
+        queryset, after, forward = self._page_query(after, before)
+        return self._build_page(list(queryset), after, forward)
+
+    async def apage(self, after=None, before=None):
+        # to samo dla widoków async - wiersze pobierane przez async ORM
+        queryset, after, forward = self._page_query(after, before)
+        return self._build_page([row async for row in queryset], after, forward)
+
+    def _page_query(self, after, before):
+        types = self._value_types()
+        after = decode_cursor(after, types)
+        before = decode_cursor(before, types) if after is None else None
+
+        forward = before is None
+        queryset = self.queryset
+        if after is not None:
+            queryset = queryset.filter(self._seek(after, forward=True))
+        elif before is not None:
+            queryset = queryset.filter(self._seek(before, forward=False))
+
+        ordering = self.ordering if forward else tuple(self._flip(field) for field in self.ordering)
+        return queryset.order_by(*ordering)[:self.page_size + 1], after, forward # jeden wiersz więcej mówi nam czy jest kolejna strona
+
+    def _build_page(self, rows, after, forward):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if forward:
+            has_next, has_previous = has_more, after is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.cursor_for(rows[-1]) if rows and has_next else None,
+            previous_cursor=self.cursor_for(rows[0]) if rows and has_previous else None,
+        )
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, field.lstrip('-')) for field in self.ordering)
+
+    def _value_types(self):
+        # typ wartości każdego pola klucza - pole modelu (np. name_key) albo adnotacja z wyrażeniem
+        types = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            annotation = self.queryset.query.annotations.get(name)
+            model_field = annotation.output_field if annotation is not None else self.queryset.model._meta.get_field(name)
+            if isinstance(model_field, models.GeneratedField):
+                model_field = model_field.output_field
+            types.append(str if isinstance(model_field, (models.CharField, models.TextField)) else int)
+        return types
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _seek(self, values, forward):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y) - rozpisane tak, żeby baza mogła użyć indeksu
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
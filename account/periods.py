@@ -0,0 +1,89 @@
+import calendar
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AccountingPeriod, JournalEntry, PeriodBalance, SimpleTrialBalance
+
+
+class PeriodClosedError(Exception):
+    pass
+
+
+class PeriodOrderError(PeriodClosedError):
+    # zamykany okres nie jest najwcześniejszym otwartym - salda kont należą do wcześniejszego okresu
+    pass
+
+
+def close_period(period, next_name=None):
+    '''
+    Zamknięcie okresu w jednej transakcji, bez wczytywania kont do Pythona:
+    Okresy są wspólne dla wszystkich jednostek - zamknięcie obejmuje konta każdej jednostki, dlatego widoki okresów
+    są tylko dla superużytkownika (SuperuserRequiredMixin).
+    1. INSERT ... SELECT - salda wszystkich kont zapisane jako PeriodBalance zamykanego okresu,
+    2. UPDATE - closing_balance staje się opening_balance następnego okresu, activity wraca do zera,
+       a wpisy dziennika bez okresu zostają przypisane do zamykanego okresu,
+    3. okres oznaczony jako zamknięty, następny okres utworzony jeśli jeszcze nie istnieje.
+    Zamykać można tylko najwcześniejszy otwarty okres - inaczej PeriodOrderError.
+    Zwraca następny (otwarty) okres.
+    '''
+    with transaction.atomic():
+        period = AccountingPeriod.objects.select_for_update().get(pk=period.pk)
+        if period.is_closed:
+            raise PeriodClosedError(f"Period {period.name} is already closed.")
+        earlier = AccountingPeriod.objects.filter(closed_at__isnull=True, start_date__lt=period.start_date).first()
+        if earlier is not None:
+            raise PeriodOrderError(f"Period {earlier.name} must be closed before {period.name}.")
+
+        _copy_balances(period)
+        SimpleTrialBalance.all_entities.update(opening_balance=F('closing_balance'), activity=0)
+        JournalEntry.objects.filter(period__isnull=True).update(period=period) # activity = 0 odpowiada pustemu dziennikowi nowego okresu
+
+        period.closed_at = timezone.now()
+        period.save(update_fields=['closed_at'])
+
+        next_period = AccountingPeriod.objects.filter(start_date__gt=period.end_date).first()
+        if next_period is None:
+            start_date, end_date = _next_period_dates(period)
+            next_period = AccountingPeriod.objects.create(
+                name=next_name or start_date.isoformat(),
+                start_date=start_date,
+                end_date=end_date,
+            )
+    return next_period
+
+
+def _next_period_dates(period):
+    # okres z pełnych miesięcy (np. miesiąc, kwartał) -> następny ma tyle samo pełnych miesięcy,
+    # inaczej następny okres ma tyle samo dni; zawsze zaczyna się dzień po zamkniętym
+    start_date = period.end_date + timedelta(days=1)
+    whole_months = period.start_date.day == 1 and start_date.day == 1
+    if not whole_months:
+        return start_date, start_date + (period.end_date - period.start_date)
+
+    months = (period.end_date.year - period.start_date.year) * 12 + period.end_date.month - period.start_date.month + 1
+    last_month = start_date.month - 1 + months - 1
+    year, month = start_date.year + last_month // 12, last_month % 12 + 1
+    return start_date, date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _copy_balances(period):
+    PeriodBalance.objects.filter(period=period).delete()
+    copy_balances(PeriodBalance, 'period', period.pk)
+
+
+def copy_balances(model, owner_field, owner_pk):
+    # ORM nie ma INSERT ... SELECT, a przepisywanie 100k wierszy przez Pythona trwałoby minuty - jedno zapytanie SQL;
+    # model - tabela kopii sald (PeriodBalance, SnapshotBalance), owner_field - klucz obcy do okresu / migawki
+    quote = connection.ops.quote_name
+    columns = ['entity_id', 'account_number', 'account_name', 'opening_balance', 'activity']
+    column_list = ', '.join(quote(column) for column in columns)
+    owner_column = model._meta.get_field(owner_field).column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(model._meta.db_table)} ({quote(owner_column)}, {column_list}) "
+            f"SELECT %s, {column_list} FROM {quote(SimpleTrialBalance._meta.db_table)}",
+            [owner_pk],
+        )
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+
+SESSION_KEY = '_group_names'
+VERSION_CACHE_KEY = 'group_membership_version'
+
+
+# Nazwy grup użytkownika pobieramy jednym zapytaniem i zapamiętujemy na obiekcie user - request.user jest tym samym
+# obiektem w widoku i w formularzu, więc każde kolejne sprawdzenie w tym samym requeście nie odpytuje już bazy.
+# Opcjonalnie (GROUP_NAMES_SESSION_CACHE) nazwy trafiają też do sesji, razem z wersją członkostwa z cache,
+# którą podbija sygnał przy każdej zmianie grup (account/signals.py).
+
+def get_group_names(user, session=None):
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, '_group_names_cache', None)
+    if names is not None:
+        return names
+
+    use_session = session is not None and settings.GROUP_NAMES_SESSION_CACHE
+    if use_session:
+        version = cache.get_or_set(VERSION_CACHE_KEY, 1)
+        stored = session.get(SESSION_KEY)
+        if stored and stored.get('user') == user.pk and stored.get('version') == version:
+            names = frozenset(stored['names'])
+
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        if use_session:
+            session[SESSION_KEY] = {'user': user.pk, 'version': version, 'names': sorted(names)}
+
+    user._group_names_cache = names
+    return names
+
+
+def user_in_group(user, group_name, session=None):
+    return group_name in get_group_names(user, session)
+
+
+def invalidate_group_names(user=None):
+    # zmiana członkostwa - nowa wersja unieważnia dane zapisane w sesjach wszystkich użytkowników
+    if user is not None:
+        user.__dict__.pop('_group_names_cache', None)
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError: # klucza jeszcze nie ma w cache
+        cache.set(VERSION_CACHE_KEY, 2)
+
+
+class GroupRequiredMixin:
+    required_group = 'all_permissions'
+
+    def dispatch(self, request, *args, **kwargs):
+        if not user_in_group(request.user, self.required_group, request.session): # jeśli użytkownik nie należy do wymaganej grupy to dostanie 403
+            raise PermissionDenied # django w ten sposób przekieruje do 403.html zapisanego w tamples (nadpisanego)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class SuperuserRequiredMixin:
+    # operacje na danych wszystkich jednostek (okresy są wspólne, zamknięcie okresu zmienia konta każdej jednostki) -
+    # tylko administrator całej aplikacji, członkostwo w grupie 'all_permissions' jednej jednostki nie wystarcza
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+
+from .caching import bump_data_version
+
+
+# Odczyty raportów (trial balance, eksporty, porównania) idą do repliki, wszystko inne - w tym każdy zapis - do bazy głównej.
+# O tym, czy dany request czyta z repliki, decyduje middleware (widoki z ReadReplicaMixin, tylko GET/HEAD),
+# a router tylko odczytuje ustawiony alias. Po udanym zapisie sesja przez REPLICA_STICKY_SECONDS czyta z bazy głównej,
+# żeby użytkownik od razu zobaczył własne zmiany (replika jest odświeżana co jakiś czas - refresh_replica).
+
+read_alias = ContextVar('read_alias', default=None)
+
+STICKY_SESSION_KEY = 'replica_sticky_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_alias():
+    # None - replika wyłączona albo jeszcze nie skopiowana (brak pliku), wtedy raporty czytają z bazy głównej
+    alias = settings.READ_REPLICA
+    if not alias:
+        return None
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db() and not os.path.exists(connection.settings_dict['NAME']):
+        return None
+    return alias
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias.get() # None - decyzję podejmuje Django (baza instancji z hints albo default)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True # replika to kopia bazy głównej - obiekty z obu baz mogą być ze sobą powiązane
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS # schemat repliki przychodzi razem z danymi przy kopiowaniu
+
+
+class ReadReplicaMixin:
+    # widok tylko do odczytu - jego zapytania mogą iść do repliki
+    read_replica = True
+
+
+class ReplicaRoutingMiddleware:
+    # działa w obu trybach - pod ASGI widoki async nie przechodzą przez dodatkowy wątek tylko z powodu tego middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_alias.set(None)
+        try:
+            response = self.get_response(request)
+            alias = read_alias.get()
+        finally:
+            read_alias.reset(token)
+        return self.finish_response(request, response, alias)
+
+    async def __acall__(self, request):
+        token = read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+            alias = read_alias.get()
+        finally:
+            read_alias.reset(token)
+        if request.method in SAFE_METHODS:
+            return self.finish_response(request, response, alias)
+        return await sync_to_async(self.finish_response)(request, response, alias) # zapis w sesji może ją wczytać z bazy
+
+    def finish_response(self, request, response, alias):
+        if alias and response.streaming:
+            # treść strumienia (eksport CSV) jest czytana już po wyjściu z middleware - tam też ustawiamy replikę
+            stream = astream_with if response.is_async else stream_with
+            response.streaming_content = stream(read_alias, alias, response.streaming_content)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and hasattr(request, 'session'):
+            request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method not in ('GET', 'HEAD') or not getattr(view_class, 'read_replica', False):
+            return None
+        if hasattr(request, 'session') and request.session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None # read-your-writes: sesja niedawno coś zapisała
+        read_alias.set(replica_alias())
+        return None
+
+
+def stream_with(var, value, content):
+    # kolejne porcje strumienia są liczone z ustawioną zmienną kontekstu (alias repliki, zakres jednostki)
+    iterator = iter(content)
+    while True:
+        token = var.set(value)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            var.reset(token)
+        yield chunk
+
+
+async def astream_with(var, value, content):
+    iterator = aiter(content)
+    while True:
+        token = var.set(value)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            var.reset(token)
+        yield chunk
+
+
+def refresh_replica(target=None, pages=1024):
+    '''
+    Kopiuje bazę główną do pliku repliki (target - domyślnie plik aliasu READ_REPLICA) przez backup API SQLite
+    (porcjami po pages stron, zapisy w bazie głównej nie są wstrzymywane). Po kopii podbija wersję danych - fragmenty wyrenderowane ze starej repliki przestają obowiązywać.
+    '''
+    target = target or connections[settings.READ_REPLICA].settings_dict['NAME']
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.in_atomic_block: # backup czeka na zakończenie otwartej transakcji zapisu na tym samym połączeniu
+        raise TransactionManagementError("refresh_replica() cannot run inside a transaction.")
+    source.ensure_connection()
+    replica = sqlite3.connect(target)
+    try:
+        source.connection.backup(replica, pages=pages)
+    finally:
+        replica.close()
+    bump_data_version()
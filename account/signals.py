@@ -0,0 +1,42 @@
+from functools import partial
+
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .caching import bump_data_version
+from .permissions import invalidate_group_names
+
+
+# wysyłany przez operacje zbiorcze na kontach (update, bulk_create, bulk_update), które pomijają post_save
+accounts_changed = Signal()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_group_names(instance if isinstance(instance, User) else None)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_group_names()
+
+
+@receiver(post_save, sender='account.SimpleTrialBalance')
+@receiver(post_delete, sender='account.SimpleTrialBalance')
+@receiver(post_save, sender='account.EntityMember') # zmiana jednostki użytkownika - fragmenty w cache są zapamiętane per użytkownik
+@receiver(post_delete, sender='account.EntityMember')
+@receiver(accounts_changed)
+def trial_balance_changed(sender, **kwargs):
+    bump_data_version()
+
+
+@receiver(post_save, sender='account.SimpleTrialBalance')
+@receiver(post_delete, sender='account.SimpleTrialBalance')
+@receiver(accounts_changed)
+def publish_live_update(sender, instance=None, **kwargs):
+    # strumienie SSE (account/live.py) budzimy dopiero po commicie - wtedy zmiana jest już widoczna w dzienniku AccountChange
+    from .live import notify_change
+    transaction.on_commit(partial(notify_change, instance.entity_id if instance is not None else None))
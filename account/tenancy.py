@@ -0,0 +1,159 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+
+
+# Jednostki (Entity) - każda ma własny plan kont. Zakres bieżącej jednostki ustawia middleware na czas requestu
+# (komendy - using_entity), a domyślny manager SimpleTrialBalance.objects sam dokłada filtr entity_id,
+# więc widoki i formularze nie muszą o nim pamiętać. Bez ustawionego zakresu (komendy, migracje) widać wszystkie jednostki.
+# Wszystkie indeksy kont zaczynają się od entity - zapytanie jednej jednostki korzysta z indeksu tak jak przy jednej tabeli.
+
+current_scope = ContextVar('entity_scope', default=None)
+
+
+class EntityScope:
+    '''
+    Zakres jednostki: stałe entity_id (komendy, testy) albo użytkownik requestu - jego jednostka jest wtedy
+    podzapytaniem w SQL, więc zwykły odczyt kont nie potrzebuje osobnego zapytania o członkostwo.
+    Użytkownik bez przypisanej jednostki (i niezalogowany) widzi jednostkę domyślną (settings.DEFAULT_ENTITY_NAME).
+    '''
+    def __init__(self, entity_id=None, user=None):
+        self.entity_id = entity_id
+        self.user = user
+        self._resolved = None
+
+    def expression(self):
+        from .models import Entity, EntityMember
+
+        if self.entity_id is not None:
+            return self.entity_id
+        default = Subquery(Entity.objects.filter(name=settings.DEFAULT_ENTITY_NAME).values('pk')[:1])
+        if self.user is None or not self.user.is_authenticated:
+            return default
+        member = Subquery(EntityMember.objects.filter(user_id=self.user.pk).values('entity_id')[:1])
+        return Coalesce(member, default)
+
+    def resolve(self):
+        # id jednostki - potrzebne przy zapisie nowych kont i w zapytaniach SQL pisanych ręcznie; liczone raz na zakres
+        if self.entity_id is not None:
+            return self.entity_id
+        if self._resolved is None:
+            from .models import Entity
+            self._resolved = Entity.objects.filter(pk=self.expression()).values_list('pk', flat=True).first()
+            if self._resolved is None: # pusta baza - jednostka domyślna jeszcze nie istnieje
+                self._resolved = Entity.objects.get_or_create(name=settings.DEFAULT_ENTITY_NAME)[0].pk
+        return self._resolved
+
+    @property
+    def cache_key(self):
+        # część klucza cache - bez zapytania do bazy
+        if self.entity_id is not None:
+            return f'entity:{self.entity_id}'
+        if self.user is None or not self.user.is_authenticated:
+            return 'entity:default'
+        return f'user:{self.user.pk}'
+
+
+def scope_cache_key():
+    scope = current_scope.get()
+    return scope.cache_key if scope is not None else 'entity:all'
+
+
+def current_entity_id():
+    '''
+    Id jednostki bieżącego zakresu, a bez zakresu - jednostki domyślnej (zapis nowych kont).
+    '''
+    scope = current_scope.get() or EntityScope()
+    return scope.resolve()
+
+
+def entity_expression():
+    # to samo jako wyrażenie do filtra ORM - jednostka wyliczana przez bazę w tym samym zapytaniu
+    scope = current_scope.get() or EntityScope()
+    return scope.expression()
+
+
+def entity_sql():
+    '''
+    (sql, params) z id jednostki bieżącego zakresu do zapytań SQL pisanych ręcznie, np. "entity_id = {sql}".
+    '''
+    from .models import Entity
+
+    scope = current_scope.get() or EntityScope()
+    if scope.entity_id is not None:
+        return '%s', [scope.entity_id]
+    sql, params = Entity.objects.filter(pk=scope.expression()).order_by().values('pk').query.sql_with_params()
+    return f'({sql})', list(params)
+
+
+def scoped(queryset, field='entity_id'):
+    # filtr jednostki dla modeli bez własnego managera z zakresem (historia sald, okresy)
+    scope = current_scope.get()
+    if scope is None:
+        return queryset
+    return queryset.filter(**{field: scope.expression()})
+
+
+def get_entity(name=None):
+    '''
+    Jednostka o podanej nazwie (komendy: --entity), bez nazwy - jednostka domyślna, tworzona jeśli jeszcze nie istnieje.
+    Nieznana nazwa - Entity.DoesNotExist.
+    '''
+    from .models import Entity
+
+    if not name or name == settings.DEFAULT_ENTITY_NAME:
+        return Entity.objects.get_or_create(name=settings.DEFAULT_ENTITY_NAME)[0]
+    return Entity.objects.get(name=name)
+
+
+@contextmanager
+def using_entity(entity):
+    # zakres jednostki poza requestem, np. w komendach: with using_entity(entity): ...
+    token = current_scope.set(EntityScope(entity_id=getattr(entity, 'pk', entity)))
+    try:
+        yield
+    finally:
+        current_scope.reset(token)
+
+
+class EntityScopeMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        scope = EntityScope(user=request.user) # request.user jest leniwy - użytkownik wczytywany dopiero przy pierwszym zapytaniu o konta
+        token = current_scope.set(scope)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_scope.reset(token)
+        return self.finish_response(response, scope)
+
+    async def __acall__(self, request):
+        scope = EntityScope(user=await request.auser()) # w widokach async leniwy request.user odpytałby bazę w pętli zdarzeń
+        token = current_scope.set(scope)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_scope.reset(token)
+        return self.finish_response(response, scope)
+
+    def finish_response(self, response, scope):
+        from .routing import astream_with, stream_with
+
+        if response.streaming:
+            # eksport CSV czyta konta już po wyjściu z middleware - zakres musi obowiązywać także wtedy
+            stream = astream_with if response.is_async else stream_with
+            response.streaming_content = stream(current_scope, scope, response.streaming_content)
+        return response
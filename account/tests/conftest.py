@@ -0,0 +1,16 @@
+import pytest
+from django.core.cache import caches
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # baza jest cofana po każdym teście, cache nie - czyścimy go, żeby test nie dostał danych z poprzedniego
+    for cache in caches.all():
+        cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def primary_database_only(settings):
+    # testy korzystają z jednej bazy; testy routingu włączają replikę same (django_db(databases=[..., 'replica']))
+    settings.READ_REPLICA = None
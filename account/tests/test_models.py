@@ -1,8 +1,10 @@
+import io
 import pytest
 from django.contrib.auth.models import User, Group, Permission
 from django.urls import reverse
 
 from account.models import SimpleTrialBalance
+from account.tenancy import using_entity
 from account.forms import *
 
 
@@ -54,3 +56,496 @@ def test_trial_balance_3():
     
     activity_total = int(opening_balance_var) + int(activity_var)
     assert repr(trial_balance) == f"{account_name_var} | {account_number_var} | {opening_balance_var} | {activity_var} | {activity_total}"
+
+@pytest.mark.django_db
+def test_trial_balance_4():
+    # closing_balance liczy baza - zostaje poprawne także po update() i bulk_update(), które pomijają save()
+    from django.db.models import F
+
+    account_1 = SimpleTrialBalance.objects.create(account_name="account_1", account_number=100, opening_balance=100, activity=10)
+    account_2 = SimpleTrialBalance.objects.create(account_name="account_2", account_number=200, opening_balance=0, activity=0)
+
+    SimpleTrialBalance.objects.filter(id=account_1.id).update(activity=F("activity") + 5)
+
+    account_2.opening_balance = 50
+    SimpleTrialBalance.objects.bulk_update([account_2], ["opening_balance"])
+
+    assert SimpleTrialBalance.objects.get(id=account_1.id).closing_balance == 115
+    assert SimpleTrialBalance.objects.get(id=account_2.id).closing_balance == 50
+
+@pytest.mark.django_db
+def test_trial_balance_5():
+    # bulk_create - closing_balance dostępne od razu po zapisie
+    SimpleTrialBalance.objects.bulk_create([
+        SimpleTrialBalance(account_name="account_1", account_number=100, opening_balance=100, activity=-30),
+    ])
+
+    assert SimpleTrialBalance.objects.get(account_number=100).closing_balance == 70
+
+@pytest.mark.django_db
+def test_post_activity_1():
+    # księgowanie zmian dla wielu kont - closing_balance zwracane po aktualizacji
+    SimpleTrialBalance.objects.create(account_name="account_1", account_number=100, opening_balance=100, activity=10)
+    SimpleTrialBalance.objects.create(account_name="account_2", account_number=200, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account_3", account_number=300, opening_balance=5, activity=0)
+
+    closing_balances = SimpleTrialBalance.objects.post_activity({100: 5, "200": 5, 300: -10}, chunk_size=2)
+
+    assert closing_balances == {100: 115, 200: 5, 300: -5}
+    assert SimpleTrialBalance.objects.get(account_number=100).activity == 15
+
+@pytest.mark.django_db
+def test_post_activity_2():
+    # nieznane konto - nic nie zostaje zaksięgowane
+    SimpleTrialBalance.objects.create(account_name="account_1", account_number=100, opening_balance=100, activity=10)
+
+    with pytest.raises(SimpleTrialBalance.DoesNotExist):
+        SimpleTrialBalance.objects.post_activity({100: 5, 999: 1})
+
+    assert SimpleTrialBalance.objects.get(account_number=100).activity == 10
+
+@pytest.mark.django_db
+def test_trial_balance_unique_number():
+    # numer konta musi być unikalny
+    from django.db import IntegrityError
+
+    SimpleTrialBalance.objects.create(account_name="account_1", account_number=100, opening_balance=0, activity=0)
+    with pytest.raises(IntegrityError):
+        SimpleTrialBalance.objects.create(account_name="account_2", account_number=100, opening_balance=0, activity=0)
+
+@pytest.mark.django_db
+def test_trial_balance_name_prefix():
+    # wyszukiwanie po początku nazwy - bez względu na wielkość liter i przez indeks na (entity, name_key)
+    from django.db import connection
+
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=100, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="cash register", account_number=101, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Bank", account_number=130, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Środki trwałe", account_number=10, opening_balance=0, activity=0)
+
+    # polskie litery bez względu na wielkość - LOWER w SQLite zamienia tylko ASCII
+    for prefix in ["Śr", "Ś", "środ", "ŚRODKI T"]:
+        assert [account.account_number for account in SimpleTrialBalance.objects.name_prefix(prefix)] == [10]
+
+    # indeks zaczyna się od jednostki - zapytania idą w zakresie jednostki, tak jak w widokach
+    with using_entity(SimpleTrialBalance.objects.get(account_number=100).entity_id):
+        accounts = SimpleTrialBalance.objects.name_prefix("CAS")
+        assert [account.account_number for account in accounts] == [100, 101]
+        sql, params = accounts.values("id").query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = " ".join(str(row) for row in cursor.fetchall())
+    assert "account_entity_name_key_idx" in plan
+
+@pytest.mark.django_db
+def test_trial_balance_name_key():
+    """
+    name_key jest aktualny po każdym rodzaju zapisu, a schemat bazy nie wymaga funkcji spoza SQLite
+    (zapis przez sqlite3 albo dbshell działa bez rejestrowania funkcji).
+    """
+    from django.db import connection
+
+    account = SimpleTrialBalance.objects.create(account_name="Żywność", account_number=100, opening_balance=0, activity=0)
+    assert account.name_key == "żywność"
+
+    SimpleTrialBalance.objects.filter(pk=account.pk).update(account_name="STRAẞE")
+    assert SimpleTrialBalance.objects.get(pk=account.pk).name_key == "strasse"
+
+    account.account_name = "Środki"
+    SimpleTrialBalance.objects.bulk_update([account], ["account_name"])
+    assert SimpleTrialBalance.objects.get(pk=account.pk).name_key == "środki"
+
+    SimpleTrialBalance.objects.bulk_create(
+        [SimpleTrialBalance(account_name="ŁÓDŹ", account_number=100, opening_balance=0, activity=0)],
+        update_conflicts=True, unique_fields=["entity", "account_number"], update_fields=["account_name"],
+    )
+    assert SimpleTrialBalance.objects.get(pk=account.pk).name_key == "łódź"
+
+    account.refresh_from_db()
+    account.account_name = "Bank"
+    account.save(update_fields=["account_name"])
+    assert [account.account_number for account in SimpleTrialBalance.objects.name_prefix("BA")] == [100]
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = 'account_simpletrialbalance' AND sql IS NOT NULL")
+        assert not any("UNICODE_LOWER" in sql for sql, in cursor.fetchall())
+        cursor.execute("PRAGMA integrity_check")
+        assert cursor.fetchone() == ("ok",)
+
+@pytest.mark.django_db
+def test_trial_balance_totals(django_assert_num_queries):
+    # sumy i sumy pośrednie - każde jednym zapytaniem
+    SimpleTrialBalance.objects.create(account_name="Land", account_number=10, opening_balance=100, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Buildings", account_number=20, opening_balance=50, activity=-5)
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=100, opening_balance=10, activity=30)
+
+    with django_assert_num_queries(1):
+        totals = SimpleTrialBalance.objects.totals()
+    assert totals == {"opening_balance": 160, "activity": 25, "closing_balance": 185}
+
+    with django_assert_num_queries(1):
+        subtotals = list(SimpleTrialBalance.objects.subtotals(prefix_length=1))
+    assert subtotals == [
+        {"prefix": "1", "accounts": 2, "opening_balance": 110, "activity": 30, "closing_balance": 140},
+        {"prefix": "2", "accounts": 1, "opening_balance": 50, "activity": -5, "closing_balance": 45},
+    ]
+
+    assert SimpleTrialBalance.objects.filter(account_number__gt=1000).totals() == {"opening_balance": 0, "activity": 0, "closing_balance": 0}
+
+@pytest.mark.django_db
+def test_trial_balance_hierarchy_1():
+    # ścieżka materializowana - zmiana konta nadrzędnego przesuwa całe poddrzewo
+    fixed = SimpleTrialBalance.objects.create(account_name="Fixed assets", account_number=10, opening_balance=0, activity=0)
+    land = SimpleTrialBalance.objects.create(account_name="Land", account_number=11, opening_balance=100, activity=0, parent=fixed)
+    plot = SimpleTrialBalance.objects.create(account_name="Plot A", account_number=111, opening_balance=40, activity=0, parent=land)
+    other = SimpleTrialBalance.objects.create(account_name="Other", account_number=20, opening_balance=0, activity=0)
+
+    assert plot.path == "0000000010/0000000011/0000000111/"
+
+    land.parent = other
+    land.save()
+
+    plot.refresh_from_db()
+    assert plot.path == "0000000020/0000000011/0000000111/"
+    assert list(SimpleTrialBalance.objects.descendants_of(other.path)) == [land, plot]
+
+@pytest.mark.django_db
+def test_trial_balance_hierarchy_2(django_assert_num_queries):
+    # sumy poddrzew dla całego poziomu jednym zapytaniem
+    fixed = SimpleTrialBalance.objects.create(account_name="Fixed assets", account_number=10, opening_balance=0, activity=0)
+    land = SimpleTrialBalance.objects.create(account_name="Land", account_number=11, opening_balance=100, activity=5, parent=fixed)
+    SimpleTrialBalance.objects.create(account_name="Plot A", account_number=111, opening_balance=40, activity=0, parent=land)
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=100, opening_balance=7, activity=0)
+
+    with django_assert_num_queries(1):
+        top_level = SimpleTrialBalance.objects.rollup()
+    assert top_level[fixed.path] == {"accounts": 3, "opening_balance": 140, "activity": 5, "closing_balance": 145}
+    assert top_level["0000000100/"]["closing_balance"] == 7
+
+    with django_assert_num_queries(1):
+        under_fixed = SimpleTrialBalance.objects.rollup(fixed)
+    assert list(under_fixed) == [land.path]
+    assert under_fixed[land.path]["closing_balance"] == 145
+
+@pytest.mark.django_db
+def test_close_period_1(django_assert_max_num_queries):
+    # zamknięcie okresu - liczba zapytań nie zależy od liczby kont
+    from datetime import date
+    from account.models import AccountingPeriod, PeriodBalance
+    from account.periods import close_period
+
+    SimpleTrialBalance.objects.bulk_create([
+        SimpleTrialBalance(account_name=f"account{number}", account_number=number, opening_balance=number, activity=10, path=f"{number:010d}/")
+        for number in range(1, 101)
+    ])
+    january = AccountingPeriod.objects.create(name="2026-01", start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+
+    with django_assert_max_num_queries(12):
+        february = close_period(january, next_name="2026-02")
+
+    january.refresh_from_db()
+    assert january.is_closed
+    assert (february.name, february.start_date, february.end_date) == ("2026-02", date(2026, 2, 1), date(2026, 2, 28))
+
+    # historia okresu - salda sprzed zamknięcia
+    balance = PeriodBalance.objects.get(period=january, account_number=5)
+    assert (balance.opening_balance, balance.activity, balance.closing_balance) == (5, 10, 15)
+    assert PeriodBalance.objects.filter(period=january).count() == 100
+
+    # bieżąca tabela - nowy okres
+    assert repr(SimpleTrialBalance.objects.get(account_number=5)) == "account5 | 5 | 15 | 0 | 15"
+
+@pytest.mark.django_db
+def test_close_period_2():
+    # zamkniętego okresu nie można zamknąć drugi raz, istniejący następny okres jest używany ponownie
+    from datetime import date
+    from account.models import AccountingPeriod
+    from account.periods import PeriodClosedError, PeriodOrderError, close_period
+
+    january = AccountingPeriod.objects.create(name="2026-01", start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+    february = AccountingPeriod.objects.create(name="2026-02", start_date=date(2026, 2, 1), end_date=date(2026, 2, 28))
+
+    # luty nie może być zamknięty przed styczniem
+    with pytest.raises(PeriodOrderError):
+        close_period(february)
+    assert not AccountingPeriod.objects.get(pk=february.pk).is_closed
+
+    assert close_period(january) == february
+    with pytest.raises(PeriodClosedError):
+        close_period(january)
+
+@pytest.mark.django_db
+def test_journal_entry_1(django_assert_max_num_queries):
+    # wpis dziennika dodaje różnice do activity - liczba zapytań nie zależy od liczby kont w tabeli
+    from account.ledger import post_journal_entry
+    from account.models import JournalLine
+
+    SimpleTrialBalance.objects.bulk_create([
+        SimpleTrialBalance(account_name=f"account{number}", account_number=number, opening_balance=0, activity=5, path=f"{number:010d}/")
+        for number in range(1, 201)
+    ])
+
+    with django_assert_max_num_queries(10):
+        entry, closing_balances = post_journal_entry([(1, 100), (2, -100), (1, 20)], description="entry1")
+
+    assert closing_balances == {1: 125, 2: -95}
+    assert list(entry.lines.order_by('id').values_list('account__account_number', 'amount')) == [(1, 100), (2, -100), (1, 20)]
+    assert JournalLine.objects.count() == 3
+
+    with pytest.raises(SimpleTrialBalance.DoesNotExist):
+        post_journal_entry([(1, 10), (999, -10)])
+    assert SimpleTrialBalance.objects.get(account_number=1).activity == 125
+    assert JournalLine.objects.count() == 3
+
+@pytest.mark.django_db
+def test_journal_entry_2():
+    # weryfikacja dziennika wykrywa i naprawia rozjazd, zamknięcie okresu zamyka też dziennik
+    from datetime import date
+    from django.core.management import call_command
+    from account.ledger import find_ledger_drift, post_journal_entry
+    from account.models import AccountingPeriod
+    from account.periods import close_period
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=1, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=2, opening_balance=0, activity=0)
+    post_journal_entry([(1, 50), (2, -50)])
+    assert find_ledger_drift(chunk_size=1) == []
+
+    SimpleTrialBalance.objects.filter(account_number=2).update(activity=7)
+    drift = find_ledger_drift(chunk_size=1)
+    assert [(account.account_number, activity, total) for account, activity, total in drift] == [(2, 7, -50)]
+
+    out = io.StringIO()
+    call_command("verify_ledger", "--fix", "--chunk-size", "1", stdout=out)
+    assert "Fixed 1 accounts" in out.getvalue()
+    assert SimpleTrialBalance.objects.get(account_number=2).activity == -50
+
+    january = AccountingPeriod.objects.create(name="2026-01", start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+    close_period(january)
+    assert january.journal_entries.count() == 1
+    assert find_ledger_drift() == []
+
+@pytest.mark.django_db
+def test_balances_as_of_1():
+    # stan na chwilę w przeszłości - migawka + zmiany po niej, także zapisane przez update() i usunięcia
+    import time
+    from django.db.models import F
+    from django.utils import timezone
+    from account.history import balances_as_of, take_snapshot
+    from account.models import AccountChange
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=1, opening_balance=10, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=2, opening_balance=20, activity=0)
+    take_snapshot()
+    SimpleTrialBalance.objects.filter(account_number=1).update(activity=5)
+    time.sleep(0.01) # dziennik zapisuje czas z dokładnością do milisekund
+    before = timezone.now()
+    time.sleep(0.01)
+
+    SimpleTrialBalance.objects.filter(account_number=1).update(activity=F('activity') + 100)
+    SimpleTrialBalance.objects.filter(account_number=2).delete()
+    SimpleTrialBalance.objects.create(account_name="account3", account_number=3, opening_balance=30, activity=0)
+    SimpleTrialBalance.objects.filter(account_number=3).update(path="0000000003/") # bez zmiany sald - bez wpisu w dzienniku
+    assert AccountChange.objects.filter(account_number=3).count() == 1
+
+    assert balances_as_of(before) == [(1, "account1", 10, 5, 15), (2, "account2", 20, 0, 20)]
+    assert balances_as_of(timezone.now()) == [(1, "account1", 10, 105, 115), (3, "account3", 30, 0, 30)]
+
+    # nowa migawka nie zmienia wyniku, a bez nowych zmian kolejna nie powstaje
+    assert take_snapshot() is not None
+    assert take_snapshot() is None
+    assert balances_as_of(before) == [(1, "account1", 10, 5, 15), (2, "account2", 20, 0, 20)]
+    assert balances_as_of(timezone.now()) == [(1, "account1", 10, 105, 115), (3, "account3", 30, 0, 30)]
+
+@pytest.mark.django_db
+def test_balances_as_of_2():
+    # zmiana numeru konta i upsert z importu trafiają do dziennika, historii sprzed pierwszej migawki nie ma
+    from datetime import datetime, timezone as dt_timezone
+    from django.utils import timezone
+    from account.history import HistoryUnavailable, balances_as_of
+    from account.importers import import_accounts
+
+    account = SimpleTrialBalance.objects.create(account_name="account1", account_number=1, opening_balance=10, activity=0)
+    account.account_number = 11
+    account.save()
+    import_accounts(io.StringIO("account_name,account_number,opening_balance,activity\nrenamed,11,10,7\n"))
+
+    assert balances_as_of(timezone.now()) == [(11, "renamed", 10, 7, 17)]
+    with pytest.raises(HistoryUnavailable):
+        balances_as_of(datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+
+@pytest.mark.django_db
+def test_comparison_1(django_assert_num_queries):
+    # migawka vs bieżąca tabela w jednym zapytaniu - konta dodane, usunięte, zmienione, sortowanie po wartości bezwzględnej różnicy
+    from account.comparison import comparison_sources, iter_comparison
+    from account.history import take_snapshot
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=1, opening_balance=100, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=2, opening_balance=50, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account3", account_number=3, opening_balance=10, activity=0)
+    snapshot = take_snapshot()
+    SimpleTrialBalance.objects.filter(account_number=1).update(activity=-30)
+    SimpleTrialBalance.objects.filter(account_number=2).delete()
+    SimpleTrialBalance.objects.create(account_name="account4", account_number=4, opening_balance=0, activity=5)
+
+    sources = {source.key: source for source in comparison_sources()}
+    base, current = sources[f"snapshot:{snapshot.pk}"], sources["current"]
+
+    with django_assert_num_queries(1):
+        rows = list(iter_comparison(base, current, sort="-abs_variance", chunk_size=1))
+    assert rows == [
+        (2, "account2", 50, None, -50, -100.0, "removed"),
+        (1, "account1", 100, 70, -30, -30.0, "changed"),
+        (4, "account4", None, 5, 5, None, "added"),
+        (3, "account3", 10, 10, 0, 0.0, "unchanged"),
+    ]
+    assert [row.account_number for row in iter_comparison(base, current, changed_only=True)] == [1, 2, 4]
+    assert [row.account_number for row in iter_comparison(base, current, sort="variance", limit=2)] == [2, 1]
+
+@pytest.mark.django_db
+def test_sqlite_read_during_bulk_write(tmp_path):
+    """
+    WAL + PRAGMA z settings: odczyt nie czeka na otwartą transakcję zapisu dużej porcji kont
+    i widzi ostatni zatwierdzony stan. Osobny plik bazy - testowa baza w pamięci nie ma trybu WAL.
+    """
+    import threading
+    import time
+    from django.db import connections
+    from django.db.backends.sqlite3.base import DatabaseWrapper
+
+    settings_dict = {**connections["default"].settings_dict, "NAME": str(tmp_path / "concurrency.sqlite3")}
+
+    def fetch_one(wrapper, sql):
+        with wrapper.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    reader = DatabaseWrapper(settings_dict, alias="reader")
+    assert fetch_one(reader, "PRAGMA journal_mode") == "wal"
+    assert fetch_one(reader, "PRAGMA synchronous") == 1 # NORMAL
+    assert fetch_one(reader, "PRAGMA busy_timeout") == 5000
+    with reader.cursor() as cursor:
+        cursor.execute("CREATE TABLE account (account_number INTEGER PRIMARY KEY, activity INTEGER)")
+        cursor.executemany("INSERT INTO account VALUES (%s, 0)", [(number,) for number in range(1000)])
+
+    written, release = threading.Event(), threading.Event()
+
+    def bulk_write():
+        writer = DatabaseWrapper(settings_dict, alias="writer")
+        with writer.cursor() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.executemany("INSERT INTO account VALUES (%s, 1)", [(number,) for number in range(1000, 51000)])
+            written.set()
+            release.wait(10) # transakcja zapisu zostaje otwarta, dopóki test nie skończy czytać
+            cursor.execute("COMMIT")
+        writer.close()
+
+    thread = threading.Thread(target=bulk_write)
+    thread.start()
+    try:
+        assert written.wait(10)
+        started = time.monotonic()
+        assert fetch_one(reader, "SELECT COUNT(*) FROM account") == 1000
+        assert time.monotonic() - started < 1 # bez czekania na busy_timeout
+    finally:
+        release.set()
+        thread.join()
+
+    assert fetch_one(reader, "SELECT COUNT(*) FROM account") == 51000
+    reader.close()
+
+@pytest.mark.django_db
+def test_entities_1(django_user_model):
+    """
+    Jednostki - ten sam numer konta w dwóch jednostkach, domyślny manager widzi tylko konta jednostki z zakresu,
+    a zapytanie z jednostką użytkownika (podzapytanie) czyta tylko jej fragment indeksu.
+    """
+    from django.db import connection
+    from account.models import Entity, EntityMember
+    from account.tenancy import EntityScope, current_scope
+
+    other = Entity.objects.create(name="Other")
+    SimpleTrialBalance.objects.create(account_name="default cash", account_number=100, opening_balance=1, activity=0)
+    with using_entity(other):
+        SimpleTrialBalance.objects.create(account_name="other cash", account_number=100, opening_balance=2, activity=0)
+        SimpleTrialBalance.objects.bulk_create([SimpleTrialBalance(account_name="other bank", account_number=130, opening_balance=3, activity=0)])
+        assert list(SimpleTrialBalance.objects.values_list("account_name", flat=True)) == ["other cash", "other bank"]
+        assert SimpleTrialBalance.objects.totals()["closing_balance"] == 5
+
+    assert SimpleTrialBalance.objects.count() == 3 # bez zakresu - wszystkie jednostki
+    assert SimpleTrialBalance.objects.get(account_name="other bank").entity == other
+
+    user = django_user_model.objects.create_user(username="other_user", password="pw1234")
+    EntityMember.objects.create(user=user, entity=other)
+    token = current_scope.set(EntityScope(user=user))
+    try:
+        accounts = SimpleTrialBalance.objects.search(number_from=100, number_to=120)
+        assert [account.account_name for account in accounts] == ["other cash"]
+        sql, params = accounts.values("id").query.sql_with_params()
+    finally:
+        current_scope.reset(token)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = " ".join(str(row) for row in cursor.fetchall())
+    assert "SEARCH account_simpletrialbalance USING COVERING INDEX" in plan and "(entity_id=? AND account_number>? AND account_number<?)" in plan
+    assert "SCAN account_simpletrialbalance" not in plan
+
+@pytest.mark.django_db
+def test_live_updates_1(django_capture_on_commit_callbacks):
+    """
+    Hub powiadomień (publikacja z innego wątku) i delta z dziennika zmian: kilka zmian konta to jeden wiersz,
+    konto spoza filtrów tabeli jest wysyłane jako usunięte, zapis kont budzi strumienie dopiero po commicie.
+    """
+    import asyncio
+    import threading
+    from django.db.models import F
+    from account.live import InProcessHub, last_change_id, notify_change, read_delta
+    from account.tenancy import current_entity_id
+
+    hub = InProcessHub(queue_size=1)
+
+    async def receive():
+        async with hub.subscribe() as subscription:
+            thread = threading.Thread(target=lambda: [hub.publish({"entity_id": 1}), hub.publish({"entity_id": 2})])
+            thread.start()
+            thread.join()
+            first = await subscription.get(timeout=1)
+            second = await subscription.get(timeout=0.05) # kolejka pełna - drugie powiadomienie pominięte
+        return first, second
+
+    assert asyncio.run(receive()) == ({"entity_id": 1}, None)
+
+    entity_id = current_entity_id()
+    start = last_change_id(entity_id)
+    bank = SimpleTrialBalance.objects.create(account_name="bank", account_number=100, opening_balance=10, activity=0)
+    cash = SimpleTrialBalance.objects.create(account_name="cash", account_number=101, opening_balance=5, activity=0)
+    after, delta, more = read_delta(entity_id, start)
+    assert [change["action"] for change in delta["changes"]] == ["created", "created"]
+
+    SimpleTrialBalance.objects.filter(pk=bank.pk).update(activity=F("activity") + 3)
+    SimpleTrialBalance.objects.filter(pk=bank.pk).update(activity=F("activity") + 4)
+    cash.account_number = 201
+    cash.save()
+    SimpleTrialBalance.objects.create(account_name="tax", account_number=300, opening_balance=1, activity=0)
+
+    after, delta, more = read_delta(entity_id, after, filters={"number_to": 250}, limit=100)
+    assert after == last_change_id(entity_id) and not more
+    assert delta["changes"] == [
+        {"action": "updated", "account_number": 100, "account_name": "bank", "opening_balance": 10, "activity": 7, "closing_balance": 17},
+        {"action": "deleted", "account_number": 101, "account_name": "cash", "opening_balance": 5, "activity": 0, "closing_balance": 5},
+        {"action": "created", "account_number": 201, "account_name": "cash", "opening_balance": 5, "activity": 0, "closing_balance": 5},
+    ] # konto 300 jest poza filtrem tabeli
+    assert delta["totals"] == {"opening_balance": 15, "activity": 7, "closing_balance": 22}
+    assert read_delta(entity_id, after) == (after, None, False)
+
+    # filtr nazwy porównuje polskie litery tak samo jak wyszukiwanie w bazie (name_key)
+    SimpleTrialBalance.objects.create(account_name="Środki", account_number=400, opening_balance=0, activity=0)
+    after, delta, more = read_delta(entity_id, after, filters={"name": "śr"})
+    assert [change["account_number"] for change in delta["changes"]] == [400]
+    assert delta["totals"]["opening_balance"] == 0
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        bank.delete()
+    assert [callback.args for callback in callbacks if getattr(callback, "func", None) is notify_change] == [(bank.entity_id,)]
@@ -456,3 +456,1018 @@ def test_account_update(client, user_all_permissions):
     db_contents = str(SimpleTrialBalance.objects.all())
     new_account = "[account1 | 100100 | 0 | 100 | 100]"
     assert new_account in db_contents
+
+    # zmiana activity zaksięgowana w dzienniku - activity zgadza się z sumą linii
+    from account.ledger import find_ledger_drift
+    from account.models import JournalLine
+
+    assert list(JournalLine.objects.values_list("account__account_number", "amount", "entry__posted_by")) == [(100100, 100, user_all_permissions.pk)]
+    assert find_ledger_drift() == []
+
+@pytest.mark.django_db
+def test_trial_balance_pagination_1(client):
+    """
+    Pierwsza strona zawiera tylko page_size kont i link do następnej strony.
+    """
+    for number in range(1, 8):
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number, opening_balance=0, activity=0)
+
+    response = client.get(reverse("trial_balance"), {"page_size": 3})
+    assert response.status_code == 200
+
+    page = response.context["trial_balance_data"]
+    assert [account.account_number for account in page] == [1, 2, 3]
+    assert response.context["previous_page_url"] is None
+    assert response.context["next_page_url"] is not None
+
+@pytest.mark.django_db
+def test_trial_balance_pagination_2(client):
+    """
+    Przechodzimy po wszystkich stronach do przodu i z powrotem - kolejność i linki muszą się zgadzać.
+    """
+    for number in [5, 1, 3, 7, 2, 4, 6]:
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number, opening_balance=0, activity=0)
+
+    pages = []
+    url = reverse("trial_balance") + "?page_size=3"
+    while url:
+        response = client.get(url)
+        pages.append([(a.account_number, a.id) for a in response.context["trial_balance_data"]])
+        next_url = response.context["next_page_url"]
+        url = reverse("trial_balance") + next_url if next_url else None
+
+    expected = list(SimpleTrialBalance.objects.order_by("account_number", "id").values_list("account_number", "id"))
+    assert sum(pages, []) == expected
+    assert len(pages) == 3
+
+    # powrót z ostatniej strony do poprzedniej
+    response = client.get(reverse("trial_balance") + response.context["previous_page_url"])
+    assert [(a.account_number, a.id) for a in response.context["trial_balance_data"]] == pages[1]
+
+@pytest.mark.django_db
+def test_trial_balance_pagination_3(client, django_assert_max_num_queries):
+    """
+    Niepoprawny kursor - pokazujemy pierwszą stronę, a page_size jest ograniczone przez ustawienia.
+    """
+    for number in range(1, 4):
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number, opening_balance=0, activity=0)
+
+    with django_assert_max_num_queries(2):
+        response = client.get(reverse("trial_balance"), {"after": "not-a-cursor", "page_size": "abc"})
+
+    assert response.status_code == 200
+    assert [a.account_number for a in response.context["trial_balance_data"]] == [1, 2, 3]
+
+    # kursor z wartościami złego typu (podmieniony) - też pierwsza strona, a nie błąd 500
+    from account.pagination import encode_cursor
+    for values, sort in [(["abc", 1], None), ([{"a": 1}, 1], None), ([True, 1], None), ([1, 1], "account_name")]:
+        params = {"after": encode_cursor(values), **({"sort": sort} if sort else {})}
+        response = client.get(reverse("trial_balance"), params)
+        assert response.status_code == 200
+        assert sorted(a.account_number for a in response.context["trial_balance_data"]) == [1, 2, 3]
+
+@pytest.mark.django_db
+def test_trial_balance_export_1(client):
+    """
+    Eksport CSV - odpowiedź jest strumieniowana i zawiera nagłówek oraz wszystkie konta posortowane po numerze.
+    """
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=200200, opening_balance=10, activity=5)
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=100)
+
+    response = client.get(reverse("trial_balance_export"))
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "text/csv"
+
+    content = b"".join(response.streaming_content).decode()
+    assert content.splitlines() == [
+        "account_name,account_number,opening_balance,activity,closing_balance",
+        "account1,100100,0,100,100",
+        "account2,200200,10,5,15",
+    ]
+
+@pytest.mark.django_db
+def test_trial_balance_export_2(client, settings):
+    """
+    Eksport większej liczby kont niż chunk_size - nic nie może zginąć na granicy porcji.
+    """
+    settings.TRIAL_BALANCE_EXPORT_CHUNK_SIZE = 2
+    for number in range(1, 6):
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number, opening_balance=0, activity=number)
+
+    response = client.get(reverse("trial_balance_export"))
+    lines = b"".join(response.streaming_content).decode().splitlines()
+
+    assert len(lines) == 6 # nagłówek + 5 kont
+    assert lines[-1] == "account5,5,0,5,5"
+
+@pytest.mark.django_db
+def test_account_import_1(client, user_basic_permissions):
+    # użytkownik bez uprawnień nie może importować kont
+    client.force_login(user_basic_permissions)
+
+    response = client.get(reverse("import_accounts"))
+    assert response.status_code == 403
+
+@pytest.mark.django_db
+def test_account_import_2(client, user_all_permissions):
+    """
+    Import CSV - nowe konto zostaje dodane, istniejące nadpisane, błędny wiersz zgłoszony bez przerywania importu.
+    """
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    client.force_login(user_all_permissions)
+    SimpleTrialBalance.objects.create(account_name="old_name", account_number=100100, opening_balance=0, activity=0)
+
+    csv_file = SimpleUploadedFile("accounts.csv", (
+        "account_name,account_number,opening_balance,activity\n"
+        "account1,100100,10,5\n"
+        "account2,200200,0,100\n"
+        "account3,not_a_number,0,0\n"
+    ).encode())
+
+    response = client.post(reverse("import_accounts"), {"file": csv_file})
+    assert response.status_code == 200
+
+    result = response.context["result"]
+    assert (result.created, result.updated) == (1, 1)
+    assert [line for line, message in result.errors] == [4]
+
+    db_contents = str(list(SimpleTrialBalance.objects.order_by("account_number")))
+    assert db_contents == "[account1 | 100100 | 10 | 5 | 15, account2 | 200200 | 0 | 100 | 100]"
+
+    # activity z pliku trafia do dziennika, ponowny import tych samych wartości nie księguje niczego
+    from account.ledger import find_ledger_drift
+    from account.models import JournalEntry
+
+    assert find_ledger_drift() == []
+    entry = JournalEntry.objects.get()
+    assert (entry.description, sorted(entry.lines.values_list("account__account_number", "amount"))) == ("CSV import", [(100100, 5), (200200, 100)])
+
+    csv_file = SimpleUploadedFile("accounts.csv", b"account_name,account_number,opening_balance,activity\naccount1,100100,10,5\n")
+    client.post(reverse("import_accounts"), {"file": csv_file})
+    assert JournalEntry.objects.count() == 1
+
+@pytest.mark.django_db
+def test_account_import_3(client, user_all_permissions):
+    # plik w innym kodowaniu niż UTF-8 - błąd formularza zamiast 500
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    client.force_login(user_all_permissions)
+    csv_file = SimpleUploadedFile("accounts.csv", "account_name,account_number,opening_balance,activity\nśrodki,100100,0,0\n".encode("cp1250"))
+
+    response = client.post(reverse("import_accounts"), {"file": csv_file})
+    assert response.status_code == 200
+    assert "not UTF-8 encoded" in str(response.context["form"].errors["file"])
+    assert not SimpleTrialBalance.objects.exists()
+
+@pytest.mark.django_db
+def test_account_import_command(tmp_path):
+    # komenda import_accounts - porcje po jednym koncie, duplikat numeru w pliku aktualizuje konto
+    from django.core.management import call_command
+
+    path = tmp_path / "accounts.csv"
+    path.write_text(
+        "account_name,account_number,opening_balance,activity\n"
+        "account1,100100,0,5\n"
+        "account2,200200,0,7\n"
+        "account1_renamed,100100,1,5\n"
+    )
+
+    call_command("import_accounts", str(path), batch_size=1)
+
+    db_contents = str(list(SimpleTrialBalance.objects.order_by("account_number")))
+    assert db_contents == "[account1_renamed | 100100 | 1 | 5 | 6, account2 | 200200 | 0 | 7 | 7]"
+
+@pytest.mark.django_db
+def test_account_import_tree(tmp_path):
+    # kolumna parent - drzewo kont w jednym pliku, konto nadrzędne z tej samej porcji jest zapisywane przed dziećmi
+    from django.core.management import call_command
+
+    path = tmp_path / "accounts.csv"
+    path.write_text(
+        "account_name,account_number,opening_balance,activity,parent\n"
+        "Fixed assets,10,0,0,\n"
+        "Land,11,100,5,10\n"
+        "Plots,111,20,0,11\n"
+        "Orphan,12,0,0,99\n"
+    )
+
+    call_command("import_accounts", str(path))
+
+    land = SimpleTrialBalance.objects.get(account_number=11)
+    plots = SimpleTrialBalance.objects.get(account_number=111)
+    assert land.parent.account_number == 10
+    assert plots.parent == land
+    assert plots.path == land.path + "0000000111/"
+    assert SimpleTrialBalance.objects.rollup(None)[land.parent.path]["accounts"] == 3
+    assert not SimpleTrialBalance.objects.filter(account_number=12).exists() # nieznane konto nadrzędne - błąd wiersza
+
+@pytest.mark.django_db
+def test_post_activity_view_1(client, user_basic_permissions):
+    """
+    Księgowanie zmian przez JSON - jedna odpowiedź z nowymi saldami.
+    """
+    client.force_login(user_basic_permissions)
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=200200, opening_balance=50, activity=0)
+
+    response = client.post(reverse("post_activity"), {"100100": 100, "200200": -20}, content_type="application/json")
+
+    assert response.status_code == 200
+    assert response.json() == {"closing_balances": {"100100": 100, "200200": 30}}
+
+    from account.models import JournalEntry
+    entry = JournalEntry.objects.get()
+    assert entry.posted_by == user_basic_permissions
+    assert sorted(entry.lines.values_list('account__account_number', 'amount')) == [(100100, 100), (200200, -20)]
+
+@pytest.mark.django_db
+def test_post_activity_view_2(client, user_basic_permissions):
+    # błędne dane i nieznane konto zwracają 400, niezalogowany użytkownik 403
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+
+    response = client.post(reverse("post_activity"), {"100100": 1}, content_type="application/json")
+    assert response.status_code == 403
+
+    client.force_login(user_basic_permissions)
+    response = client.post(reverse("post_activity"), ["100100"], content_type="application/json")
+    assert response.status_code == 400
+
+    response = client.post(reverse("post_activity"), {"100100": 1, "999": 1}, content_type="application/json")
+    assert response.status_code == 400
+    assert SimpleTrialBalance.objects.get(account_number=100100).activity == 0
+
+    # kwoty tylko całkowite - ułamek, wartość logiczna czy napis z ułamkiem nie są obcinane do 1
+    for amount in [1.9, True, "1.5", "²"]:
+        response = client.post(reverse("post_activity"), {"100100": amount}, content_type="application/json")
+        assert response.status_code == 400
+    response = client.post(reverse("post_activity"), {"100100": "-7"}, content_type="application/json")
+    assert response.json() == {"closing_balances": {"100100": -7}}
+
+@pytest.mark.django_db
+def test_post_activity_command(tmp_path):
+    # komenda post_activity - ułamkowa kwota to błąd komendy, nic nie zostaje zaksięgowane
+    import io
+    from django.core.management import CommandError, call_command
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+    path = tmp_path / "deltas.json"
+    for deltas in ['{"100100": 1.9}', '{"100100": true}']:
+        path.write_text(deltas)
+        with pytest.raises(CommandError):
+            call_command("post_activity", str(path))
+    assert SimpleTrialBalance.objects.get(account_number=100100).activity == 0
+
+    path.write_text('{"100100": 5}')
+    call_command("post_activity", str(path), stdout=io.StringIO())
+    assert SimpleTrialBalance.objects.get(account_number=100100).activity == 5
+
+@pytest.mark.django_db
+def test_group_names_cache_1(user_all_permissions, django_assert_num_queries):
+    """
+    Nazwy grup pobierane są raz - kolejne sprawdzenia (widok, formularz) nie odpytują bazy.
+    """
+    from account.permissions import user_in_group
+
+    with django_assert_num_queries(1):
+        assert user_in_group(user_all_permissions, "all_permissions")
+        assert not user_in_group(user_all_permissions, "new_hire_permissions")
+        TrialBalanceForm(user=user_all_permissions)
+
+@pytest.mark.django_db
+def test_group_names_cache_2(user_basic_permissions, settings, django_assert_num_queries):
+    """
+    Cache w sesji - zmiana członkostwa w grupie unieważnia zapisane nazwy.
+    """
+    from account.permissions import get_group_names
+
+    settings.GROUP_NAMES_SESSION_CACHE = True
+    session = {}
+    assert get_group_names(user_basic_permissions, session) == frozenset()
+
+    # nowy request (nowy obiekt user), ta sama sesja - bez zapytania do bazy
+    user = User.objects.get(pk=user_basic_permissions.pk)
+    with django_assert_num_queries(0):
+        assert get_group_names(user, session) == frozenset()
+
+    group, _ = Group.objects.get_or_create(name="all_permissions")
+    user.groups.add(group)
+
+    user = User.objects.get(pk=user_basic_permissions.pk)
+    assert get_group_names(user, session) == frozenset({"all_permissions"})
+
+@pytest.mark.django_db
+def test_trial_balance_search_1(client):
+    """
+    Filtry: zakres numerów, początek nazwy i tylko salda różne od zera - działają razem.
+    """
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=100, opening_balance=10, activity=0)
+    SimpleTrialBalance.objects.create(account_name="cash USD", account_number=110, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Cash EUR", account_number=120, opening_balance=0, activity=5)
+    SimpleTrialBalance.objects.create(account_name="Cash other", account_number=300, opening_balance=1, activity=0)
+
+    response = client.get(reverse("trial_balance"), {"number_from": 100, "number_to": 200, "name": "CASH", "nonzero": "on"})
+
+    assert [a.account_number for a in response.context["trial_balance_data"]] == [100, 120]
+    assert "number_from=100" in response.context["export_url"]
+
+@pytest.mark.django_db
+def test_trial_balance_search_2(client):
+    """
+    Sortowanie po saldzie malejąco razem z paginacją - strony nie gubią ani nie powtarzają kont.
+    """
+    for number, balance in [(1, 50), (2, -10), (3, 50), (4, 0), (5, 20)]:
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number, opening_balance=balance, activity=0)
+
+    response = client.get(reverse("trial_balance"), {"sort": "-closing_balance", "page_size": 2})
+    first_page = [a.account_number for a in response.context["trial_balance_data"]]
+    response = client.get(reverse("trial_balance") + response.context["next_page_url"])
+    second_page = [a.account_number for a in response.context["trial_balance_data"]]
+    response = client.get(reverse("trial_balance") + response.context["next_page_url"])
+    third_page = [a.account_number for a in response.context["trial_balance_data"]]
+
+    assert first_page + second_page + third_page == [3, 1, 5, 4, 2]
+    assert response.context["next_page_url"] is None
+
+@pytest.mark.django_db
+def test_trial_balance_search_3(client):
+    # sortowanie po nazwie bez względu na wielkość liter
+    SimpleTrialBalance.objects.create(account_name="bank", account_number=1, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Assets", account_number=2, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="cash", account_number=3, opening_balance=0, activity=0)
+
+    response = client.get(reverse("trial_balance"), {"sort": "-account_name"})
+    assert [a.account_name for a in response.context["trial_balance_data"]] == ["cash", "bank", "Assets"]
+
+    response = client.get(reverse("trial_balance_export"), {"name": "ba"})
+    assert b"".join(response.streaming_content).decode().splitlines()[1:] == ["bank,1,0,0,0"]
+
+@pytest.mark.django_db
+def test_account_lookup_1(client):
+    """
+    Wyszukiwarka kont - po początku numeru i po początku nazwy, z limitem wyników.
+    """
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=100, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Cash USD", account_number=1001, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Bank", account_number=2100, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Receivables", account_number=10, opening_balance=0, activity=0)
+
+    response = client.get(reverse("account_lookup"), {"q": "10"})
+    assert [r["account_number"] for r in response.json()["results"]] == [10, 100, 1001]
+
+    response = client.get(reverse("account_lookup"), {"q": "cash", "limit": 1})
+    assert response.json()["results"] == [{"id": SimpleTrialBalance.objects.get(account_number=100).id, "account_number": 100, "account_name": "Cash"}]
+
+    response = client.get(reverse("account_lookup"), {"q": ""})
+    assert response.json()["results"] == []
+
+    # numer dłuższy niż pole konta - brak wyników, a nie wszystkie konta
+    response = client.get(reverse("account_lookup"), {"q": "10000000000"})
+    assert response.json()["results"] == []
+
+    # cyfry spoza ASCII (np. indeks górny) są szukane jako nazwa
+    response = client.get(reverse("account_lookup"), {"q": "²"})
+    assert response.status_code == 200
+    assert response.json()["results"] == []
+
+@pytest.mark.django_db
+def test_account_lookup_2(client, user_all_permissions, django_assert_max_num_queries):
+    """
+    Strony wyboru kont nie budują listy wszystkich kont - liczba zapytań nie zależy od liczby kont.
+    """
+    client.force_login(user_all_permissions)
+    SimpleTrialBalance.objects.bulk_create([
+        SimpleTrialBalance(account_name=f"account{number}", account_number=number, opening_balance=0, activity=0)
+        for number in range(1, 201)
+    ])
+
+    with django_assert_max_num_queries(3):
+        response = client.get(reverse("delete_account"))
+    assert "account150" not in response.content.decode()
+
+    with django_assert_max_num_queries(3):
+        response = client.get(reverse("account_update_select"))
+    assert "account150" not in response.content.decode()
+
+    # wybrane id wciąż jest walidowane
+    response = client.post(reverse("account_update_select"), {"account_update_select": SimpleTrialBalance.objects.get(account_number=150).id})
+    assert response.status_code == 302
+
+@pytest.mark.django_db
+def test_account_bulk_delete_1(client, user_all_permissions, settings):
+    """
+    Usuwanie według kryteriów - najpierw podgląd liczby kont, potem usunięcie porcjami.
+    """
+    settings.ACCOUNT_DELETE_BATCH_SIZE = 2
+    client.force_login(user_all_permissions)
+    for number in [700, 701, 702, 703, 710]:
+        SimpleTrialBalance.objects.create(account_name=f"test{number}", account_number=number, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="test704", account_number=704, opening_balance=5, activity=0)
+    SimpleTrialBalance.objects.create(account_name="cash", account_number=100, opening_balance=0, activity=0)
+
+    criteria = {"number_from": 700, "number_to": 799, "zero": "on"}
+    response = client.post(reverse("bulk_delete_account"), criteria)
+    assert response.status_code == 200
+    assert response.context["preview_count"] == 5
+    assert SimpleTrialBalance.objects.count() == 7 # podgląd niczego nie usuwa
+
+    response = client.post(reverse("bulk_delete_account"), {**criteria, "confirm": "True"}, follow=True)
+    assert response.request["PATH_INFO"] == reverse("trial_balance")
+    assert list(SimpleTrialBalance.objects.values_list("account_number", flat=True)) == [100, 704]
+
+@pytest.mark.django_db
+def test_account_bulk_delete_2(client, user_all_permissions, user_basic_permissions):
+    # bez kryteriów nic nie zostaje usunięte, użytkownik bez uprawnień dostaje 403
+    SimpleTrialBalance.objects.create(account_name="cash", account_number=100, opening_balance=0, activity=0)
+
+    client.force_login(user_all_permissions)
+    response = client.post(reverse("bulk_delete_account"), {"confirm": "True"})
+    assert response.status_code == 200
+    assert "Choose at least one criterion." in response.content.decode()
+    assert SimpleTrialBalance.objects.count() == 1
+
+    client.force_login(user_basic_permissions)
+    response = client.get(reverse("bulk_delete_account"))
+    assert response.status_code == 403
+
+@pytest.mark.django_db
+def test_account_bulk_delete_3(client, user_all_permissions):
+    """
+    Zakres z całym poddrzewem kont (domyślny rozmiar porcji) - analityki usuwane przed kontami syntetycznymi,
+    tak samo przy usuwaniu wybranych kont; konto z analityką spoza wyboru nie jest usuwane.
+    """
+    client.force_login(user_all_permissions)
+    parent = SimpleTrialBalance.objects.create(account_name="test700", account_number=700, opening_balance=0, activity=0)
+    child = SimpleTrialBalance.objects.create(account_name="test701", account_number=701, opening_balance=0, activity=0, parent=parent)
+    SimpleTrialBalance.objects.create(account_name="test702", account_number=702, opening_balance=0, activity=0, parent=parent)
+    SimpleTrialBalance.objects.create(account_name="test750", account_number=750, opening_balance=0, activity=0, parent=child)
+
+    response = client.post(reverse("bulk_delete_account"), {"number_from": 700, "number_to": 799, "confirm": "True"})
+    assert response.status_code == 302
+    assert not SimpleTrialBalance.objects.exists()
+
+    parent = SimpleTrialBalance.objects.create(account_name="test800", account_number=800, opening_balance=0, activity=0)
+    children = [
+        SimpleTrialBalance.objects.create(account_name=f"test{number}", account_number=number, opening_balance=0, activity=0, parent=parent)
+        for number in [801, 802]
+    ]
+    response = client.post(reverse("delete_account"), {"accounts_to_delete": [parent.pk, children[0].pk]})
+    assert response.status_code == 200 # 802 zostaje pod kontem 800 - nic nie zostało usunięte
+    assert SimpleTrialBalance.objects.filter(account_number__in=[800, 801, 802]).count() == 3
+
+    response = client.post(reverse("delete_account"), {"accounts_to_delete": [parent.pk] + [child.pk for child in children]})
+    assert response.status_code == 302
+    assert not SimpleTrialBalance.objects.exists()
+
+@pytest.mark.django_db
+def test_trial_balance_cache_1(client, django_assert_num_queries):
+    """
+    Powtórne wyświetlenie tej samej strony nie odpytuje bazy, dopóki dane się nie zmienią.
+    """
+    account = SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+
+    response = client.get(reverse("trial_balance"))
+    assert "account1" in response.content.decode()
+
+    with django_assert_num_queries(0):
+        response = client.get(reverse("trial_balance"))
+    assert "account1" in response.content.decode()
+
+    # zapis przez save() - post_save unieważnia cache
+    account.account_name = "renamed"
+    account.save()
+    response = client.get(reverse("trial_balance"))
+    assert "renamed" in response.content.decode()
+
+@pytest.mark.django_db
+def test_trial_balance_cache_2(client):
+    # operacje zbiorcze (update, bulk_create, usuwanie) też unieważniają cache
+    from django.db.models import F
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+    client.get(reverse("trial_balance"))
+
+    SimpleTrialBalance.objects.update(activity=F("activity") + 123)
+    assert "123" in client.get(reverse("trial_balance")).content.decode()
+
+    SimpleTrialBalance.objects.bulk_create([SimpleTrialBalance(account_name="account2", account_number=200200, opening_balance=0, activity=0)])
+    assert "account2" in client.get(reverse("trial_balance")).content.decode()
+
+    SimpleTrialBalance.objects.filter(account_number=200200).delete()
+    assert "account2" not in client.get(reverse("trial_balance")).content.decode()
+
+def test_trial_balance_cache_3(settings):
+    """
+    Cache wersji danych osobny dla każdego procesu (LocMemCache) - ostrzeżenie w `check --deploy`, cache wspólny - bez ostrzeżeń.
+    """
+    from account.caching import check_shared_cache
+
+    assert [warning.id for warning in check_shared_cache(None)] == ["account.W001"]
+
+    settings.CACHES = {**settings.CACHES, "trial_balance": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/trial_balance"}}
+    assert check_shared_cache(None) == []
+
+@pytest.mark.django_db
+def test_trial_balance_conditional_get_1(client, django_assert_num_queries):
+    """
+    Ponowne pobranie z If-None-Match - 304 bez zapytań do bazy, po zmianie danych znowu 200.
+    """
+    account = SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+
+    response = client.get(reverse("trial_balance"))
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert response.has_header("Last-Modified")
+
+    with django_assert_num_queries(0):
+        response = client.get(reverse("trial_balance"), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    account.activity = 10
+    account.save()
+    response = client.get(reverse("trial_balance"), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+@pytest.mark.django_db
+def test_trial_balance_conditional_get_2(client):
+    # eksport też obsługuje ETag, a różne filtry mają różne ETagi
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+
+    response = client.get(reverse("trial_balance_export"))
+    etag = response["ETag"]
+
+    response = client.get(reverse("trial_balance_export"), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    response = client.get(reverse("trial_balance_export"), {"name": "acc"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+@pytest.mark.django_db
+def test_trial_balance_totals_view(client):
+    # wiersz sum dotyczy wszystkich przefiltrowanych kont, nie tylko widocznej strony
+    for number in range(1, 6):
+        SimpleTrialBalance.objects.create(account_name=f"account{number}", account_number=number * 100, opening_balance=number, activity=1)
+
+    response = client.get(reverse("trial_balance"), {"page_size": 2, "subtotals": 1})
+
+    assert response.context["totals"] == {"opening_balance": 15, "activity": 5, "closing_balance": 20}
+    assert [s["prefix"] for s in response.context["subtotals"]] == ["1", "2", "3", "4", "5"]
+    assert "Subtotals by account number prefix" in response.content.decode()
+
+@pytest.mark.django_db
+def test_trial_balance_tree(client):
+    """
+    Drzewo kont - najwyższy poziom z sumami poddrzew, dzieci pobierane osobno.
+    """
+    fixed = SimpleTrialBalance.objects.create(account_name="Fixed assets", account_number=10, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Land", account_number=11, opening_balance=100, activity=5, parent=fixed)
+
+    response = client.get(reverse("trial_balance_tree"))
+    content = response.content.decode()
+    assert response.status_code == 200
+    assert "Fixed assets" in content
+    assert "closing: 105" in content
+    assert "Land" not in content # dzieci nie są ładowane od razu
+
+    response = client.get(reverse("trial_balance_tree_children", args=[fixed.pk]))
+    assert "Land" in response.content.decode()
+
+@pytest.mark.django_db
+def test_trial_balance_tree_2(client, settings):
+    """
+    Poziomy drzewa są stronicowane - link "More accounts" prowadzi do kolejnej strony, sumy liczymy tylko dla kont ze strony.
+    """
+    import html
+    import re
+
+    settings.TRIAL_BALANCE_PAGE_SIZE = 2
+    fixed = SimpleTrialBalance.objects.create(account_name="Fixed assets", account_number=10, opening_balance=0, activity=0)
+    for number in (11, 12, 13):
+        SimpleTrialBalance.objects.create(account_name=f"Land {number}", account_number=number, opening_balance=number, activity=0, parent=fixed)
+    SimpleTrialBalance.objects.create(account_name="Cash", account_number=20, opening_balance=7, activity=0)
+    SimpleTrialBalance.objects.create(account_name="Equity", account_number=30, opening_balance=0, activity=0)
+
+    content = client.get(reverse("trial_balance_tree")).content.decode()
+    assert "Fixed assets" in content and "closing: 36" in content
+    assert "Cash" in content
+    assert "Equity" not in content
+    assert "More accounts" in content
+
+    response = client.get(reverse("trial_balance_tree_roots"), {"after": "not-a-cursor"}) # niepoprawny kursor - pierwsza strona
+    assert "Fixed assets" in response.content.decode()
+
+    children_url = reverse("trial_balance_tree_children", args=[fixed.pk])
+    content = client.get(children_url).content.decode()
+    assert "Land 11" in content and "Land 12" in content and "Land 13" not in content
+    more_url = re.search(r'data-more-url="([^"]+)"', content).group(1)
+    assert more_url.startswith(children_url)
+
+    content = client.get(html.unescape(more_url)).content.decode()
+    assert "Land 13" in content and "Land 12" not in content
+    assert "More accounts" not in content
+
+@pytest.mark.django_db
+def test_account_parent_form(client, user_all_permissions):
+    """
+    Konto nadrzędne podajemy numerem, konto nie może trafić pod własną analitykę.
+    """
+    client.force_login(user_all_permissions)
+    fixed = SimpleTrialBalance.objects.create(account_name="Fixed assets", account_number=10, opening_balance=0, activity=0)
+
+    client.post(reverse("user_form"), {
+        "account_name": "Land",
+        "account_number": 11,
+        "opening_balance": 0,
+        "activity": 0,
+        "parent": 10,
+    })
+    land = SimpleTrialBalance.objects.get(account_number=11)
+    assert land.parent == fixed
+
+    response = client.post(reverse("update_account", args=[fixed.pk]), {
+        "account_name": "Fixed assets",
+        "account_number": 10,
+        "opening_balance": 0,
+        "activity": 0,
+        "parent": 11,
+    })
+    assert response.status_code == 200
+    assert "cannot be placed under itself" in response.content.decode()
+
+    # konta z analityką nie można usunąć samego
+    response = client.post(reverse("delete_account"), {"accounts_to_delete": [fixed.id]})
+    assert response.status_code == 200
+    assert SimpleTrialBalance.objects.filter(pk=fixed.pk).exists()
+
+@pytest.mark.django_db
+def test_period_close_view(client, user_all_permissions, django_user_model):
+    """
+    Dodanie okresu i jego zamknięcie przez widok - tylko superużytkownik, bo zamknięcie obejmuje konta wszystkich jednostek.
+    """
+    from account.models import AccountingPeriod
+
+    client.force_login(user_all_permissions)
+    assert client.get(reverse("periods")).status_code == 403
+    assert client.post(reverse("period_create"), {"name": "2026-01", "start_date": "2026-01-01", "end_date": "2026-01-31"}).status_code == 403
+
+    client.force_login(django_user_model.objects.create_superuser(username="admin", password="pw1234"))
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=10, activity=5)
+
+    client.post(reverse("period_create"), {"name": "2026-01", "start_date": "2026-01-01", "end_date": "2026-01-31"})
+    period = AccountingPeriod.objects.get(name="2026-01")
+
+    response = client.post(reverse("periods"), {"period": period.pk, "next_name": "2026-02"}, follow=True)
+    assert response.status_code == 200
+    assert "2026-02" in response.content.decode()
+    assert repr(SimpleTrialBalance.objects.get(account_number=100100)) == "account1 | 100100 | 15 | 0 | 15"
+
+    # zamknięty okres nie jest już do wyboru
+    response = client.post(reverse("periods"), {"period": period.pk})
+    assert "period" in response.context["form"].errors
+
+@pytest.mark.django_db
+def test_trial_balance_as_of_view(client):
+    from django.utils import timezone
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=10, activity=5)
+    today = timezone.localdate()
+
+    response = client.get(reverse("trial_balance_as_of"), {"as_of": today.isoformat()})
+    assert response.status_code == 200
+    assert [balance.account_number for balance in response.context["trial_balance_data"]] == [100100]
+    assert response.context["totals"] == {"opening_balance": 10, "activity": 5, "closing_balance": 15}
+
+    response = client.get(reverse("trial_balance_as_of"), {"as_of": "2000-01-01"})
+    assert "trial_balance_data" not in response.context
+    assert response.context["form"].errors["as_of"]
+
+@pytest.mark.django_db
+def test_comparison_export(client):
+    # porównanie zamkniętego okresu z bieżącą tabelą - strona i strumieniowany CSV
+    from datetime import date
+    from account.models import AccountingPeriod
+    from account.periods import close_period
+
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=10, activity=5)
+    january = AccountingPeriod.objects.create(name="2026-01", start_date=date(2026, 1, 1), end_date=date(2026, 1, 31))
+    close_period(january)
+    SimpleTrialBalance.objects.filter(account_number=100100).update(activity=-5)
+
+    params = {"base": f"period:{january.pk}", "compared": "current", "sort": "-abs_variance"}
+    response = client.get(reverse("comparison"), params)
+    assert response.status_code == 200
+    assert [tuple(row) for row in response.context["rows"]] == [(100100, "account1", 15, 10, -5, -33.33, "changed")]
+
+    response = client.get(reverse("comparison_export"), params)
+    assert response.streaming
+    assert b"".join(response.streaming_content).decode().splitlines() == [
+        "account_number,account_name,base_balance,compared_balance,variance,percent_change,status",
+        "100100,account1,15,10,-5,-33.33,changed",
+    ]
+
+    response = client.get(reverse("comparison_export"), {"base": "period:999", "compared": "current"})
+    assert response.status_code == 400
+
+@pytest.mark.django_db
+def test_analytics_1(client, django_assert_max_num_queries):
+    # statystyki liczone w NumPy, tablice w cache do następnego zapisu
+    pytest.importorskip("numpy")
+    SimpleTrialBalance.objects.create(account_name="cash", account_number=100, opening_balance=10, activity=-40)
+    SimpleTrialBalance.objects.create(account_name="payables", account_number=200, opening_balance=-50, activity=5)
+    SimpleTrialBalance.objects.create(account_name="stock", account_number=300, opening_balance=20, activity=10)
+
+    response = client.get(reverse("analytics"), {"top": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["distribution"]["closing_balance"]["count"] == 3
+    assert data["distribution"]["closing_balance"]["sum"] == -45
+    assert data["distribution"]["closing_balance"]["negative"] == 2
+    assert [mover["account_number"] for mover in data["top_movers"]] == [100, 300]
+    assert data["sign_anomalies"] == [{"account_number": 100, "account_name": "cash", "closing_balance": -30}]
+    assert data["concentration"]["top_share"] == pytest.approx(75 / 105)
+
+    with django_assert_max_num_queries(0):
+        client.get(reverse("analytics"))
+
+    SimpleTrialBalance.objects.filter(account_number=300).update(activity=-30)
+    assert client.get(reverse("analytics")).json()["sign_anomalies"][1]["account_number"] == 300
+
+@pytest.mark.django_db
+def test_analytics_2(client, monkeypatch):
+    # bez NumPy endpoint odpowiada 501
+    from account import analytics
+
+    monkeypatch.setattr(analytics, "np", None)
+    response = client.get(reverse("analytics"))
+    assert response.status_code == 501
+
+def grid_post_data(formset, changes):
+    # dane POST z wyrenderowanej siatki; changes - {indeks wiersza: {pole: nowa wartość}}
+    data = {key: value for key, value in formset.management_form.initial.items()}
+    data = {f"{formset.prefix}-{key}": value for key, value in data.items()}
+    for index, form in enumerate(formset.forms):
+        data[f"{form.prefix}-id"] = form.instance.pk
+        for name in ["account_name", "account_number", "opening_balance"]:
+            data[f"{form.prefix}-{name}"] = changes.get(index, {}).get(name, form.initial[name])
+    return data
+
+@pytest.mark.django_db
+def test_account_grid_1(client, user_all_permissions, django_assert_max_num_queries):
+    """
+    Siatka edycji - tylko zmienione wiersze zapisane jednym bulk_update, zmiana numeru przesuwa poddrzewo.
+    """
+    client.force_login(user_all_permissions)
+    parent = SimpleTrialBalance.objects.create(account_name="account1", account_number=100, opening_balance=0, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=200, opening_balance=0, activity=0)
+    child = SimpleTrialBalance.objects.create(account_name="child", account_number=300, opening_balance=0, activity=0, parent=parent)
+
+    response = client.get(reverse("account_grid"))
+    formset = response.context["formset"]
+    assert [form.instance.account_number for form in formset] == [100, 200, 300]
+
+    data = grid_post_data(formset, {0: {"account_number": 101}, 1: {"account_name": "renamed"}})
+    data[f"{formset.forms[0].prefix}-activity"] = 5 # activity nie jest polem siatki - zmienia się tylko przez dziennik
+    with django_assert_max_num_queries(12):
+        response = client.post(reverse("account_grid"), data)
+    assert response.status_code == 302
+
+    assert repr(SimpleTrialBalance.objects.get(account_number=101)) == "account1 | 101 | 0 | 0 | 0"
+    assert SimpleTrialBalance.objects.get(account_number=200).account_name == "renamed"
+    child.refresh_from_db()
+    assert child.path == "0000000101/0000000300/"
+
+@pytest.mark.django_db
+def test_account_grid_2(client, user_basic_permissions, user_all_permissions):
+    # siatka tylko dla pełnych uprawnień, numer zajęty przez inne konto nie jest zapisany
+    new_hire = User.objects.create_user(username="new_hire", password="pw1234")
+    new_hire.groups.add(Group.objects.get_or_create(name="new_hire_permissions")[0])
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100, opening_balance=10, activity=0)
+    SimpleTrialBalance.objects.create(account_name="account2", account_number=200, opening_balance=20, activity=0)
+
+    assert client.get(reverse("account_grid")).status_code == 403
+    for user in [user_basic_permissions, new_hire]:
+        client.force_login(user)
+        assert client.get(reverse("account_grid")).status_code == 403
+        assert client.post(reverse("account_grid"), {"form-0-id": "1", "form-0-account_name": "hacked"}).status_code == 403
+
+    client.force_login(user_all_permissions)
+    formset = client.get(reverse("account_grid")).context["formset"]
+    data = grid_post_data(formset, {1: {"account_number": 100}})
+    data[f"{formset.forms[0].prefix}-id"] = "²" # id spoza ASCII jest pomijane, a nie kończy się błędem 500
+    response = client.post(reverse("account_grid"), data)
+    assert response.status_code == 200
+    assert response.context["formset"].errors[1]["account_number"]
+    assert SimpleTrialBalance.objects.filter(account_number=200).exists()
+    assert SimpleTrialBalance.objects.get(account_number=100).account_name == "account1"
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_replica_routing_1(client, user_all_permissions, settings):
+    """
+    Raporty czytają z repliki, a po zapisie sesja czyta z bazy głównej (read-your-writes).
+    """
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+
+    settings.READ_REPLICA = "replica"
+    account = SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+    client.force_login(user_all_permissions)
+
+    with CaptureQueriesContext(connections["replica"]) as replica_queries:
+        response = client.get(reverse("trial_balance"))
+        b"".join(client.get(reverse("trial_balance_export")).streaming_content)
+    assert response.status_code == 200
+    assert any("account_simpletrialbalance" in query["sql"] for query in replica_queries)
+    assert replica_queries[-1]["sql"].startswith('SELECT "account_simpletrialbalance"."account_name"') # eksport czytany po wyjściu z widoku
+
+    # porównanie sald (surowe SQL) też czyta z repliki - strona i eksport strumieniowany po wyjściu z widoku
+    params = {"base": "current", "compared": "current"}
+    with CaptureQueriesContext(connections["default"]) as default_queries, CaptureQueriesContext(connections["replica"]) as replica_queries:
+        assert client.get(reverse("comparison"), params).status_code == 200
+        b"".join(client.get(reverse("comparison_export"), params).streaming_content)
+    assert sum("UNION ALL" in query["sql"] for query in replica_queries) == 2
+    assert not any("UNION ALL" in query["sql"] for query in default_queries)
+
+    data = {"account_name": "renamed", "account_number": 100100, "opening_balance": 0, "activity": 0}
+    assert client.post(reverse("update_account", kwargs={"pk": account.pk}), data).status_code == 302
+    with CaptureQueriesContext(connections["replica"]) as replica_queries:
+        client.get(reverse("trial_balance"), {"sort": "account_name"})
+    assert not replica_queries
+
+@pytest.mark.django_db(transaction=True)
+def test_replica_routing_2(tmp_path, settings):
+    # kopia bazy przez backup API, bez pliku repliki raporty czytają z bazy głównej
+    import sqlite3
+    from django.db import connections
+    from account.routing import refresh_replica, replica_alias
+
+    settings.READ_REPLICA = "replica"
+    SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=5, activity=0)
+    target = tmp_path / "replica.sqlite3"
+    refresh_replica(target=str(target))
+
+    replica = sqlite3.connect(target)
+    assert replica.execute("SELECT account_number, closing_balance FROM account_simpletrialbalance").fetchall() == [(100100, 5)]
+    replica.close()
+
+    connections["replica"].settings_dict["NAME"] = str(tmp_path / "missing.sqlite3")
+    try:
+        assert replica_alias() is None
+        connections["replica"].settings_dict["NAME"] = str(target)
+        assert replica_alias() == "replica"
+    finally:
+        connections["replica"].settings_dict["NAME"] = connections["default"].settings_dict["NAME"]
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_replica_routing_3(client, user_all_permissions, settings):
+    """
+    Strona z repliki ma własny klucz cache i ETag, bez Last-Modified - sesja czytająca po zapisie z bazy głównej
+    nie dostaje z cache strony wyrenderowanej z (starszej) repliki.
+    """
+    from django.db import connections
+    from django.test import Client, RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from account.caching import data_etag, data_last_modified
+    from account.routing import read_alias
+
+    settings.READ_REPLICA = "replica"
+    account = SimpleTrialBalance.objects.create(account_name="account1", account_number=100100, opening_balance=0, activity=0)
+    client.force_login(user_all_permissions)
+    data = {"account_name": "renamed", "account_number": 100100, "opening_balance": 0, "activity": 0}
+    assert client.post(reverse("update_account", kwargs={"pk": account.pk}), data).status_code == 302
+
+    response = Client().get(reverse("trial_balance")) # inna sesja - czyta z repliki
+    assert response.status_code == 200
+    assert not response.has_header("Last-Modified")
+
+    with CaptureQueriesContext(connections["default"]) as default_queries:
+        response = client.get(reverse("trial_balance"))
+    assert response.has_header("Last-Modified")
+    assert any("account_simpletrialbalance" in query["sql"] for query in default_queries)
+
+    request = RequestFactory().get(reverse("trial_balance"))
+    token = read_alias.set("replica")
+    try:
+        replica_etag, replica_modified = data_etag(request), data_last_modified(request)
+    finally:
+        read_alias.reset(token)
+    assert replica_etag != data_etag(request)
+    assert replica_modified is None
+
+@pytest.mark.django_db
+def test_async_views(async_client):
+    """
+    Widoki async - strona, wyszukiwarka i strumieniowany eksport przez async ORM.
+    """
+    from asgiref.sync import async_to_sync
+
+    SimpleTrialBalance.objects.create(account_name="bank", account_number=100100, opening_balance=10, activity=5)
+    SimpleTrialBalance.objects.create(account_name="cash", account_number=100200, opening_balance=0, activity=1)
+
+    async def requests():
+        page = await async_client.get(reverse("trial_balance_async"), {"page_size": 1, "subtotals": 1})
+        lookup = await async_client.get(reverse("account_lookup_async"), {"q": "ca"})
+        export = await async_client.get(reverse("trial_balance_export_async"))
+        content = b"".join([chunk async for chunk in export.streaming_content])
+        return page, lookup, content
+
+    page, lookup, content = async_to_sync(requests)()
+    assert page.status_code == 200
+    assert "100100" in page.context["trial_balance_table"] and "100200" not in page.context["trial_balance_table"]
+    assert page.context["export_url"] == reverse("trial_balance_export_async") + "?subtotals=1"
+    assert lookup.json() == {"results": [{"id": SimpleTrialBalance.objects.get(account_number=100200).pk, "account_number": 100200, "account_name": "cash"}]}
+    assert content.decode().splitlines() == [
+        "account_name,account_number,opening_balance,activity,closing_balance",
+        "bank,100100,10,5,15",
+        "cash,100200,0,1,1",
+    ]
+
+@pytest.mark.django_db
+def test_entities_2(client, user_all_permissions):
+    """
+    Widoki i formularze działają tylko na kontach jednostki użytkownika - konta innej jednostki nie da się wybrać ani usunąć.
+    """
+    from account.models import Entity, EntityMember
+
+    foreign = SimpleTrialBalance.objects.create(account_name="default bank", account_number=100100, opening_balance=0, activity=0)
+    entity = Entity.objects.create(name="Subsidiary")
+    EntityMember.objects.create(user=user_all_permissions, entity=entity)
+    client.force_login(user_all_permissions)
+
+    # nowe konto trafia do jednostki użytkownika, ten sam numer co w jednostce domyślnej jest dozwolony
+    data = {"account_name": "subsidiary bank", "account_number": 100100, "opening_balance": 7, "activity": 0}
+    assert client.post(reverse("user_form"), data).status_code == 302
+    own = SimpleTrialBalance.objects.get(entity=entity)
+    assert own.account_number == 100100
+
+    response = client.post(reverse("user_form"), data) # duplikat w tej samej jednostce
+    assert response.status_code == 200
+    assert "already exists" in response.content.decode()
+
+    response = client.get(reverse("trial_balance"))
+    assert "subsidiary bank" in response.content.decode()
+    assert "default bank" not in response.content.decode()
+    assert client.get(reverse("account_lookup"), {"q": "100"}).json()["results"] == [
+        {"id": own.pk, "account_number": 100100, "account_name": "subsidiary bank"}
+    ]
+
+    response = client.post(reverse("delete_account"), {"accounts_to_delete": [foreign.pk]})
+    assert response.status_code == 200 # konto spoza jednostki - błąd walidacji, nic nie jest usuwane
+    assert SimpleTrialBalance.objects.filter(pk=foreign.pk).exists()
+    assert client.post(reverse("account_update_select"), {"account_update_select": foreign.pk}).status_code == 200
+    assert client.get(reverse("update_account", kwargs={"pk": foreign.pk})).status_code == 404
+
+@pytest.mark.django_db
+def test_live_updates_2(async_client, settings):
+    """
+    Strumień SSE: kursor na start, zdarzenie delta po zmianie kont (z id do wznowienia przez Last-Event-ID), keepalive.
+    """
+    import json
+    from asgiref.sync import async_to_sync, sync_to_async
+    from account.live import get_hub
+
+    settings.LIVE_UPDATES_KEEPALIVE = 0.05
+    settings.LIVE_UPDATES_MAX_SECONDS = 0.5
+    account = SimpleTrialBalance.objects.create(account_name="bank", account_number=100100, opening_balance=10, activity=0)
+
+    def post():
+        SimpleTrialBalance.objects.filter(pk=account.pk).update(activity=5)
+
+    async def stream(**headers):
+        response = await async_client.get(reverse("trial_balance_stream"), {"number_from": 100000}, headers=headers)
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        await sync_to_async(post)()
+        get_hub().publish({"entity_id": None})
+        return response, first, [chunk async for chunk in chunks]
+
+    response, first, rest = async_to_sync(stream)()
+    assert response["Content-Type"] == "text/event-stream"
+    assert first.decode().startswith("retry: ")
+    events = [chunk.decode() for chunk in rest if not chunk.startswith(b":")]
+    assert len(events) == 1 and any(chunk.startswith(b": keepalive") for chunk in rest)
+    event_id, name, data = events[0].strip().split("\n")
+    assert name == "event: delta"
+    assert json.loads(data.removeprefix("data: ")) == {
+        "changes": [{"action": "updated", "account_number": 100100, "account_name": "bank", "opening_balance": 10, "activity": 5, "closing_balance": 15}],
+        "totals": {"opening_balance": 10, "activity": 5, "closing_balance": 15},
+    }
+
+    # wznowienie od kursora sprzed zmiany - ta sama zmiana jest wysyłana ponownie
+    start = first.decode().split("id: ")[1].strip()
+    response, first, rest = async_to_sync(stream)(**{"Last-Event-ID": start})
+    assert first.decode().split("id: ")[1].strip() == start
+    assert sum(chunk.startswith(b"id: ") for chunk in rest) == 1
+
+    # niepoprawny Last-Event-ID (cyfra spoza ASCII, liczba poza zakresem SQLite) - strumień od bieżącego stanu, bez błędu 500
+    for last_event_id in ["²", "9" * 30]:
+        response, first, rest = async_to_sync(stream)(**{"Last-Event-ID": last_event_id})
+        assert response.status_code == 200
+        assert int(first.decode().split("id: ")[1].strip()) > int(start)
+
+    page = async_to_sync(async_client.get)(reverse("trial_balance_async"), {"number_from": 100000})
+    assert page.context["stream_url"] == reverse("trial_balance_stream") + "?number_from=100000"
+    assert 'tr data-account="100100"' in page.content.decode()
+    assert 'if (change.action === "created") added.add(change.account_number);' in page.content.decode() # zmiany kont z innych stron nie są nowymi kontami
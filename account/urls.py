@@ -7,12 +7,32 @@ urlpatterns = [
     path('user_logout/', views.UserLogoutView.as_view(), name='user_logout'),
     # path('trial_balance/', views.TrialBalanceListView.as_view(), name='trial_balance'), # poprzedni url kiedy nie było jeszcze parent view
     path('trial_balance/', views.ParentViewTrialBalance.as_view(), name='trial_balance'),
+    path('trial_balance/tree/', views.TrialBalanceTreeView.as_view(), name='trial_balance_tree'),
+    path('trial_balance/tree/roots/', views.TrialBalanceTreeChildrenView.as_view(), name='trial_balance_tree_roots'),
+    path('trial_balance/tree/<int:pk>/', views.TrialBalanceTreeChildrenView.as_view(), name='trial_balance_tree_children'),
+    path('trial_balance/as_of/', views.TrialBalanceAsOfView.as_view(), name='trial_balance_as_of'),
+    path('trial_balance/export/', views.TrialBalanceExportView.as_view(), name='trial_balance_export'),
     path('user_form/', views.AccountCreateView.as_view(), name='user_form'),
     path('login/', views.UserLoginView.as_view(), name='login'),
     path('user_registration/', views.UserRegisterView.as_view(), name='user_registration'),
+    path('import_accounts/', views.AccountImportView.as_view(), name='import_accounts'),
     path('delete_account/', views.AccountDeleteView.as_view(), name='delete_account'),
+    path('bulk_delete_account/', views.AccountBulkDeleteView.as_view(), name='bulk_delete_account'),
     path('account_update_select/', views.AccountUpdateSelectView.as_view(), name='account_update_select'),
     path('update_account/<int:pk>/', views.AccountUpdateView.as_view(), name='update_account'),
+    path('analytics/', views.AnalyticsView.as_view(), name='analytics'),
+    path('account_grid/', views.AccountGridView.as_view(), name='account_grid'),
+    path('account_lookup/', views.AccountLookupView.as_view(), name='account_lookup'),
+    path('comparison/', views.ComparisonView.as_view(), name='comparison'),
+    path('comparison/export/', views.ComparisonExportView.as_view(), name='comparison_export'),
+    path('periods/', views.PeriodCloseView.as_view(), name='periods'),
+    path('periods/new/', views.PeriodCreateView.as_view(), name='period_create'),
+    path('post_activity/', views.ActivityPostView.as_view(), name='post_activity'),
+    # widoki async (ASGI) - te same odczyty bez blokowania wątku na czas zapytań i pobierania eksportu
+    path('async/trial_balance/', views.AsyncTrialBalanceView.as_view(), name='trial_balance_async'),
+    path('async/trial_balance/export/', views.AsyncTrialBalanceExportView.as_view(), name='trial_balance_export_async'),
+    path('async/trial_balance/stream/', views.AsyncTrialBalanceStreamView.as_view(), name='trial_balance_stream'),
+    path('async/account_lookup/', views.AsyncAccountLookupView.as_view(), name='account_lookup_async'),
     # do resetowania hasła - gotowe widoki już istniejące w django
     path('reset_password//', auth_views.PasswordResetView.as_view(), name='password_reset'),
     path('reset_password_sent/', auth_views.PasswordResetDoneView.as_view(), name='password_reset_done'),
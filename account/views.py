@@ -1,17 +1,40 @@
 # Create your views here.
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.shortcuts import render, redirect
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden
+from django.shortcuts import get_object_or_404, render, redirect
+import csv
+import io
+import json
+
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.template import loader
+from django.template.loader import render_to_string
 from django.views.generic.edit import FormView, CreateView
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, TemplateView, ListView, UpdateView
+from django.db import IntegrityError, transaction
+from django.db.models import Count, ProtectedError
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.generic import CreateView, DeleteView, TemplateView, ListView, UpdateView, View
 from django.contrib.auth import login, get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.auth.views import LoginView, LogoutView
 
+from .analytics import AnalyticsUnavailable, trial_balance_analytics
+from .caching import acached_fragment, cached_fragment, data_etag, data_last_modified
+from .comparison import comparison_sources, iter_comparison
 from .forms import *
 from .models import *
+from .history import HistoryUnavailable, balances_as_of
+from .importers import import_accounts
+from .ledger import post_journal_entry
+from .live import live_updates
+from .pagination import KeysetPaginator
+from .periods import PeriodClosedError, close_period
+from .permissions import GroupRequiredMixin, SuperuserRequiredMixin
+from .routing import ReadReplicaMixin
 
 
 class HelloView(TemplateView):
@@ -43,15 +66,10 @@ class UserRegisterView(FormView):
         return super().form_valid(form)
 
 
-class AccountCreateView(CreateView):
+class AccountCreateView(GroupRequiredMixin, CreateView): # GroupRequiredMixin - tylko grupa 'all_permissions', inaczej 403
     template_name = 'user_form.html'
     form_class = TrialBalanceForm
     success_url = reverse_lazy('trial_balance')
-
-    def dispatch(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='all_permissions').exists(): # jeśli użytkownik nie należy do grupy 'all_permissions' to zwróci się na Httpresponse forbidden, jeśli jednak nim jest to dostanie standardową metodę dispatch
-            raise PermissionDenied # django w ten sposób przekieruje do 403.html zapisanego w tamples (nadpisanego)
-        return super().dispatch(request, *args, **kwargs)
     
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -59,21 +77,115 @@ class AccountCreateView(CreateView):
         return kwargs
 
 
-class AccountDeleteView(FormView):
+PROTECTED_ACCOUNT_MESSAGE = 'Some accounts still have sub-accounts or journal lines. Delete or move the sub-accounts first; accounts with journal lines cannot be deleted.'
+
+
+class AccountDeleteView(GroupRequiredMixin, FormView):
     template_name = 'delete_account.html'
     form_class = AccountDeleteForm
 
-    def dispatch(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='all_permissions').exists(): # jeśli użytkownik nie należy do grupy 'all_permissions' to zwróci się na Httpresponse forbidden, jeśli jednak nim jest to dostanie standardową metodę dispatch
-            raise PermissionDenied # django w ten sposób przekieruje do 403.html zapisanego w tamples (nadpisanego)
-        return super().dispatch(request, *args, **kwargs)
-
     def form_valid(self, form):
         accounts_to_delete = form.cleaned_data['accounts_to_delete']
-        accounts_to_delete.delete()
+        try:
+            with transaction.atomic(): # wybrane konta razem z analitykami (od najgłębszych) albo żadne
+                accounts_to_delete.delete_in_batches()
+        except ProtectedError:
+            form.add_error(None, PROTECTED_ACCOUNT_MESSAGE)
+            return self.form_invalid(form)
+        return redirect('trial_balance')
+
+
+class AccountBulkDeleteView(GroupRequiredMixin, FormView):
+    '''
+    Usuwanie kont według kryteriów: pierwszy POST pokazuje liczbę pasujących kont, drugi (confirm) je usuwa.
+    '''
+    template_name = 'bulk_delete_account.html'
+    form_class = AccountBulkDeleteForm
+
+    def form_valid(self, form):
+        accounts = SimpleTrialBalance.objects.search(**form.filters())
+        if not form.cleaned_data['confirm']:
+            preview = self.form_class(initial={**form.filters(), 'confirm': True})
+            return self.render_to_response(self.get_context_data(form=preview, preview_count=accounts.count()))
+
+        try:
+            accounts.delete_in_batches(batch_size=settings.ACCOUNT_DELETE_BATCH_SIZE)
+        except ProtectedError:
+            # porcje usunięte wcześniej zostają usunięte - pokazujemy ile kont jeszcze pasuje
+            form.add_error(None, PROTECTED_ACCOUNT_MESSAGE)
+            return self.form_invalid(form)
         return redirect('trial_balance')
 
 
+class AccountImportView(GroupRequiredMixin, FormView): # import może nadpisać dowolne konto, więc tylko pełne uprawnienia
+    template_name = 'account_import.html'
+    form_class = AccountImportForm
+
+    def form_valid(self, form):
+        # plik czytamy strumieniowo, bez wczytywania całości do pamięci
+        text_stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+        try:
+            result = import_accounts(text_stream, user=self.request.user)
+        except UnicodeDecodeError:
+            # plik jest dekodowany w trakcie czytania - porcje zapisane przed błędnym znakiem zostają zaimportowane
+            form.add_error('file', 'The file is not UTF-8 encoded text. Rows before the first invalid character may already be imported.')
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+class PeriodCloseView(SuperuserRequiredMixin, FormView): # okresy są wspólne dla jednostek, zamknięcie zmienia konta każdej z nich
+    '''
+    Lista okresów i zamknięcie okresu - salda są kopiowane do historii, a closing_balance przechodzi na opening_balance.
+    '''
+    template_name = 'periods.html'
+    form_class = PeriodCloseForm
+    success_url = reverse_lazy('periods')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['periods'] = AccountingPeriod.objects.annotate(accounts=Count('balances'))
+        return context
+
+    def form_valid(self, form):
+        try:
+            close_period(form.cleaned_data['period'], next_name=form.cleaned_data['next_name'] or None)
+        except (PeriodClosedError, IntegrityError) as error: # IntegrityError - nazwa następnego okresu jest już zajęta
+            form.add_error(None, str(error))
+            return self.form_invalid(form)
+        return super().form_valid(form)
+
+
+class TrialBalanceAsOfView(ReadReplicaMixin, TemplateView):
+    '''
+    Zestawienie obrotów i sald na wskazany dzień - odtworzone z migawki i dziennika zmian (account/history.py).
+    '''
+    template_name = 'trial_balance_as_of.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = TrialBalanceAsOfForm(self.request.GET or None)
+        context['form'] = form
+        if form.is_valid():
+            try:
+                balances = balances_as_of(form.moment())
+            except HistoryUnavailable as error:
+                form.add_error('as_of', str(error))
+            else:
+                context['trial_balance_data'] = balances
+                context['totals'] = {
+                    'opening_balance': sum(balance.opening_balance for balance in balances),
+                    'activity': sum(balance.activity for balance in balances),
+                    'closing_balance': sum(balance.closing_balance for balance in balances),
+                }
+        return context
+
+
+class PeriodCreateView(SuperuserRequiredMixin, CreateView):
+    template_name = 'user_form.html'
+    form_class = AccountingPeriodForm
+    success_url = reverse_lazy('periods')
+
+
 class AccountUpdateSelectView(FormView):
     template_name = 'account_update_select.html'
     form_class = AccountUpdateSelect
@@ -97,28 +209,457 @@ class AccountUpdateView(UpdateView):
         return kwargs
 
 
-class ParentViewTrialBalance(TemplateView):
+class KeysetPageMixin:
+    # rozmiar strony i linki do sąsiednich stron dla widoków stronicowanych KeysetPaginatorem
+    def get_page_size(self):
+        try:
+            page_size = int(self.request.GET.get('page_size', settings.TRIAL_BALANCE_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.TRIAL_BALANCE_PAGE_SIZE
+        return max(1, min(page_size, settings.TRIAL_BALANCE_MAX_PAGE_SIZE))
+
+    def page_url(self, after=None, before=None):
+        # zachowujemy pozostałe parametry (np. page_size), podmieniamy tylko kursor
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        if after:
+            params['after'] = after
+        if before:
+            params['before'] = before
+        return f'?{params.urlencode()}'
+
+
+class AccountGridView(GroupRequiredMixin, KeysetPageMixin, TemplateView): # zmienia dowolne konta jednostki, więc tylko pełne uprawnienia
+    '''
+    Edycja wielu kont naraz - formset na jednej stronie przefiltrowanych kont.
+    Zapisywane są tylko zmienione wiersze, jednym bulk_update w jednej transakcji.
+    '''
+    template_name = 'account_grid.html'
+
+    def get(self, request, *args, **kwargs):
+        search_form = TrialBalanceSearchForm(request.GET)
+        queryset = SimpleTrialBalance.objects.search(**search_form.filters())
+        paginator = KeysetPaginator(queryset, ordering=('account_number', 'id'), page_size=self.get_page_size())
+        page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+        formset = AccountGridFormSet(
+            queryset=SimpleTrialBalance.objects.filter(pk__in=[account.pk for account in page]),
+            form_kwargs={'user': request.user},
+        )
+        return self.render_to_response(self.get_context_data(
+            search_form=search_form,
+            formset=formset,
+            next_page_url=self.page_url(after=page.next_cursor) if page.has_next else None,
+            previous_page_url=self.page_url(before=page.previous_cursor) if page.has_previous else None,
+        ))
+
+    def post(self, request, *args, **kwargs):
+        # wiersze z przesłanej siatki (a nie ponownie wyliczona strona - w międzyczasie mogła się przesunąć), jednym zapytaniem
+        ids = [value for key, value in request.POST.items() if key.endswith('-id') and value.isascii() and value.isdecimal()]
+        formset = AccountGridFormSet(
+            request.POST,
+            queryset=SimpleTrialBalance.objects.filter(pk__in=ids).select_related('parent'),
+            form_kwargs={'user': request.user},
+        )
+        if formset.is_valid():
+            changed = formset.changed_forms()
+            fields = sorted({name for form in changed for name in form.changed_data})
+            try:
+                if changed:
+                    SimpleTrialBalance.objects.save_changed([form.instance for form in changed], fields)
+            except IntegrityError: # np. zamiana numerów dwóch kont - unikalność sprawdzana jest wiersz po wierszu
+                error = 'Account numbers could not be saved, another account already uses one of them.'
+            else:
+                return redirect(request.get_full_path())
+        else:
+            error = None
+        return self.render_to_response(self.get_context_data(search_form=TrialBalanceSearchForm(request.GET), formset=formset, error=error))
+
+
+class AccountLookupView(View):
+    '''
+    Wyszukiwarka kont (autocomplete): ?q=<początek numeru lub nazwy>&limit=<n>, zwraca id, account_number i account_name.
+    '''
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        accounts = self.get_queryset()
+        results = list(accounts[:self.get_limit()]) if accounts is not None else []
+        return JsonResponse({'results': results})
+
+    def get_queryset(self):
+        query = self.request.GET.get('q', '').strip()
+        if not query:
+            return None
+        if query.isascii() and query.isdecimal(): # isdigit() przepuszcza np. '²', którego int() nie przyjmie
+            accounts = SimpleTrialBalance.objects.number_prefix(query).order_by('account_number')
+        else:
+            accounts = SimpleTrialBalance.objects.name_prefix(query).order_by('name_key', 'id')
+        return accounts.values('id', 'account_number', 'account_name')
+
+    def get_limit(self):
+        try:
+            return max(1, min(int(self.request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return self.default_limit
+
+
+class AsyncAccountLookupView(AccountLookupView):
+    # wersja dla serwera ASGI - to samo zapytanie wykonane przez async ORM
+    async def get(self, request, *args, **kwargs):
+        accounts = self.get_queryset()
+        results = [row async for row in accounts[:self.get_limit()]] if accounts is not None else []
+        return JsonResponse({'results': results})
+
+
+class AnalyticsView(ReadReplicaMixin, View):
+    '''
+    Statystyki trial balance w JSON (rozkład sald, największe zmiany, koncentracja, anomalie znaku): ?top=<n>.
+    '''
+    default_top = 10
+    max_top = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            top = max(1, min(int(request.GET.get('top', self.default_top)), self.max_top))
+        except ValueError:
+            top = self.default_top
+        try:
+            return JsonResponse(trial_balance_analytics(top=top))
+        except AnalyticsUnavailable as error:
+            return JsonResponse({'error': str(error)}, status=501)
+
+
+class ActivityPostView(View):
+    '''
+    Księgowanie zmian activity dla wielu kont naraz: POST z JSON {"account_number": delta, ...}.
+    Zmiany trafiają do dziennika jako jeden wpis. Zwraca nowe closing_balance zaktualizowanych kont.
+    '''
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            deltas = json.loads(request.body)
+            if not isinstance(deltas, dict):
+                raise ValueError
+            entry, closing_balances = post_journal_entry(deltas.items(), description='Batch activity posting', user=request.user)
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Expected a JSON object of {account_number: delta} integers.'}, status=400)
+        except SimpleTrialBalance.DoesNotExist as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        return JsonResponse({'closing_balances': {str(number): balance for number, balance in closing_balances.items()}})
+
+
+# odpowiedź 304 Not Modified, jeśli dane się nie zmieniły od poprzedniego pobrania; no-cache - przeglądarka zawsze pyta serwer
+conditional_get = [
+    cache_control(private=True, no_cache=True),
+    condition(etag_func=data_etag, last_modified_func=data_last_modified),
+]
+
+
+@method_decorator(conditional_get, name='get')
+class ParentViewTrialBalance(ReadReplicaMixin, KeysetPageMixin, TemplateView):
     template_name = 'trial_balance.html'
+    # sortowanie -> klucz paginacji; każdy klucz kończy się id i jest obsłużony indeksem (id jest rowid w SQLite)
+    orderings = {
+        'account_number': ('account_number', 'id'),
+        '-account_number': ('-account_number', '-id'),
+        'account_name': ('name_key', 'id'),
+        '-account_name': ('-name_key', '-id'),
+        'closing_balance': ('closing_balance', 'id'),
+        '-closing_balance': ('-closing_balance', '-id'),
+    }
+
+    dropdown_list_main = [
+        {'name': 'Add account', 'class': 'AccountCreateView'},
+        {'name': 'Delete account', 'class': 'AccountDeleteView'},
+        {'name': 'Update account', 'class': 'AccountUpdateSelectView'},
+        {'name': 'Edit many accounts', 'class': 'AccountGridView'},
+        {'name': 'Delete accounts by criteria', 'class': 'AccountBulkDeleteView'},
+        {'name': 'Import accounts', 'class': 'AccountImportView'},
+        {'name': 'Chart of accounts (tree)', 'class': 'TrialBalanceTreeView'},
+        {'name': 'Accounting periods', 'class': 'PeriodCloseView'},
+        {'name': 'Trial balance as of date', 'class': 'TrialBalanceAsOfView'},
+        {'name': 'Compare periods', 'class': 'ComparisonView'},
+    ]
+    export_view_name = 'trial_balance_export'
 
     def get_context_data(self, **kwargs):
+        search_form = TrialBalanceSearchForm(self.request.GET)
+        # tabela jest renderowana tylko gdy nie ma jej w cache dla aktualnej wersji danych i tych samych parametrów
+        table = cached_fragment(
+            'table', self.table_params(), lambda: render_to_string('trial_balance_table.html', self.get_table_context(search_form))
+        )
+        return self.page_context(search_form, table, **kwargs)
+
+    def page_context(self, search_form, table, **kwargs):
         context = super().get_context_data(**kwargs)
-        # pobieranie danych z MODELU
-        context['trial_balance_data'] = SimpleTrialBalance.objects.all() 
-        # dropdown:
-        context['dropdown_list_main'] = [
-            {'name': 'Add account', 'class': 'AccountCreateView'},
-            {'name': 'Delete account', 'class': 'AccountDeleteView'},
-            {'name': 'Update account', 'class': 'AccountUpdateSelectView'},
-        ]
+        context['search_form'] = search_form
+        context['trial_balance_table'] = table
+        context['export_url'] = self.export_url()
+        context['dropdown_list_main'] = self.dropdown_list_main
         return context
-    
-    def get(self, request, *args, **kwargs):
-        action = request.GET.get('action')
 
+    def get_table_context(self, search_form):
+        paginator, filtered, subtotal_length = self.table_querysets(search_form)
+        page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        return self.table_context(
+            page,
+            totals=filtered.totals(), # sumy całego przefiltrowanego zestawu, nie tylko bieżącej strony
+            subtotals=filtered.subtotals(subtotal_length) if subtotal_length else None,
+        )
+
+    def table_querysets(self, search_form):
+        # pobieranie danych z MODELU - tylko jedna strona przefiltrowanych kont, paginacja po kluczu sortowania
+        queryset = SimpleTrialBalance.objects.search(**search_form.filters())
+        ordering = self.orderings[search_form.sort_key()]
+        paginator = KeysetPaginator(queryset, ordering=ordering, page_size=self.get_page_size())
+        filtered = SimpleTrialBalance.objects.search(**search_form.filters())
+        return paginator, filtered, search_form.subtotal_length()
+
+    def table_context(self, page, totals, subtotals):
+        return {
+            'trial_balance_data': page,
+            'page': page,
+            'next_page_url': self.page_url(after=page.next_cursor) if page.has_next else None,
+            'previous_page_url': self.page_url(before=page.previous_cursor) if page.has_previous else None,
+            'totals': totals,
+            'subtotals': subtotals,
+        }
+
+    def table_params(self):
+        params = self.request.GET.copy()
+        params.pop('action', None)
+        return params
+
+    def export_url(self):
+        return self.filtered_url(self.export_view_name)
+
+    def filtered_url(self, view_name):
+        # eksport (i strumień zmian) z tymi samymi filtrami co widoczna tabela
+        params = self.request.GET.copy()
+        for key in ['after', 'before', 'page_size', 'sort', 'action']:
+            params.pop(key, None)
+        query = params.urlencode()
+        return reverse(view_name) + (f'?{query}' if query else '')
+
+    def action_redirect(self, action):
         if action == 'AccountDeleteView':
             return redirect('delete_account')
         elif action == 'AccountUpdateSelectView':
             return redirect('account_update_select')
+        elif action == 'AccountGridView':
+            return redirect('account_grid')
         elif action == 'AccountCreateView':
             return redirect('user_form')
+        elif action == 'AccountImportView':
+            return redirect('import_accounts')
+        elif action == 'AccountBulkDeleteView':
+            return redirect('bulk_delete_account')
+        elif action == 'TrialBalanceTreeView':
+            return redirect('trial_balance_tree')
+        elif action == 'PeriodCloseView':
+            return redirect('periods')
+        elif action == 'TrialBalanceAsOfView':
+            return redirect('trial_balance_as_of')
+        elif action == 'ComparisonView':
+            return redirect('comparison')
+        return None
+
+    def get(self, request, *args, **kwargs):
+        response = self.action_redirect(request.GET.get('action'))
+        if response is not None:
+            return response
         return super().get(request, *args, **kwargs)
+
+
+@method_decorator(conditional_get, name='get')
+class AsyncTrialBalanceView(ParentViewTrialBalance):
+    '''
+    Trial balance dla serwera ASGI - zapytania idą przez async ORM, więc czekając na bazę widok nie blokuje wątku.
+    '''
+    export_view_name = 'trial_balance_export_async'
+
+    async def get(self, request, *args, **kwargs):
+        response = self.action_redirect(request.GET.get('action'))
+        if response is not None:
+            return response
+        search_form = TrialBalanceSearchForm(request.GET)
+        table = await acached_fragment('table', self.table_params(), lambda: self.arender_table(search_form))
+        context = self.page_context(search_form, table, **kwargs)
+        context['stream_url'] = self.filtered_url('trial_balance_stream') # strona poprawia zmienione wiersze i sumy na bieżąco
+        return self.render_to_response(context)
+
+    async def arender_table(self, search_form):
+        paginator, filtered, subtotal_length = self.table_querysets(search_form)
+        page = await paginator.apage(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        context = self.table_context(
+            page,
+            totals=await filtered.atotals(),
+            subtotals=[row async for row in filtered.subtotals(subtotal_length)] if subtotal_length else None,
+        )
+        return render_to_string('trial_balance_table.html', context)
+
+
+class AsyncTrialBalanceStreamView(View):
+    '''
+    Strumień Server-Sent Events ze zmianami kont jednostki użytkownika (account/live.py) - tylko dla serwera ASGI,
+    pod WSGI otwarte połączenie zajmowałoby wątek workera. Czyta z bazy głównej (bez ReadReplicaMixin), bo replika jest opóźniona.
+    '''
+    async def get(self, request, *args, **kwargs):
+        search_form = TrialBalanceSearchForm(request.GET)
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        # isdigit() przepuszcza np. '²', którego int() nie przyjmie; dłuższy numer nie zmieściłby się w INTEGER SQLite
+        valid_id = last_event_id.isascii() and last_event_id.isdecimal() and len(last_event_id) <= 18
+        after = int(last_event_id) if valid_id else None
+        response = StreamingHttpResponse(live_updates(after, search_form.filters()), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no' # nginx nie buforuje zdarzeń
+        return response
+
+
+def tree_nodes(parent=None, after=None, page_size=None):
+    """
+    Dzieci konta (albo konta najwyższego poziomu) z sumami całych poddrzew, stronami po page_size kont (paginacja keyset) -
+    płaski plan kont z importu to wszystkie konta na najwyższym poziomie. Zwraca (węzły, strona); dwa zapytania na stronę
+    niezależnie od głębokości i wielkości planu kont.
+    """
+    children = SimpleTrialBalance.objects.filter(parent=parent)
+    paginator = KeysetPaginator(children, ordering=('account_number', 'id'), page_size=page_size or settings.TRIAL_BALANCE_PAGE_SIZE)
+    page = paginator.page(after=after)
+    if not page.object_list:
+        return [], page
+    # sumy tylko poddrzew kont z tej strony - ścieżki dzieci rosną razem z numerem, więc to jeden zakres path na indeksie
+    first, last = page.object_list[0], page.object_list[-1]
+    rollups = SimpleTrialBalance.objects.filter(path__gte=first.path, path__lt=last.path + PATH_END).rollup(parent)
+    nodes = []
+    for account in page:
+        totals = rollups[account.path] # grupa dziecka zawiera zawsze co najmniej samo dziecko
+        nodes.append({'account': account, 'totals': totals, 'has_children': totals['accounts'] > 1})
+    return nodes, page
+
+
+def render_tree_nodes(request, parent=None):
+    # fragment z jedną stroną węzłów i linkiem do następnej (doklejanej w miejscu linku przez trial_balance_tree.html)
+    def render():
+        nodes, page = tree_nodes(parent, after=request.GET.get('after'))
+        more_url = None
+        if page.has_next:
+            url = reverse('trial_balance_tree_children', args=[parent.pk]) if parent is not None else reverse('trial_balance_tree_roots')
+            more_url = f"{url}?{urlencode({'after': page.next_cursor})}"
+        return render_to_string('trial_balance_tree_nodes.html', {'nodes': nodes, 'more_url': more_url})
+    return cached_fragment(f"tree:{parent.pk if parent is not None else 'root'}", request.GET, render)
+
+
+@method_decorator(conditional_get, name='get')
+class TrialBalanceTreeView(ReadReplicaMixin, TemplateView):
+    '''
+    Plan kont jako drzewo - poziomy są rozwijane na żądanie (TrialBalanceTreeChildrenView), a nie ładowane od razu;
+    każdy poziom jest pobierany stronami (link "More accounts").
+    '''
+    template_name = 'trial_balance_tree.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tree'] = render_tree_nodes(self.request)
+        return context
+
+
+@method_decorator(conditional_get, name='get')
+class TrialBalanceTreeChildrenView(ReadReplicaMixin, View):
+    # pk None - kolejne strony kont najwyższego poziomu
+    def get(self, request, pk=None, *args, **kwargs):
+        parent = get_object_or_404(SimpleTrialBalance, pk=pk) if pk is not None else None
+        return HttpResponse(render_tree_nodes(request, parent))
+
+
+class Echo:
+    # csv.writer potrzebuje obiektu z metodą write - zamiast zapisywać do pliku zwracamy gotową linię
+    def write(self, value):
+        return value
+
+
+@method_decorator(conditional_get, name='get')
+class TrialBalanceExportView(ReadReplicaMixin, View):
+    export_fields = ['account_name', 'account_number', 'opening_balance', 'activity', 'closing_balance']
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(self.stream_rows(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="trial_balance.csv"'
+        return response
+
+    def get_queryset(self):
+        # te same filtry co na stronie trial balance
+        filters = TrialBalanceSearchForm(self.request.GET).filters()
+        return SimpleTrialBalance.objects.search(**filters).order_by('account_number', 'id')
+
+    def stream_rows(self):
+        # wiersze czytamy porcjami przez iterator() - w pamięci jest naraz tylko jeden chunk, a nie cała tabela
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        rows = self.get_queryset().values_list(*self.export_fields).iterator(
+            chunk_size=settings.TRIAL_BALANCE_EXPORT_CHUNK_SIZE
+        )
+        for row in rows:
+            yield writer.writerow(row)
+
+
+@method_decorator(conditional_get, name='get')
+class AsyncTrialBalanceExportView(TrialBalanceExportView):
+    '''
+    Eksport dla serwera ASGI - wiersze z aiterator(), wolny klient nie zajmuje wątku przez cały czas pobierania.
+    '''
+    async def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(self.astream_rows(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="trial_balance.csv"'
+        return response
+
+    async def astream_rows(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        # values(), nie values_list() - aiterator() na values_list() wykonuje zapytanie od razu, w pętli zdarzeń
+        rows = self.get_queryset().values(*self.export_fields).aiterator(
+            chunk_size=settings.TRIAL_BALANCE_EXPORT_CHUNK_SIZE
+        )
+        async for row in rows:
+            yield writer.writerow([row[field] for field in self.export_fields])
+
+
+class ComparisonView(ReadReplicaMixin, TemplateView):
+    '''
+    Porównanie dwóch zestawień (okres, migawka, bieżąca tabela) - różnica i zmiana procentowa dla każdego konta.
+    Strona pokazuje pierwsze wiersze w wybranym sortowaniu, pełny wynik jest w eksporcie CSV.
+    '''
+    template_name = 'comparison.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = ComparisonForm(self.request.GET or None, sources=comparison_sources())
+        context['form'] = form
+        if form.is_valid():
+            context['rows'] = list(iter_comparison(**form.comparison(), limit=settings.TRIAL_BALANCE_PAGE_SIZE))
+            context['export_url'] = reverse('comparison_export') + f'?{self.request.GET.urlencode()}'
+        return context
+
+
+class ComparisonExportView(ReadReplicaMixin, View):
+    export_fields = ['account_number', 'account_name', 'base_balance', 'compared_balance', 'variance', 'percent_change', 'status']
+
+    def get(self, request, *args, **kwargs):
+        form = ComparisonForm(request.GET, sources=comparison_sources())
+        if not form.is_valid():
+            return HttpResponse(form.errors.as_text(), status=400, content_type='text/plain')
+        response = StreamingHttpResponse(self.stream_rows(form.comparison()), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="trial_balance_comparison.csv"'
+        return response
+
+    def stream_rows(self, comparison):
+        # wiersze prosto z kursora, porcjami - tak jak eksport trial balance
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        for row in iter_comparison(**comparison, chunk_size=settings.TRIAL_BALANCE_EXPORT_CHUNK_SIZE):
+            yield writer.writerow(row)
@@ -47,6 +47,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'account.routing.ReplicaRoutingMiddleware',
+    'account.tenancy.EntityScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,12 +80,46 @@ WSGI_APPLICATION = 'balance_sheet.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# SQLite pod obciążeniem - PRAGMA wykonywane przy otwarciu każdego połączenia:
+# WAL - odczyty trial balance nie czekają na zapisy kont (i odwrotnie), synchronous=NORMAL wystarcza przy WAL,
+# busy_timeout - zapis czeka na zwolnienie blokady zamiast od razu zwracać "database is locked",
+# cache_size w KiB (wartość ujemna), mmap_size w bajtach
+# journal_mode=WAL jest zapisywany w nagłówku pliku bazy, a obok bazy powstają pliki -wal i -shm - db.sqlite3 nie jest
+# więc śledzony w gicie (.gitignore), bazę tworzy `python manage.py migrate`
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # transakcja od razu bierze blokadę zapisu - bez błędu "database is locked" przy podnoszeniu odczytu do zapisu;
+            # koszt: każde atomic() (także takie, które tylko czyta) czeka na blokadę zapisu i blokuje inne zapisy do końca
+            # transakcji, więc bloki atomic mają być krótkie, a same odczyty (raporty, eksport) wykonywane poza nimi
+            # (odczyty w autocommit nie biorą blokady, w WAL nie czekają też na trwające zapisy)
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600, # połączenie (razem z ustawionymi PRAGMA) jest używane ponownie przez kolejne requesty
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# replika do odczytu raportów - kopia db.sqlite3 odświeżana komendą refresh_replica (backup API SQLite);
+# w testach to ta sama baza co default
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['account.routing.ReadReplicaRouter']
+READ_REPLICA = 'replica' # None - wszystko z bazy głównej
+REPLICA_STICKY_SECONDS = 60 # tyle po zapisie sesja czyta z bazy głównej
 
 
 # Password validation
@@ -142,4 +178,53 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' # wyświetlenie
 # EMAIL_HOST_PASSWORD = '****'
 # DEFAULT_FROM_EMAIL = '****@gmail.com'
 
-LOGIN_URL = '/login/'
\ No newline at end of file
+LOGIN_URL = '/login/'
+
+# paginacja trial balance - domyślna i maksymalna liczba wierszy na stronie (?page_size=)
+TRIAL_BALANCE_PAGE_SIZE = 50
+TRIAL_BALANCE_MAX_PAGE_SIZE = 500
+
+# eksport CSV - liczba wierszy pobieranych z bazy w jednej porcji
+TRIAL_BALANCE_EXPORT_CHUNK_SIZE = 2000
+
+# import CSV - liczba kont zapisywanych w jednej porcji (jedna transakcja na porcję)
+ACCOUNT_IMPORT_BATCH_SIZE = 1000
+
+# zapamiętywanie nazw grup użytkownika w sesji (unieważniane przy zmianie członkostwa w grupach)
+# wymaga wspólnego cache dla wszystkich procesów, przy LocMemCache zostawić False
+GROUP_NAMES_SESSION_CACHE = False
+
+# usuwanie kont według kryteriów - liczba kont usuwanych w jednej transakcji
+ACCOUNT_DELETE_BATCH_SIZE = 500
+
+# cache - 'trial_balance' trzyma wyrenderowaną tabelę trial balance, unieważnianą przez wersję danych (account/caching.py)
+# w nim jest też wersja danych i data ostatniej zmiany (ETag / Last-Modified), więc musi być wspólny dla wszystkich procesów:
+# LocMemCache (osobny dla każdego procesu) wystarczy tylko przy jednym procesie (runserver, testy), przy kilku workerach
+# trzeba użyć cache wspólnego, np. plikowego (ostrzeżenie account.W001 w `manage.py check --deploy`):
+# 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache' / 'trial_balance'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'trial_balance': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trial_balance',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+TRIAL_BALANCE_CACHE = 'trial_balance'
+TRIAL_BALANCE_CACHE_TIMEOUT = 300 # sekundy
+
+# analityka (account/analytics.py) - konta aktywów, dla których ujemne saldo końcowe jest anomalią
+# (zespoły planu kont: 0 - aktywa trwałe, 1 - środki pieniężne, 3 - materiały i towary)
+ANALYTICS_ASSET_PREFIXES = ['0', '1', '3']
+
+# jednostki (account/tenancy.py) - użytkownik bez przypisanej jednostki (EntityMember) pracuje na jednostce o tej nazwie
+DEFAULT_ENTITY_NAME = 'Default'
+
+# aktualizacje trial balance na żywo (SSE, account/live.py) - hub powiadomień o zmianach kont;
+# InProcessHub działa w obrębie jednego procesu, przy kilku workerach można podać hub oparty na zewnętrznej usłudze
+LIVE_UPDATES_HUB = 'account.live.InProcessHub'
+LIVE_UPDATES_KEEPALIVE = 15 # sekundy - komentarz podtrzymujący połączenie i sprawdzenie dziennika zmian bez powiadomienia
+LIVE_UPDATES_MAX_SECONDS = 300 # potem strumień się kończy, a przeglądarka łączy się ponownie od ostatniego zdarzenia
+LIVE_UPDATES_BATCH_SIZE = 500 # maksymalna liczba zmian z dziennika w jednym zdarzeniu